@@ -0,0 +1,153 @@
+"""
+Server Battleship Game - Chế độ asyncio (một event loop cho mọi client)
+Dùng chung giao thức CONNECT/SETUP/SHOOT và logic ghép cặp với BattleshipServer
+"""
+import asyncio
+import time
+from server import BattleshipServer
+from framing import RECV_SIZE
+from serverlog import log, fields as log_fields
+
+class AsyncBattleshipServer(BattleshipServer):
+    """
+    Server chạy trên một event loop duy nhất thay vì một thread cho mỗi client.
+    Mỗi client là một coroutine; StreamWriter đóng vai trò "socket" trong
+    PlayerSession của client, các hàm xử lý kế thừa từ BattleshipServer.
+    """
+
+    def start(self):
+        """Khởi động server"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            log.info("Đang tắt server...")
+
+    async def serve(self):
+        """Mở cổng lắng nghe và phục vụ cho đến khi bị dừng"""
+        self.start_journal()
+        self.start_players()
+        self.server_socket = await asyncio.start_server(
+            self.handle_client_async, self.host, self.port,
+            reuse_address=True
+        )
+
+        log.info("Server (asyncio) đang chạy tại %s:%s", self.host, self.port)
+        log.info("Đang chờ kết nối từ các client...")
+
+        # Bộ dọn phòng và bộ ghép cặp chạy như các task trên cùng event loop
+        tasks = [asyncio.ensure_future(self.reap_rooms()),
+                 asyncio.ensure_future(self.tick_timers())]
+        if self.matchmaker is not None:
+            tasks.append(asyncio.ensure_future(self.tick_matchmaker()))
+
+        # /metrics chạy trên thread riêng, không chiếm event loop
+        self.start_metrics()
+
+        try:
+            async with self.server_socket:
+                await self.server_socket.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.stop_metrics()
+            self.stop_journal()
+            self.stop_players()
+            self.close_replays()
+
+    async def reap_rooms(self):
+        """Định kỳ dọn các phòng đã kết thúc"""
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            reaped = self.rooms.reap()
+            if reaped:
+                log.info("Đã dọn %d phòng, còn %d phòng", reaped, len(self.rooms))
+
+    async def tick_timers(self):
+        """Quay bánh xe hẹn giờ mỗi tick; callback chạy ngay trên event loop"""
+        while True:
+            await asyncio.sleep(self.timers.tick)
+            self.timers.advance()
+
+    async def tick_matchmaker(self):
+        """Định kỳ ghép cặp theo lô"""
+        while True:
+            await asyncio.sleep(self.match_tick)
+            try:
+                self.matchmaker.tick()
+            except Exception as e:
+                log.exception("Lỗi khi ghép cặp: %s", e)
+
+    async def handle_client_async(self, reader, writer):
+        """Xử lý một client (chạy như một coroutine trên event loop)"""
+        accepted_at = time.perf_counter()
+        address = writer.get_extra_info('peername')
+        log.info("Kết nối mới từ %s", address)
+
+        session = self.new_session(writer, address)
+        session.outbound.wakeup = asyncio.Event()
+        sender = asyncio.ensure_future(self.write_outbound(session))
+        self.metrics.accept_seconds.observe(time.perf_counter() - accepted_at)
+        try:
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    break
+                session.activity += 1
+
+                for frame in session.reader.feed(data):
+                    # Các hàm xử lý không bao giờ chặn: gửi tin nhắn chỉ đưa
+                    # dữ liệu vào hàng đợi gửi, write_outbound ghi xuống transport
+                    self.process_message(session, frame)
+
+        except Exception as e:
+            log.warning("Lỗi với client %s: %s", address, e)
+        finally:
+            sender.cancel()
+            self.disconnect_client(session)
+            log.info("Client %s đã ngắt kết nối", address)
+
+    async def write_outbound(self, session):
+        """
+        Coroutine ghi của một client: chuyển hàng đợi gửi xuống transport và chờ
+        drain(); trong lúc chờ, tin nhắn mới dồn vào hàng đợi (có giới hạn)
+        """
+        writer = session.socket
+        queue = session.outbound
+        while True:
+            await queue.wakeup.wait()
+            queue.wakeup.clear()
+            with queue.lock:
+                data = queue.take()
+            if data and not writer.is_closing():
+                writer.write(data)
+                await writer.drain()
+
+    def send_data(self, session, data, key=None):
+        """Đưa dữ liệu vào hàng đợi gửi của client (session.socket là StreamWriter)"""
+        if session.socket.is_closing():
+            return
+        queue = session.outbound
+        with queue.lock:
+            accepted = queue.push(data, key)
+        if not accepted:
+            self.drop_slow_client(session)
+            return
+        queue.wakeup.set()
+
+    def drop_slow_client(self, session):
+        """Hàng đợi gửi vượt giới hạn: hủy transport, coroutine đọc sẽ nhận EOF"""
+        queue = session.outbound
+        self.metrics.slow_clients.inc()
+        log.warning("Client %s đọc quá chậm (%d byte chờ gửi), ngắt kết nối",
+                    session.address, queue.pending_bytes, extra=log_fields(session))
+        self.abort_connection(session)
+
+    def abort_connection(self, session):
+        """Hủy transport, coroutine đọc của client sẽ nhận EOF"""
+        session.socket.transport.abort()
+
+    def close_socket(self, session):
+        """Bỏ dữ liệu chờ gửi và đóng StreamWriter của client"""
+        with session.outbound.lock:
+            session.outbound.clear()
+        session.socket.close()
@@ -0,0 +1,4 @@
+"""
+Benchmarks - Đo hiệu năng server
+Chạy từ thư mục gốc của dự án, vd: python -m benchmarks.loadtest
+"""
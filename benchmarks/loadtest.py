@@ -0,0 +1,292 @@
+"""
+Load Test - Tạo tải cho server bằng các bot không giao diện
+
+Mỗi bot nói đúng giao thức CONNECT / SETUP / SHOOT: xếp tàu ngẫu nhiên, bắn
+ngẫu nhiên vào ô chưa bắn cho đến GAME_OVER rồi kết nối lại chơi ván mới.
+Kết quả: số game / giây, số phát bắn / giây, p50 / p99 độ trễ một phát bắn
+(SHOOT -> RESULT), RSS và số thread lớn nhất của tiến trình server (cộng cả
+các process con, vd: worker khi chạy --workers).
+
+Ví dụ (tự khởi động server chế độ async trên cổng 9500):
+    python -m benchmarks.loadtest --spawn --mode async --games 200 --concurrency 50
+So sánh với một server đang chạy sẵn:
+    python -m benchmarks.loadtest --port 8080 --server-pid 1234 --games 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from bitboard import BOARD_SIZE, ship_mask
+from fleet import FLEET_SIZES
+from framing import HEADER, HEADER_SIZE, encode_frame
+from matchmaking import percentile
+from protocol import get_codec, encode_connect
+
+# Chu kỳ lấy mẫu RSS / số thread của server (giây)
+SAMPLE_INTERVAL = 0.2
+
+
+def random_fleet(rng):
+    """
+    Xếp ngẫu nhiên đội tàu theo FLEET_SIZES (thẳng, trong bảng, không chồng nhau)
+    Trả về: list ô của từng tàu, đúng dạng gói SETUP
+    """
+    while True:
+        board = 0
+        ships = []
+        for size in FLEET_SIZES:
+            for _ in range(100):
+                horizontal = rng.random() < 0.5
+                x = rng.randrange(BOARD_SIZE - size + 1 if horizontal else BOARD_SIZE)
+                y = rng.randrange(BOARD_SIZE if horizontal else BOARD_SIZE - size + 1)
+                mask = ship_mask(x, y, size, horizontal)
+                if mask and not mask & board:
+                    board |= mask
+                    ships.append([(x + i, y) if horizontal else (x, y + i) for i in range(size)])
+                    break
+            else:
+                break
+        else:
+            return ships
+
+
+class Stats:
+    """Số liệu gom từ mọi bot"""
+
+    def __init__(self, games):
+        # Số lượt "vào một ván" còn lại; mỗi ván tốn 2 lượt nên tổng luôn chẵn
+        # và không bot nào bị bỏ lại chờ đối thủ ở cuối bài đo
+        self.remaining = 2 * games
+        self.games = 0
+        self.shots = 0
+        self.errors = 0
+        self.rtts = []          # độ trễ từng phát bắn (giây)
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(HEADER_SIZE)
+    (length,) = HEADER.unpack(header)
+    return await reader.readexactly(length)
+
+
+async def play_game(host, port, name, codec_name, rng, stats):
+    """Một bot chơi trọn một ván; trả về khi nhận GAME_OVER"""
+    codec = get_codec(codec_name)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(encode_frame(encode_connect(name, codec_name)))
+
+        targets = [(x, y) for y in range(BOARD_SIZE) for x in range(BOARD_SIZE)]
+        rng.shuffle(targets)
+        shot_at = None
+        seq = 0
+
+        def shoot():
+            nonlocal shot_at, seq
+            shot_at = time.perf_counter()
+            seq += 1
+            writer.write(encode_frame(codec.encode(("SHOOT", targets.pop(), seq))))
+
+        while True:
+            command, fields = codec.decode(await read_frame(reader))
+            if command == "MATCH_FOUND":
+                writer.write(encode_frame(codec.encode(("SETUP", random_fleet(rng)))))
+            elif command == "RESULT":
+                stats.rtts.append(time.perf_counter() - shot_at)
+                stats.shots += 1
+            elif command in ("GAME_START", "TURN") and fields[0] == "YOUR_TURN":
+                shoot()
+            elif command == "PING":
+                writer.write(encode_frame(codec.encode(("PONG",))))
+            elif command == "GAME_OVER":
+                if fields[0] == "WIN":
+                    stats.games += 1
+                return
+            elif command in ("OPPONENT_DISCONNECTED", "ERROR"):
+                stats.errors += 1
+                return
+    finally:
+        writer.close()
+
+
+async def bot(host, port, index, codec_name, seed, stats):
+    """Một bot chơi liên tiếp các ván cho đến khi hết lượt"""
+    rng = random.Random(seed * 100003 + index)
+    while stats.remaining > 0:
+        stats.remaining -= 1
+        try:
+            await play_game(host, port, f"bot{index}", codec_name, rng, stats)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            stats.errors += 1
+            print(f"[BENCH] bot{index}: {e}")
+            return
+
+
+def read_process_stats(pid):
+    """(RSS byte, số thread) của tiến trình qua /proc (chỉ Linux); None nếu không đọc được"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            status = dict(line.split(':', 1) for line in f if ':' in line)
+        rss = int(status['VmRSS'].split()[0]) * 1024
+        threads = int(status['Threads'])
+        return rss, threads
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def process_tree(pid):
+    """pid và mọi process con / cháu của nó (đọc ppid trong /proc/*/stat, chỉ Linux)"""
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # Tên process nằm trong ngoặc và có thể chứa khoảng trắng
+                ppid = int(f.read().rpartition(')')[2].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    tree = [pid]
+    for current in tree:
+        tree.extend(children.get(current, ()))
+    return tree
+
+
+def read_tree_stats(pid):
+    """(RSS byte, số thread) cộng trên cả cây process của server; None nếu không đọc được"""
+    try:
+        pids = process_tree(pid)
+    except OSError:
+        return read_process_stats(pid)
+    samples = [sample for sample in map(read_process_stats, pids) if sample is not None]
+    if not samples:
+        return None
+    return sum(rss for rss, _ in samples), sum(threads for _, threads in samples)
+
+
+async def sample_server(pid, peaks, stop):
+    """Ghi lại RSS và số thread lớn nhất của server (gồm cả process con) trong lúc chạy"""
+    while not stop.is_set():
+        sample = read_tree_stats(pid)
+        if sample is not None:
+            peaks['rss'] = max(peaks.get('rss', 0), sample[0])
+            peaks['threads'] = max(peaks.get('threads', 0), sample[1])
+        try:
+            await asyncio.wait_for(stop.wait(), SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args, server_pid):
+    stats = Stats(args.games)
+    peaks = {}
+    stop = asyncio.Event()
+    sampler = None
+    if server_pid:
+        sampler = asyncio.ensure_future(sample_server(server_pid, peaks, stop))
+
+    # concurrency ván chạy song song = 2 * concurrency bot
+    bots = 2 * args.concurrency
+    codecs = ['text', 'binary'] if args.protocol == 'mixed' else [args.protocol]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        bot(args.host, args.port, i, codecs[i % len(codecs)], args.seed, stats)
+        for i in range(bots)
+    ))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    if sampler is not None:
+        await sampler
+
+    rtts = sorted(stats.rtts)
+    return {
+        'mode': args.mode if args.spawn else None,
+        'protocol': args.protocol,
+        'concurrency': args.concurrency,
+        'games': stats.games,
+        'shots': stats.shots,
+        'errors': stats.errors,
+        'seconds': round(elapsed, 3),
+        'games_per_sec': round(stats.games / elapsed, 2),
+        'shots_per_sec': round(stats.shots / elapsed, 1),
+        'shot_rtt_p50_ms': round(percentile(rtts, 50) * 1000, 3),
+        'shot_rtt_p99_ms': round(percentile(rtts, 99) * 1000, 3),
+        'server_rss_mb': round(peaks['rss'] / 2**20, 1) if 'rss' in peaks else None,
+        'server_threads': peaks.get('threads'),
+    }
+
+
+def spawn_server(args):
+    """Khởi động server.py trên cổng của bài đo, log tắt bớt để không ảnh hưởng số đo"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [
+        sys.executable, os.path.join(root, 'server.py'),
+        '--host', args.host, '--port', str(args.port), '--mode', args.mode,
+        '--log-level', 'WARNING',
+    ] + args.server_args
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+
+    # Chờ server mở cổng
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((args.host, args.port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit("[BENCH] Server không khởi động được")
+
+
+def print_report(result):
+    print("[BENCH] Kết quả:")
+    for key, value in result.items():
+        print(f"  {key:<16} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Battleship load test")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9500)
+    parser.add_argument('--games', type=int, default=100, help="tổng số ván")
+    parser.add_argument('--concurrency', type=int, default=20, help="số ván chạy song song")
+    parser.add_argument('--protocol', choices=['text', 'binary', 'mixed'], default='binary')
+    parser.add_argument('--seed', type=int, default=1, help="seed ngẫu nhiên (chạy lại cho cùng kết quả)")
+    parser.add_argument('--spawn', action='store_true', help="tự khởi động server.py cho bài đo")
+    parser.add_argument('--mode', choices=['thread', 'async'], default='thread',
+                        help="chế độ server khi dùng --spawn")
+    parser.add_argument('--server-pid', type=int, default=0,
+                        help="PID server đang chạy sẵn (để đo RSS / số thread)")
+    parser.add_argument('--json', metavar='FILE', help="ghi kết quả ra file JSON")
+    parser.add_argument('server_args', nargs=argparse.REMAINDER,
+                        help="tham số thêm cho server.py (sau --)")
+    args = parser.parse_args()
+    if args.server_args[:1] == ['--']:
+        args.server_args = args.server_args[1:]
+
+    process = spawn_server(args) if args.spawn else None
+    try:
+        result = asyncio.run(run(args, process.pid if process else args.server_pid))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Micro Benchmark - Đo riêng các hàm nóng của server
+
+- process_shoot:  GameRoom.process_shoot, phát lại các ván tổng hợp
+- set_player_map: GameRoom.set_player_map với các đội tàu ngẫu nhiên
+- parse_shoot_*:  giải mã gói SHOOT (text / binary) như process_message
+- parse_setup_*:  giải mã gói SETUP (text = JSON từng tàu, binary = 2 byte mỗi tàu)
+- fleet_from_ships: kiểm tra đội tàu SETUP bằng bảng vị trí tàu tính sẵn
+
+Mỗi bài đo báo ns/op và peak_bytes/op (bộ nhớ cấp phát tạm thời lớn nhất trong
+một op, đo bằng tracemalloc ở một lượt chạy riêng để không làm sai ns/op).
+Kết quả lưu làm baseline và so sánh lại sau khi đổi cách biểu diễn bảng hoặc
+cách parse gói tin:
+    python -m benchmarks.micro --save
+    python -m benchmarks.micro --compare
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from fleet import fleet_from_ships
+from game_room import GameRoom
+from protocol import TEXT_CODEC, BINARY_CODEC
+from benchmarks.loadtest import random_fleet
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'micro.json')
+
+# Số ván tổng hợp dùng để phát lại
+SYNTHETIC_GAMES = 500
+# Số ván dùng khi đo bộ nhớ
+ALLOC_GAMES = 50
+
+
+def synthetic_games(count, seed):
+    """
+    Tạo các ván tổng hợp: (bản đồ player 1, bản đồ player 2, kịch bản bắn)
+    Kịch bản là list (player_num, x, y) theo đúng luật đổi lượt của GameRoom
+    """
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        fleets = (random_fleet(rng), random_fleet(rng))
+        room = GameRoom(0, None, "p1", None, "p2")
+        room.set_player_map(1, fleet_from_ships(fleets[0]))
+        room.set_player_map(2, fleet_from_ships(fleets[1]))
+        room.start_game()
+
+        targets = {1: [(x, y) for y in range(10) for x in range(10)],
+                   2: [(x, y) for y in range(10) for x in range(10)]}
+        rng.shuffle(targets[1])
+        rng.shuffle(targets[2])
+
+        script = []
+        while not room.game_over:
+            player = room.current_turn
+            x, y = targets[player].pop()
+            script.append((player, x, y))
+            room.process_shoot(player, x, y)
+        games.append((fleets[0], fleets[1], script))
+    return games
+
+
+def new_room(game):
+    room = GameRoom(0, None, "p1", None, "p2")
+    room.set_player_map(1, fleet_from_ships(game[0]))
+    room.set_player_map(2, fleet_from_ships(game[1]))
+    room.start_game()
+    return room
+
+
+# ==================== Các bài đo ====================
+# Mỗi bài đo gồm prepare(games) -> state (không tính giờ: tạo phòng, mã hóa
+# gói tin) và run(state) -> số op (phần được đo)
+
+def prepare_process_shoot(games):
+    return [(new_room(game), game[2]) for game in games]
+
+
+def run_process_shoot(rooms):
+    done = 0
+    for room, script in rooms:
+        process_shoot = room.process_shoot
+        for player, x, y in script:
+            process_shoot(player, x, y)
+        done += len(script)
+    return done
+
+
+def prepare_set_player_map(games):
+    # Đội tàu đã được kiểm tra sẵn như trong handle_setup (fleet_from_ships đo riêng)
+    fleets = [fleet_from_ships(game[0]) for game in games]
+    return GameRoom(0, None, "p1", None, "p2"), fleets
+
+
+def run_set_player_map(state):
+    room, fleets = state
+    set_player_map = room.set_player_map
+    for ships in fleets:
+        set_player_map(1, ships)
+    return len(fleets)
+
+
+def prepare_fleet_from_ships(games):
+    return [game[0] for game in games]
+
+
+def run_fleet_from_ships(fleets):
+    for ships in fleets:
+        fleet_from_ships(ships)
+    return len(fleets)
+
+
+def decode_benchmark(codec, command):
+    """Bài đo giải mã gói SHOOT / SETUP bằng codec như process_message"""
+    def prepare(games):
+        if command == "SHOOT":
+            messages = [("SHOOT", (x, y)) for game in games for _, x, y in game[2][:20]]
+        else:
+            messages = [("SETUP", game[0]) for game in games]
+        return codec.decode, [codec.encode(message) for message in messages]
+
+    def run(state):
+        decode, payloads = state
+        for payload in payloads:
+            decode(payload)
+        return len(payloads)
+
+    return prepare, run
+
+
+# {tên: (prepare, run, số op mặc định)}
+BENCHMARKS = {
+    'process_shoot': (prepare_process_shoot, run_process_shoot, 1_000_000),
+    'set_player_map': (prepare_set_player_map, run_set_player_map, 200_000),
+    'fleet_from_ships': (prepare_fleet_from_ships, run_fleet_from_ships, 200_000),
+    'parse_shoot_text': decode_benchmark(TEXT_CODEC, "SHOOT") + (500_000,),
+    'parse_shoot_binary': decode_benchmark(BINARY_CODEC, "SHOOT") + (500_000,),
+    'parse_setup_text': decode_benchmark(TEXT_CODEC, "SETUP") + (100_000,),
+    'parse_setup_binary': decode_benchmark(BINARY_CODEC, "SETUP") + (100_000,),
+}
+
+
+def measure_time(prepare, run, games, ops):
+    """Chạy lặp lại trên các ván tổng hợp cho đến khi đủ ops; trả về ns/op"""
+    done = elapsed = 0
+    while done < ops:
+        state = prepare(games)
+        started = time.perf_counter_ns()
+        done += run(state)
+        elapsed += time.perf_counter_ns() - started
+    return done, elapsed / done
+
+
+def measure_alloc(prepare, run, games):
+    """
+    Bộ nhớ cấp phát tạm thời lớn nhất khi chạy op (byte)
+    Các op không giữ lại bộ nhớ nên đỉnh của cả vòng lặp bằng đỉnh của một op
+    """
+    tracemalloc.start()
+    try:
+        peaks = []
+        for game in games:
+            state = prepare([game])
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            run(state)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        return sum(peaks) / len(peaks)
+    finally:
+        tracemalloc.stop()
+
+
+def run(names, scale, seed):
+    games = synthetic_games(SYNTHETIC_GAMES, seed)
+    results = {}
+    for name in names:
+        prepare, run_op, ops = BENCHMARKS[name]
+        run_op(prepare(games[:10]))   # khởi động
+        done, ns_per_op = measure_time(prepare, run_op, games, int(ops * scale))
+        results[name] = {
+            'ops': done,
+            'ns_per_op': round(ns_per_op, 1),
+            'peak_bytes_per_op': round(measure_alloc(prepare, run_op, games[:ALLOC_GAMES]), 1),
+        }
+        print(f"  {name:<20} {results[name]['ns_per_op']:>10.1f} ns/op"
+              f" {results[name]['peak_bytes_per_op']:>10.1f} peak_bytes/op")
+    return results
+
+
+def compare(results, baseline):
+    print("[BENCH] So với baseline:")
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        change = (result['ns_per_op'] / base['ns_per_op'] - 1) * 100
+        print(f"  {name:<20} {base['ns_per_op']:>10.1f} -> {result['ns_per_op']:>10.1f} ns/op"
+              f" ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Battleship micro benchmarks")
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help="chỉ chạy các bài đo này (mặc định: tất cả): " + ", ".join(BENCHMARKS))
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="nhân số op của mỗi bài đo (vd: 0.1 để chạy nhanh)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="file baseline JSON")
+    parser.add_argument('--save', action='store_true', help="lưu kết quả làm baseline")
+    parser.add_argument('--compare', action='store_true', help="so sánh với baseline đã lưu")
+    args = parser.parse_args()
+
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"bài đo không tồn tại: {', '.join(unknown)}")
+    print(f"[BENCH] Python {sys.version.split()[0]}, {SYNTHETIC_GAMES} ván tổng hợp (seed {args.seed})")
+    results = run(names, args.scale, args.seed)
+
+    if args.compare:
+        try:
+            with open(args.baseline) as f:
+                compare(results, json.load(f))
+        except FileNotFoundError:
+            print(f"[BENCH] Chưa có baseline: {args.baseline}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'seed': args.seed, 'results': results},
+                      f, indent=2)
+        print(f"[BENCH] Đã lưu baseline: {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
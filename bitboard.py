@@ -0,0 +1,67 @@
+"""
+Bitboard - Biểu diễn bảng 10x10 bằng một số nguyên 100 bit
+Ô (x, y) ứng với bit thứ y*10 + x
+
+Mọi phép kiểm tra trên bảng trở thành phép toán bit:
+- Bắn trúng:       board & CELL_BITS[y*10 + x]
+- Ô đã bắn:        fired & CELL_BITS[y*10 + x]
+Tàu chìm / hết tàu không so bitboard: GameRoom giữ bộ đếm ô còn lại của từng
+tàu và của cả đội, mỗi phát trúng chỉ giảm bộ đếm.
+"""
+
+BOARD_SIZE = 10
+BOARD_CELLS = BOARD_SIZE * BOARD_SIZE
+
+# Bảng tra sẵn bit của từng ô để không phải tính lại mỗi lần bắn
+CELL_BITS = tuple(1 << i for i in range(BOARD_CELLS))
+
+
+def cell_index(x, y):
+    """Chỉ số bit của ô (x, y)"""
+    return y * BOARD_SIZE + x
+
+
+def in_bounds(x, y):
+    return 0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE
+
+
+def cells_to_bitboard(cells):
+    """List các (x, y) -> bitboard"""
+    board = 0
+    for x, y in cells:
+        board |= CELL_BITS[y * BOARD_SIZE + x]
+    return board
+
+
+def bitboard_to_cells(board):
+    """Bitboard -> list các (x, y), theo thứ tự chỉ số bit tăng dần"""
+    cells = []
+    while board:
+        low = board & -board
+        y, x = divmod(low.bit_length() - 1, BOARD_SIZE)
+        cells.append((x, y))
+        board ^= low
+    return cells
+
+
+def popcount(board):
+    """Số ô được đánh dấu trên bảng"""
+    return bin(board).count('1')
+
+
+def ship_mask(x, y, size, horizontal):
+    """
+    Mask của một con tàu bắt đầu tại (x, y)
+    Trả về 0 nếu tàu vượt khỏi bảng
+    """
+    if horizontal:
+        if not (in_bounds(x, y) and x + size <= BOARD_SIZE):
+            return 0
+        return ((1 << size) - 1) << cell_index(x, y)
+
+    if not (in_bounds(x, y) and y + size <= BOARD_SIZE):
+        return 0
+    mask = 0
+    for i in range(size):
+        mask |= CELL_BITS[cell_index(x, y + i)]
+    return mask
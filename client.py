@@ -3,15 +3,32 @@ Client Battleship Game - Giao diện người chơi
 """
 import socket
 import threading
-import json
 import os
 import sys
+import time
+from bitboard import bitboard_to_cells
+from framing import FrameReader, encode_frame
+from protocol import (
+    ProtocolError, encode_connect, encode_leaderboard, encode_replay, encode_resume, encode_spectate, get_codec,
+    parse_number,
+)
+from replay import ReplayError, decode_record
+
+# Số lần thử kết nối lại (RESUME) khi mất kết nối giữa ván và khoảng chờ (giây)
+RECONNECT_ATTEMPTS = 5
+RECONNECT_DELAY = 1.0
+# Chu kỳ gửi PING (giây): thread nhận bị chặn ở input() khi đặt tàu / chọn ô bắn,
+# PING định kỳ giữ cho server biết client vẫn sống
+HEARTBEAT_INTERVAL = 10.0
 
 class BattleshipClient:
-    def __init__(self, host='127.0.0.1', port=8080):
+    def __init__(self, host='127.0.0.1', port=8080, protocol='binary'):
         self.host = host
         self.port = port
         self.socket = None
+        
+        # Codec thỏa thuận với server lúc CONNECT (text hoặc binary)
+        self.codec = get_codec(protocol)
         self.username = ""
         self.opponent_name = ""
         
@@ -25,9 +42,17 @@ class BattleshipClient:
         self.is_my_turn = False
         self.game_started = False
         self.game_over = False
+        # Số thứ tự phát bắn gửi kèm SHOOT (server bỏ qua phát bắn gửi lại trùng số)
+        self.shot_seq = 0
+        # Token phiên server cấp sau CONNECT: dùng để RESUME khi rớt mạng
+        self.session_token = None
+        # Tên player 1 / 2 của phòng đang xem (chế độ xem)
+        self.watch_names = ["", ""]
         
         # Lock cho việc in ra màn hình
         self.print_lock = threading.Lock()
+        # Lock gửi: thread heartbeat và thread nhận cùng ghi vào socket
+        self.send_lock = threading.Lock()
     
     def display_opponent_board(self):
         """Hiển thị bảng bắn đối thủ"""
@@ -37,7 +62,7 @@ class BattleshipClient:
         for i, row in enumerate(self.opponent_board):
             print(f"{i} | " + " ".join(row) + " |")
         print("  +" + "-" * 21 + "+")
-        print("\nKí hiệu: X=Trúng, O=Trượt, ' '=Chưa bắn")
+        print("\nKí hiệu: X=Trúng, #=Tàu đã chìm, O=Trượt, ' '=Chưa bắn")
 
     def display_boards(self):
         """Hiển thị cả 2 bảng"""
@@ -56,7 +81,7 @@ class BattleshipClient:
             print(f"{i} | {my_row} |    {i} | {opp_row} |")
         
         print("  +" + "-" * 21 + "+      +" + "-" * 21 + "+")
-        print("\nKí hiệu: ■=Tàu của bạn, X=Trúng, O=Trượt")
+        print("\nKí hiệu: ■=Tàu của bạn, X=Trúng, #=Tàu đã chìm, O=Trượt")
 
     def connect(self):
         """Kết nối đến server"""
@@ -78,14 +103,18 @@ class BattleshipClient:
         if not self.connect():
             return
         
-        # Gửi CONNECT
-        self.send_message(f"CONNECT|{self.username}")
+        # Gửi CONNECT (luôn ở dạng text, kèm codec muốn dùng)
+        self.socket.sendall(encode_frame(encode_connect(self.username, self.codec.name)))
         
         # Tạo thread nhận tin nhắn
         receive_thread = threading.Thread(target=self.receive_messages)
         receive_thread.daemon = True
         receive_thread.start()
         
+        heartbeat_thread = threading.Thread(target=self.send_heartbeats)
+        heartbeat_thread.daemon = True
+        heartbeat_thread.start()
+        
         # Chờ ghép cặp
         print("\n[CLIENT] Đang chờ đối thủ...")
         
@@ -98,29 +127,118 @@ class BattleshipClient:
         finally:
             self.socket.close()
     
+    def spectate(self, room_id):
+        """Xem một phòng đang chơi (không tham gia): in 2 bảng sau mỗi phát bắn"""
+        if not self.connect():
+            return
+        
+        # Gửi SPECTATE (luôn ở dạng text, kèm codec muốn dùng)
+        self.socket.sendall(encode_frame(encode_spectate(room_id, self.codec.name)))
+        try:
+            self.receive_messages()
+        except KeyboardInterrupt:
+            print("\n[CLIENT] Ngắt kết nối...")
+        finally:
+            self.socket.close()
+    
     def receive_messages(self):
         """Nhận tin nhắn từ server (chạy trên thread riêng)"""
-        try:
-            while True:
-                data = self.socket.recv(4096).decode('utf-8')
-                if not data:
-                    break
-                
-                self.process_message(data)
-        
-        except Exception as e:
-            print(f"\n[CLIENT] Lỗi khi nhận tin nhắn: {e}")
+        while True:
+            reader = FrameReader()
+            try:
+                while True:
+                    frames = reader.read_from(self.socket)
+                    if frames is None:
+                        break
+                    
+                    for frame in frames:
+                        self.process_message(frame)
+            
+            except Exception as e:
+                print(f"\n[CLIENT] Lỗi khi nhận tin nhắn: {e}")
+            
+            # Mất kết nối giữa ván: kết nối lại và nhận lại trạng thái phòng
+            if self.game_over or not self.reconnect():
+                self.game_over = True
+                return
+    
+    def send_heartbeats(self):
+        """Gửi PING định kỳ (chạy trên thread riêng)"""
+        while not self.game_over:
+            time.sleep(HEARTBEAT_INTERVAL)
+            self.send_message("PING")
     
-    def process_message(self, message):
+    def reconnect(self):
+        """Kết nối lại và gửi RESUME với token phiên; trả về True nếu đã kết nối"""
+        if self.session_token is None:
+            return False
+        for _ in range(RECONNECT_ATTEMPTS):
+            with self.print_lock:
+                print("\n[CLIENT] Mất kết nối, đang kết nối lại...")
+            time.sleep(RECONNECT_DELAY)
+            try:
+                self.socket.close()
+                self.socket = socket.create_connection((self.host, self.port))
+                self.socket.sendall(encode_frame(encode_resume(self.session_token, self.codec.name)))
+                return True
+            except OSError:
+                continue
+        return False
+    
+    def process_message(self, payload):
         """Xử lý tin nhắn từ server"""
-        parts = message.split('|', 1)
-        command = parts[0]
-        data = parts[1] if len(parts) > 1 else ""
+        try:
+            command, fields = self.codec.decode(payload)
+        except ProtocolError as e:
+            with self.print_lock:
+                print(f"\n[CLIENT] Gói tin không hợp lệ: {e}")
+            return
+        
+        data = fields[0] if fields else ""
+        
+        if command == "SESSION":
+            self.session_token = data
+        
+        elif command == "PING":
+            self.send_message("PONG")
         
-        if command == "WAITING":
+        elif command == "PONG":
+            pass
+        
+        elif command == "WAITING":
             with self.print_lock:
                 print(f"\n{data}")
         
+        elif command == "RESUMED":
+            self.handle_resumed(*fields)
+        
+        elif command == "WATCHING":
+            self.watch_names[int(fields[0]) - 1] = fields[1]
+        
+        elif command == "WATCH":
+            self.handle_watch(*fields)
+        
+        elif command == "REPLAY_DATA":
+            self.handle_replay_data(data)
+        
+        elif command == "REPLAY_END":
+            with self.print_lock:
+                print(f"\n[CLIENT] Đã nhận {data} ván")
+            self.game_over = True
+            self.socket.close()
+        
+        elif command == "RANK":
+            rank, rating, wins, losses, name = fields
+            with self.print_lock:
+                print(f"{rank:>3}. {name:<20} {rating:>5}   {wins} thắng / {losses} thua")
+        
+        elif command == "LEADERBOARD_END":
+            with self.print_lock:
+                if data == "0":
+                    print("\n[CLIENT] Chưa có ván nào được xếp hạng")
+            self.game_over = True
+            self.socket.close()
+        
         elif command == "MATCH_FOUND":
             self.handle_match_found(data)
         
@@ -128,10 +246,16 @@ class BattleshipClient:
             self.handle_game_start(data)
         
         elif command == "RESULT":
-            self.handle_result(data)
+            self.handle_result(*fields)
         
         elif command == "OPPONENT_SHOOT":
-            self.handle_opponent_shoot(data)
+            self.handle_opponent_shoot(*fields)
+        
+        elif command == "SUNK":
+            self.handle_sunk(*fields)
+        
+        elif command == "OPPONENT_SUNK":
+            self.handle_opponent_sunk(*fields)
         
         elif command == "TURN":
             self.handle_turn(data)
@@ -148,6 +272,138 @@ class BattleshipClient:
             with self.print_lock:
                 print(f"\n[LỖI] {data}")
     
+    def handle_resumed(self, phase, ships, incoming, hits, misses, sunk, opponent_name):
+        """Kết nối lại thành công: dựng lại 2 bảng từ trạng thái server gửi"""
+        self.opponent_name = opponent_name
+        self.my_board = [[' ' for _ in range(10)] for _ in range(10)]
+        self.opponent_board = [[' ' for _ in range(10)] for _ in range(10)]
+        for x, y in bitboard_to_cells(ships):
+            self.my_board[y][x] = '■'
+        for x, y in bitboard_to_cells(incoming):
+            self.my_board[y][x] = 'X' if self.my_board[y][x] == '■' else 'O'
+        for board, mark in ((hits, 'X'), (misses, 'O'), (sunk, '#')):
+            for x, y in bitboard_to_cells(board):
+                self.opponent_board[y][x] = mark
+        
+        with self.print_lock:
+            print("\n[CLIENT] Đã kết nối lại, tiếp tục ván đấu!")
+        
+        if phase == "SETUP":
+            self.setup_ships()
+        elif phase == "READY":
+            with self.print_lock:
+                print("\nĐợi đối thủ xếp tàu...")
+        else:
+            self.game_started = True
+            if phase == "YOUR_TURN":
+                self.handle_turn(phase)
+            else:
+                self.is_my_turn = False
+                with self.print_lock:
+                    self.display_boards()
+                    print("\nĐợi đối thủ đánh...")
+    
+    def handle_watch(self, phase, *boards):
+        """Chế độ xem: dựng lại và in bảng của 2 người chơi"""
+        self.my_board = [[' ' for _ in range(10)] for _ in range(10)]
+        self.opponent_board = [[' ' for _ in range(10)] for _ in range(10)]
+        for board, (hits, misses, sunk) in zip((self.my_board, self.opponent_board),
+                                               (boards[:3], boards[3:])):
+            for mask, mark in ((misses, 'O'), (hits, 'X'), (sunk, '#')):
+                for x, y in bitboard_to_cells(mask):
+                    board[y][x] = mark
+        
+        name1, name2 = self.watch_names
+        if phase == "SETUP":
+            status = "Đang xếp tàu..."
+        elif phase.startswith("TURN"):
+            status = f"Lượt của {self.watch_names[int(phase[-1]) - 1]}"
+        elif phase.startswith("WIN"):
+            status = f"GAME OVER! {self.watch_names[int(phase[-1]) - 1]} thắng"
+        else:
+            status = "GAME OVER! Có người chơi đã ngắt kết nối"
+        
+        with self.print_lock:
+            self.display_match(status)
+        
+        if phase.startswith("WIN") or phase == "ENDED":
+            self.game_over = True
+            self.socket.close()
+    
+    def display_match(self, status):
+        """In bảng của 2 người chơi (chế độ xem / xem lại)"""
+        name1, name2 = self.watch_names
+        print("\n" + "="*60)
+        print(f"  {name1}  vs  {name2}   |   {status}")
+        print("="*60)
+        print(f"\n   BẢNG CỦA {name1:<22}BẢNG CỦA {name2}")
+        print("    " + " ".join([str(i) for i in range(10)]) + "          " + " ".join([str(i) for i in range(10)]))
+        print("  +" + "-" * 21 + "+      +" + "-" * 21 + "+")
+        for i in range(10):
+            print(f"{i} | {' '.join(self.my_board[i])} |    {i} | {' '.join(self.opponent_board[i])} |")
+        print("  +" + "-" * 21 + "+      +" + "-" * 21 + "+")
+    
+    def handle_replay_data(self, record):
+        """Xem lại: in diễn biến và bảng cuối cùng của một ván đã lưu"""
+        try:
+            room_id, name1, name2, winner, fleet1, fleet2, shots = decode_record(record)
+        except ReplayError as e:
+            with self.print_lock:
+                print(f"\n[CLIENT] {e}")
+            return
+        
+        self.watch_names = [name1, name2]
+        self.my_board = [[' ' for _ in range(10)] for _ in range(10)]
+        self.opponent_board = [[' ' for _ in range(10)] for _ in range(10)]
+        for board, fleet in ((self.my_board, fleet1), (self.opponent_board, fleet2)):
+            for x, y in bitboard_to_cells(fleet):
+                board[y][x] = '■'
+        
+        moves = []
+        for player_num, x, y, is_hit in shots:
+            # Người chơi 1 bắn vào bảng của người chơi 2 và ngược lại
+            board = self.opponent_board if player_num == 1 else self.my_board
+            board[y][x] = 'X' if is_hit else 'O'
+            moves.append(f"{self.watch_names[player_num - 1]} ({x},{y}) {'TRÚNG' if is_hit else 'trượt'}")
+        
+        if winner is None:
+            status = f"Ván #{room_id}: có người chơi đã ngắt kết nối"
+        else:
+            status = f"Ván #{room_id}: {self.watch_names[winner - 1]} thắng"
+        with self.print_lock:
+            self.display_match(status)
+            print(f"\n{len(shots)} phát bắn:")
+            print("\n".join(moves))
+    
+    def replay(self, query):
+        """Xem lại các ván đã kết thúc: theo room_id hoặc tên người chơi"""
+        if not self.connect():
+            return
+        
+        # Gửi REPLAY (gói đầu tiên: ở dạng text, kèm codec muốn dùng)
+        self.socket.sendall(encode_frame(encode_replay(query, self.codec.name)))
+        try:
+            self.receive_messages()
+        except KeyboardInterrupt:
+            print("\n[CLIENT] Ngắt kết nối...")
+        finally:
+            self.socket.close()
+    
+    def leaderboard(self, count):
+        """Xem bảng xếp hạng: count người có rating cao nhất"""
+        if not self.connect():
+            return
+        
+        print("\n=== BẢNG XẾP HẠNG ===")
+        # Gửi LEADERBOARD (gói đầu tiên: ở dạng text, kèm codec muốn dùng)
+        self.socket.sendall(encode_frame(encode_leaderboard(count, self.codec.name)))
+        try:
+            self.receive_messages()
+        except KeyboardInterrupt:
+            print("\n[CLIENT] Ngắt kết nối...")
+        finally:
+            self.socket.close()
+    
     def handle_match_found(self, opponent_name):
         """Xử lý khi tìm thấy đối thủ"""
         self.opponent_name = opponent_name
@@ -180,6 +436,8 @@ class BattleshipClient:
         ]
         
         all_positions = []
+        # Mỗi tàu gửi một list ô riêng: tàu đặt sát nhau vẫn giữ đúng ranh giới
+        placed_ships = []
         
         for ship_name, ship_size in ships:
             while True:
@@ -219,6 +477,7 @@ class BattleshipClient:
                     
                     if valid:
                         all_positions.extend(positions)
+                        placed_ships.append(positions)
                         # Đánh dấu trên bảng
                         for pos in positions:
                             self.my_board[pos[1]][pos[0]] = '■'
@@ -235,8 +494,7 @@ class BattleshipClient:
             print("Đang gửi dữ liệu lên server...")
         
         # Gửi setup lên server
-        map_data = json.dumps(all_positions)
-        self.send_message(f"SETUP|{map_data}")
+        self.send_message("SETUP", placed_ships)
     
     def handle_game_start(self, data):
         """Xử lý khi game bắt đầu"""
@@ -286,7 +544,8 @@ class BattleshipClient:
                     continue
                 
                 # Gửi shoot
-                self.send_message(f"SHOOT|{x},{y}")
+                self.shot_seq += 1
+                self.send_message("SHOOT", (x, y), self.shot_seq)
                 self.is_my_turn = False
                 break
             
@@ -295,12 +554,9 @@ class BattleshipClient:
             except Exception as e:
                 print(f"Lỗi: {e}")
     
-    def handle_result(self, data):
+    def handle_result(self, result_type, coords):
         """Xử lý kết quả bắn của mình"""
-        parts = data.split('|')
-        result_type = parts[0]
-        coords = parts[1].split(',')
-        x, y = int(coords[0]), int(coords[1])
+        x, y = coords
         
         with self.print_lock:
             if result_type == "HIT":
@@ -313,12 +569,9 @@ class BattleshipClient:
             if result_type != "HIT":
                 print("Đợi đối thủ đánh...")
     
-    def handle_opponent_shoot(self, data):
+    def handle_opponent_shoot(self, result_type, coords):
         """Xử lý khi đối thủ bắn"""
-        parts = data.split('|')
-        result_type = parts[0]
-        coords = parts[1].split(',')
-        x, y = int(coords[0]), int(coords[1])
+        x, y = coords
         
         with self.print_lock:
             if result_type == "HIT":
@@ -328,6 +581,20 @@ class BattleshipClient:
                 self.my_board[y][x] = 'O'  # Trượt
                 print(f"\n🌊 Đối thủ bắn trượt")
     
+    def handle_sunk(self, cells, ship_name):
+        """Mình vừa bắn chìm một tàu của đối thủ"""
+        with self.print_lock:
+            for x, y in cells:
+                self.opponent_board[y][x] = '#'
+            print(f"🔥 Bạn đã bắn chìm {ship_name} của đối thủ!")
+    
+    def handle_opponent_sunk(self, cells, ship_name):
+        """Một tàu của mình vừa bị bắn chìm"""
+        with self.print_lock:
+            for x, y in cells:
+                self.my_board[y][x] = '#'
+            print(f"☠ {ship_name} của bạn đã bị bắn chìm!")
+    
     def handle_game_over(self, data):
         """Xử lý khi game kết thúc"""
         self.game_over = True
@@ -355,10 +622,12 @@ class BattleshipClient:
             print(f"{i} | " + " ".join(row) + " |")
         print("  +" + "-" * 21 + "+")
     
-    def send_message(self, message):
-        """Gửi tin nhắn đến server"""
+    def send_message(self, command, *fields):
+        """Gửi tin nhắn đến server, vd: send_message("SHOOT", (x, y), seq)"""
         try:
-            self.socket.send(message.encode('utf-8'))
+            message = self.codec.encode((command,) + fields)
+            with self.send_lock:
+                self.socket.sendall(encode_frame(message))
         except Exception as e:
             print(f"[CLIENT] Lỗi khi gửi tin nhắn: {e}")
 
@@ -369,5 +638,16 @@ if __name__ == "__main__":
     port_input = input("Nhập cổng (Enter = 8080): ").strip()
     port = int(port_input) if port_input else 8080
     
+    room_input = input("Nhập room_id để xem một phòng, 'replay <room_id|tên>' để xem lại "
+                       "ván đã kết thúc, 'top' để xem bảng xếp hạng (Enter = chơi): ").strip()
+    
     client = BattleshipClient(host=host, port=port)
-    client.start()
\ No newline at end of file
+    if room_input.startswith("replay "):
+        client.replay(room_input[len("replay "):].strip())
+    elif room_input.split()[:1] == ["top"]:
+        count = parse_number(room_input[len("top"):].strip())
+        client.leaderboard(count if count is not None else 10)
+    elif room_input:
+        client.spectate(room_input)
+    else:
+        client.start()
\ No newline at end of file
@@ -4,16 +4,25 @@ Trải nghiệm tốt hơn với click chuột - CÓ THỂ THAY ĐỔI KÍCH TH
 """
 import socket
 import threading
-import json
 import tkinter as tk
 from tkinter import messagebox, simpledialog
 import time
+from bitboard import bitboard_to_cells
+from framing import FrameReader, encode_frame
+from protocol import ProtocolError, encode_connect, encode_resume, get_codec
+
+# Số lần thử kết nối lại (RESUME) khi mất kết nối giữa ván và khoảng chờ (giây)
+RECONNECT_ATTEMPTS = 5
+RECONNECT_DELAY = 1.0
 
 class BattleshipGUI:
-    def __init__(self, host='127.0.0.1', port=8080):
+    def __init__(self, host='127.0.0.1', port=8080, protocol='binary'):
         self.host = host
         self.port = port
         self.socket = None
+        
+        # Codec thỏa thuận với server lúc CONNECT (text hoặc binary)
+        self.codec = get_codec(protocol)
         self.username = ""
         self.opponent_name = ""
         
@@ -25,6 +34,10 @@ class BattleshipGUI:
         self.is_my_turn = False
         self.game_started = False
         self.game_over = False
+        # Số thứ tự phát bắn gửi kèm SHOOT (server bỏ qua phát bắn gửi lại trùng số)
+        self.shot_seq = 0
+        # Token phiên server cấp sau CONNECT: dùng để RESUME khi rớt mạng
+        self.session_token = None
         self.setup_mode = False
         
         # Setup ships
@@ -38,6 +51,7 @@ class BattleshipGUI:
         self.current_ship_index = 0
         self.ship_direction = 'h'  # h=horizontal, v=vertical
         self.all_ship_positions = []
+        self.placed_ships = []  # list ô của từng tàu, gửi trong SETUP
         
         # GUI
         self.root = tk.Tk()
@@ -232,12 +246,9 @@ class BattleshipGUI:
         else:
             self.fullscreen_btn.config(text="⛶ Toàn màn hình")
     
-    def handle_result(self, data):
+    def handle_result(self, result_type, coords):
         """Xử lý kết quả bắn"""
-        parts = data.split('|')
-        result_type = parts[0]
-        coords = parts[1].split(',')
-        x, y = int(coords[0]), int(coords[1])
+        x, y = coords
         
         if result_type == "HIT":
             self.opponent_buttons[y][x].config(bg="#e74c3c", text="💥")
@@ -251,12 +262,9 @@ class BattleshipGUI:
         if result_type != "HIT":
             self.status_label.config(text="⏳ Đợi đối thủ đánh...")
     
-    def handle_opponent_shoot(self, data):
+    def handle_opponent_shoot(self, result_type, coords):
         """Xử lý khi đối thủ bắn"""
-        parts = data.split('|')
-        result_type = parts[0]
-        coords = parts[1].split(',')
-        x, y = int(coords[0]), int(coords[1])
+        x, y = coords
         
         if result_type == "HIT":
             self.my_buttons[y][x].config(bg="#e74c3c", text="💥")
@@ -265,6 +273,20 @@ class BattleshipGUI:
             self.my_buttons[y][x].config(bg="#7f8c8d", text="○")
             self.my_board[y][x] = 'O'
     
+    def handle_sunk(self, cells, ship_name):
+        """Mình vừa bắn chìm một tàu của đối thủ"""
+        for x, y in cells:
+            self.opponent_buttons[y][x].config(bg="#641e16", text="☠")
+            self.opponent_board[y][x] = '#'
+        messagebox.showinfo("Bắn chìm", f"🔥 Bạn đã bắn chìm {ship_name} của đối thủ!")
+    
+    def handle_opponent_sunk(self, cells, ship_name):
+        """Một tàu của mình vừa bị bắn chìm"""
+        for x, y in cells:
+            self.my_buttons[y][x].config(bg="#641e16", text="☠")
+            self.my_board[y][x] = '#'
+        self.status_label.config(text=f"☠ {ship_name} của bạn đã bị bắn chìm!")
+    
     def handle_game_over(self, data):
         """Xử lý game over"""
         self.game_over = True
@@ -311,6 +333,7 @@ class BattleshipGUI:
         
         # Đặt tàu
         self.all_ship_positions.extend(positions)
+        self.placed_ships.append(positions)
         for pos in positions:
             px, py = pos
             self.my_buttons[py][px].config(bg="#27ae60", text="■")
@@ -331,8 +354,7 @@ class BattleshipGUI:
             self.setup_mode = False
             
             # Gửi setup
-            map_data = json.dumps(self.all_ship_positions)
-            self.send_message(f"SETUP|{map_data}")
+            self.send_message("SETUP", self.placed_ships)
     
     def opponent_cell_click(self, x, y):
         """Xử lý click vào bảng đối thủ (bắn)"""
@@ -344,7 +366,8 @@ class BattleshipGUI:
             return
         
         # Gửi shoot
-        self.send_message(f"SHOOT|{x},{y}")
+        self.shot_seq += 1
+        self.send_message("SHOOT", (x, y), self.shot_seq)
         self.is_my_turn = False
         self.status_label.config(text="⏳ Đang đợi kết quả...")
     
@@ -372,8 +395,11 @@ class BattleshipGUI:
             self.root.destroy()
             return
         
-        # Gửi CONNECT
-        self.send_message(f"CONNECT|{self.username}")
+        # Gửi CONNECT (luôn ở dạng text, kèm codec muốn dùng)
+        try:
+            self.socket.sendall(encode_frame(encode_connect(self.username, self.codec.name)))
+        except Exception as e:
+            print(f"[ERROR] Lỗi gửi tin nhắn: {e}")
         self.status_label.config(text="🔍 Đang tìm đối thủ...")
         
         # Thread nhận tin nhắn
@@ -396,24 +422,60 @@ class BattleshipGUI:
     
     def receive_messages(self):
         """Nhận tin nhắn từ server"""
-        try:
-            while True:
-                data = self.socket.recv(4096).decode('utf-8')
-                if not data:
-                    break
-                self.root.after(0, self.process_message, data)
-        except Exception as e:
-            print(f"[ERROR] Lỗi nhận tin nhắn: {e}")
+        while True:
+            reader = FrameReader()
+            try:
+                while True:
+                    frames = reader.read_from(self.socket)
+                    if frames is None:
+                        break
+                    for frame in frames:
+                        self.root.after(0, self.process_message, frame)
+            except Exception as e:
+                print(f"[ERROR] Lỗi nhận tin nhắn: {e}")
+            
+            # Mất kết nối giữa ván: kết nối lại và nhận lại trạng thái phòng
+            if self.game_over or not self.reconnect():
+                return
     
-    def process_message(self, message):
+    def reconnect(self):
+        """Kết nối lại và gửi RESUME với token phiên (chạy trên thread nhận)"""
+        if self.session_token is None:
+            return False
+        for _ in range(RECONNECT_ATTEMPTS):
+            self.root.after(0, self.status_label.config, {'text': "🔌 Mất kết nối, đang kết nối lại..."})
+            time.sleep(RECONNECT_DELAY)
+            try:
+                self.socket.close()
+                self.socket = socket.create_connection((self.host, self.port))
+                self.socket.sendall(encode_frame(encode_resume(self.session_token, self.codec.name)))
+                return True
+            except OSError:
+                continue
+        return False
+    
+    def process_message(self, payload):
         """Xử lý tin nhắn từ server"""
-        parts = message.split('|', 1)
-        command = parts[0]
-        data = parts[1] if len(parts) > 1 else ""
+        try:
+            command, fields = self.codec.decode(payload)
+        except ProtocolError as e:
+            print(f"[ERROR] Gói tin không hợp lệ: {e}")
+            return
         
-        if command == "WAITING":
+        data = fields[0] if fields else ""
+        
+        if command == "SESSION":
+            self.session_token = data
+        
+        elif command == "PING":
+            self.send_message("PONG")
+        
+        elif command == "WAITING":
             self.status_label.config(text="⏳ Đang chờ đối thủ...")
         
+        elif command == "RESUMED":
+            self.handle_resumed(*fields)
+        
         elif command == "MATCH_FOUND":
             self.opponent_name = data
             self.opp_board_label.config(text=f"BẢNG ĐỐI THỦ: {data}")
@@ -430,10 +492,16 @@ class BattleshipGUI:
                 self.status_label.config(text="⏳ Đợi đối thủ đánh...")
         
         elif command == "RESULT":
-            self.handle_result(data)
+            self.handle_result(*fields)
         
         elif command == "OPPONENT_SHOOT":
-            self.handle_opponent_shoot(data)
+            self.handle_opponent_shoot(*fields)
+        
+        elif command == "SUNK":
+            self.handle_sunk(*fields)
+        
+        elif command == "OPPONENT_SUNK":
+            self.handle_opponent_sunk(*fields)
         
         elif command == "TURN":
             if data == "YOUR_TURN":
@@ -449,6 +517,49 @@ class BattleshipGUI:
             self.game_over = True
             self.root.destroy()
     
+    def handle_resumed(self, phase, ships, incoming, hits, misses, sunk, opponent_name):
+        """Kết nối lại thành công: vẽ lại 2 bảng từ trạng thái server gửi"""
+        self.opponent_name = opponent_name
+        self.opp_board_label.config(text=f"BẢNG ĐỐI THỦ: {opponent_name}")
+        
+        for y in range(10):
+            for x in range(10):
+                self.my_buttons[y][x].config(bg="#3498db", text="")
+                self.my_board[y][x] = ' '
+                self.opponent_buttons[y][x].config(bg="#95a5a6", text="")
+                self.opponent_board[y][x] = ' '
+        for x, y in bitboard_to_cells(ships):
+            self.my_buttons[y][x].config(bg="#27ae60", text="■")
+            self.my_board[y][x] = '■'
+        for x, y in bitboard_to_cells(incoming):
+            if self.my_board[y][x] == '■':
+                self.my_buttons[y][x].config(bg="#e74c3c", text="💥")
+                self.my_board[y][x] = 'X'
+            else:
+                self.my_buttons[y][x].config(bg="#7f8c8d", text="○")
+                self.my_board[y][x] = 'O'
+        for board, color, text, mark in ((hits, "#e74c3c", "💥", 'X'), (misses, "#7f8c8d", "○", 'O'),
+                                         (sunk, "#641e16", "☠", '#')):
+            for x, y in bitboard_to_cells(board):
+                self.opponent_buttons[y][x].config(bg=color, text=text)
+                self.opponent_board[y][x] = mark
+        
+        if phase == "SETUP":
+            self.current_ship_index = 0
+            self.all_ship_positions = []
+            self.placed_ships = []
+            self.start_setup()
+            self.status_label.config(text="🔌 Đã kết nối lại - hãy xếp tàu")
+        elif phase == "READY":
+            self.status_label.config(text="🔌 Đã kết nối lại - đợi đối thủ xếp tàu...")
+        else:
+            self.game_started = True
+            self.is_my_turn = phase == "YOUR_TURN"
+            if self.is_my_turn:
+                self.status_label.config(text="🎯 ĐẾN LƯỢT BẠN! Click vào bảng đối thủ để bắn")
+            else:
+                self.status_label.config(text="⏳ Đợi đối thủ đánh...")
+    
     def start_setup(self):
         """Bắt đầu giai đoạn setup"""
         self.setup_mode = True
@@ -459,10 +570,11 @@ class BattleshipGUI:
         )
         self.my_board_label.config(text="BẢNG CỦA BẠN (Click để đặt tàu)")
     
-    def send_message(self, message):
-        """Gửi tin nhắn đến server"""
+    def send_message(self, command, *fields):
+        """Gửi tin nhắn đến server, vd: send_message("SHOOT", (x, y), seq)"""
         try:
-            self.socket.send(message.encode('utf-8'))
+            message = self.codec.encode((command,) + fields)
+            self.socket.sendall(encode_frame(message))
         except Exception as e:
             print(f"[ERROR] Lỗi gửi tin nhắn: {e}")
 
@@ -0,0 +1,613 @@
+"""
+Cluster - Chạy nhiều node server.py sau một địa chỉ (vd: sau một load balancer TCP)
+
+Backend điều phối (CoordinationBackend) thay thế được:
+- InProcessBackend: nhiều ClusterServer trong cùng một process (dùng khi thử nghiệm)
+- SocketBackend: nối tới CoordinatorServer (python cluster.py --port 7000),
+  một server socket cục bộ đứng thay cho dịch vụ điều phối thật
+Backend giữ hàng đợi ghép cặp chung và cấp id phòng; mỗi node khi tham gia
+báo id lớn nhất đã lưu (journal, replay) nên id mới không trùng phòng cũ kể cả
+khi coordinator khởi động lại.
+
+Người chơi ở node A có thể gặp người chơi ở node B. Mỗi node giữ một bản sao
+GameRoom của phòng; GameRoom xử lý tất định nên 2 bản sao luôn giống nhau nếu
+nhận cùng các sự kiện theo cùng thứ tự:
+- Node của người chơi xử lý SETUP / SHOOT của người đó trên bản sao của mình,
+  trả kết quả cho client ngay, rồi gửi thẳng sự kiện sang node kia (1 hop)
+- Node kia áp dụng sự kiện lên bản sao và báo cho người chơi của nó
+Chỉ người đang có lượt mới bắn được, nên không bao giờ có 2 phát bắn đồng thời.
+Sự kiện ghép cặp đi tới node của player 1, node này chuyển tiếp cho node của
+player 2 trên cùng kênh với các sự kiện game sau đó (giữ đúng thứ tự).
+"""
+import argparse
+import itertools
+import json
+import socket
+import socketserver
+import threading
+
+from framing import FrameReader, encode_frame
+from matchmaking import MatchQueue
+from protocol import TEXT_CODEC, get_codec
+from server import BattleshipServer
+from session import PlayerSession, describe_player, restore_player
+from serverlog import log, fields as log_fields, setup_logging, LOG_FORMATS
+
+DEFAULT_COORDINATOR_PORT = 7000
+
+
+def encode_event(event):
+    return encode_frame(json.dumps(event).encode('utf-8'))
+
+
+def read_events(sock, handle):
+    """Đọc các sự kiện JSON (có đóng khung) từ socket cho đến khi đóng"""
+    reader = FrameReader()
+    while True:
+        frames = reader.read_from(sock)
+        if frames is None:
+            return
+        for frame in frames:
+            handle(json.loads(frame))
+
+
+# ==================== Hàng đợi ghép cặp chung ====================
+
+class ClusterTicket:
+    """Người chơi đang chờ trong hàng đợi chung (thay cho PlayerSession trong MatchQueue)"""
+    __slots__ = ('node_id', 'ticket_id', 'info', 'closed', 'room')
+
+    def __init__(self, node_id, ticket_id, info):
+        self.node_id = node_id
+        self.ticket_id = ticket_id
+        self.info = info
+        self.closed = False
+        self.room = None
+
+    def player(self):
+        return dict(self.info, node=self.node_id, ticket=self.ticket_id)
+
+
+class MatchDirectory:
+    """Hàng đợi ghép cặp chung + bộ cấp id phòng (trạng thái của backend)"""
+
+    def __init__(self):
+        self.queue = MatchQueue()
+        self.tickets = {}   # {(node_id, ticket_id): ClusterTicket}
+        self.room_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def enqueue(self, node_id, ticket_id, info):
+        """
+        Thêm người chơi; ghép được ngay thì trả về sự kiện 'match'
+        (player 1 là người chờ lâu hơn), không thì None
+        """
+        ticket = ClusterTicket(node_id, ticket_id, info)
+        with self.lock:
+            opponent = self.queue.pair_or_push(ticket)
+            if opponent is None:
+                self.tickets[(node_id, ticket_id)] = ticket
+                return None
+            del self.tickets[(opponent.node_id, opponent.ticket_id)]
+            room_id = next(self.room_ids)
+        return {'type': 'match', 'room_id': room_id,
+                'players': [opponent.player(), ticket.player()]}
+
+    def advance_ids(self, room_id):
+        """Phòng ghép sau có id lớn hơn room_id (id node đã lưu trong journal / replay)"""
+        with self.lock:
+            self.room_ids = itertools.count(max(next(self.room_ids), room_id + 1))
+
+    def cancel(self, node_id, ticket_id):
+        with self.lock:
+            ticket = self.tickets.pop((node_id, ticket_id), None)
+            if ticket is not None:
+                self.queue.cancel(ticket)
+
+    def drop_node(self, node_id):
+        """Node rời cluster: hủy mọi người chơi đang chờ của node đó"""
+        with self.lock:
+            keys = [key for key in self.tickets if key[0] == node_id]
+            for key in keys:
+                self.queue.cancel(self.tickets.pop(key))
+
+
+
+# ==================== Backend điều phối ====================
+
+class CoordinationBackend:
+    """
+    Giao diện backend điều phối giữa các node
+    deliver(event) của node được gọi khi có sự kiện cho node đó: 'match' từ
+    hàng đợi chung, hoặc sự kiện game do node khác gửi qua relay()
+    """
+
+    def attach(self, node_id, deliver, last_room_id=0):
+        """last_room_id: id phòng lớn nhất node đã lưu, id cấp sau phải lớn hơn"""
+        raise NotImplementedError
+
+    def enqueue(self, node_id, ticket_id, info):
+        """Đưa người chơi vào hàng đợi chung"""
+        raise NotImplementedError
+
+    def cancel(self, node_id, ticket_id):
+        raise NotImplementedError
+
+    def relay(self, node_id, event):
+        """Gửi thẳng một sự kiện game cho node khác; lỗi thì raise OSError"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InProcessBackend(CoordinationBackend):
+    """Mọi node chạy trong cùng process: gọi thẳng deliver() của node kia"""
+
+    def __init__(self):
+        self.directory = MatchDirectory()
+        self.nodes = {}   # {node_id: deliver}
+
+    def attach(self, node_id, deliver, last_room_id=0):
+        self.directory.advance_ids(last_room_id)
+        self.nodes[node_id] = deliver
+
+    def enqueue(self, node_id, ticket_id, info):
+        event = self.directory.enqueue(node_id, ticket_id, info)
+        if event is not None:
+            self.relay(event['players'][0]['node'], event)
+
+    def cancel(self, node_id, ticket_id):
+        self.directory.cancel(node_id, ticket_id)
+
+    def relay(self, node_id, event):
+        deliver = self.nodes.get(node_id)
+        if deliver is None:
+            raise OSError(f"Node {node_id} không tồn tại")
+        deliver(event)
+
+
+class SocketBackend(CoordinationBackend):
+    """
+    Backend qua mạng: hàng đợi và bộ cấp id phòng nằm ở CoordinatorServer,
+    sự kiện game đi thẳng giữa các node qua kết nối relay (không qua coordinator)
+    """
+
+    def __init__(self, coordinator, relay_host='127.0.0.1', relay_port=0):
+        self.coordinator_address = coordinator
+        self.relay_host = relay_host
+        self.relay_port = relay_port
+        self.node_id = None
+        self.deliver = None
+
+        self.coordinator = None
+        self.coordinator_lock = threading.Lock()
+        self.listener = None
+        self.relay_address = None
+
+        self.peers = {}            # {node_id: (socket, lock)} kết nối relay đi
+        self.peer_addresses = {}   # {node_id: (host, port)} học từ sự kiện 'match'
+        self.peers_lock = threading.Lock()
+
+    def attach(self, node_id, deliver, last_room_id=0):
+        self.node_id = node_id
+        self.deliver = deliver
+
+        self.listener = socket.create_server((self.relay_host, self.relay_port))
+        self.relay_address = self.listener.getsockname()[:2]
+        threading.Thread(target=self._accept_peers, name="RelayListener", daemon=True).start()
+
+        self.coordinator = socket.create_connection(self.coordinator_address)
+        self.coordinator.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_coordinator({'op': 'hello', 'node': node_id, 'last_room_id': last_room_id})
+        threading.Thread(target=self._read, args=(self.coordinator,),
+                         name="CoordinatorLink", daemon=True).start()
+        log.info("Node %s: relay tại %s:%s, coordinator %s:%s", node_id,
+                 *self.relay_address, *self.coordinator_address)
+
+    def enqueue(self, node_id, ticket_id, info):
+        player = dict(info, relay=list(self.relay_address))
+        self._send_coordinator({'op': 'enqueue', 'node': node_id, 'ticket': ticket_id,
+                                'player': player})
+
+    def cancel(self, node_id, ticket_id):
+        self._send_coordinator({'op': 'cancel', 'node': node_id, 'ticket': ticket_id})
+
+    def relay(self, node_id, event):
+        with self.peers_lock:
+            peer = self.peers.get(node_id)
+            if peer is None:
+                sock = socket.create_connection(self.peer_addresses[node_id])
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                peer = self.peers[node_id] = (sock, threading.Lock())
+        sock, lock = peer
+        try:
+            with lock:
+                sock.sendall(encode_event(event))
+        except OSError:
+            with self.peers_lock:
+                if self.peers.get(node_id) is peer:
+                    del self.peers[node_id]
+            sock.close()
+            raise
+
+    def close(self):
+        for sock in [self.coordinator, self.listener] + [peer[0] for peer in self.peers.values()]:
+            if sock is not None:
+                sock.close()
+
+    def _send_coordinator(self, message):
+        with self.coordinator_lock:
+            self.coordinator.sendall(encode_event(message))
+
+    def _accept_peers(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._read, args=(conn,), name="RelayPeer",
+                             daemon=True).start()
+
+    def _read(self, sock):
+        """Đọc sự kiện từ coordinator hoặc từ một node khác"""
+        try:
+            read_events(sock, self._handle)
+        except OSError:
+            pass
+        finally:
+            sock.close()
+
+    def _handle(self, event):
+        if event.get('type') == 'match':
+            # Nhớ địa chỉ relay của các node trong phòng
+            for player in event['players']:
+                if 'relay' in player:
+                    self.peer_addresses[player['node']] = tuple(player['relay'])
+        try:
+            self.deliver(event)
+        except Exception as e:
+            log.exception("Lỗi khi xử lý sự kiện cluster %s: %s", event.get('type'), e)
+
+
+# ==================== Coordinator (server điều phối cục bộ) ====================
+
+class CoordinatorHandler(socketserver.BaseRequestHandler):
+    """Một kết nối từ node"""
+
+    def setup(self):
+        self.node_id = None
+        self.lock = threading.Lock()
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            read_events(self.request, lambda message: self.server.dispatch(self, message))
+        except OSError:
+            pass
+
+    def finish(self):
+        if self.node_id is not None:
+            self.server.drop_node(self)
+
+    def send(self, event):
+        with self.lock:
+            self.request.sendall(encode_event(event))
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    """Giữ hàng đợi chung và cấp id phòng; báo 'match' cho node của player 1"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, CoordinatorHandler)
+        self.directory = MatchDirectory()
+        self.nodes = {}   # {node_id: CoordinatorHandler}
+        self.nodes_lock = threading.Lock()
+
+    def dispatch(self, handler, message):
+        op = message.get('op')
+        if op == 'hello':
+            handler.node_id = message['node']
+            self.directory.advance_ids(message.get('last_room_id', 0))
+            with self.nodes_lock:
+                self.nodes[handler.node_id] = handler
+            log.info("Node %s đã tham gia", handler.node_id)
+        elif op == 'enqueue':
+            event = self.directory.enqueue(message['node'], message['ticket'], message['player'])
+            if event is not None:
+                self.push(event['players'][0]['node'], event)
+        elif op == 'cancel':
+            self.directory.cancel(message['node'], message['ticket'])
+
+    def push(self, node_id, event):
+        with self.nodes_lock:
+            handler = self.nodes.get(node_id)
+        try:
+            if handler is None:
+                raise OSError("node không còn kết nối")
+            handler.send(event)
+        except OSError as e:
+            log.warning("Không gửi được sự kiện cho node %s: %s", node_id, e)
+
+    def drop_node(self, handler):
+        with self.nodes_lock:
+            if self.nodes.get(handler.node_id) is handler:
+                del self.nodes[handler.node_id]
+        self.directory.drop_node(handler.node_id)
+        log.info("Node %s đã rời cluster", handler.node_id)
+
+
+# ==================== Node ====================
+
+class RemoteSession(PlayerSession):
+    """Người chơi đang kết nối ở node khác: chỉ giữ thông tin, không có socket"""
+    __slots__ = ('node_id',)
+
+    def __init__(self, info):
+        super().__init__(None, tuple(info['address']) if info['address'] else None)
+        restore_player(self, info)
+        self.node_id = info['node']
+
+
+class ClusterServer(BattleshipServer):
+    """
+    BattleshipServer là một node của cluster
+    CONNECT đưa người chơi vào hàng đợi chung của backend; SETUP / SHOOT /
+    ngắt kết nối của người chơi ở node này được gửi sang node của đối thủ
+    """
+
+    def __init__(self, backend, node_id, **options):
+        # Ghép cặp do backend làm
+        options['matchmaking'] = 'instant'
+        super().__init__(**options)
+        self.backend = backend
+        self.node_id = node_id
+
+        # Người chơi của node này đang chờ trong hàng đợi chung
+        self.tickets = {}      # {ticket_id: PlayerSession}
+        self.ticket_of = {}    # {PlayerSession: ticket_id}
+        self.ticket_ids = itertools.count(1)
+        self.tickets_lock = threading.Lock()
+
+    def start(self):
+        # Khôi phục phòng trước khi tham gia: backend cấp id lớn hơn mọi phòng đã lưu
+        self.start_journal()
+        self.backend.attach(self.node_id, self.on_cluster_event, self.rooms.last_id())
+        try:
+            super().start()
+        finally:
+            self.backend.close()
+
+    def handle_connect(self, session, username, codec_name=TEXT_CODEC.name, region=None):
+        if session.username:
+            # CONNECT lặp lại: không cấp token mới, không xếp hàng lần hai
+            self.send_message(session, "ERROR", "Đã kết nối rồi")
+            return
+        session.username = username
+        session.codec = get_codec(codec_name)
+        session.region = region or ""
+        self.load_rating(session)
+        log.info("Player %s đang chờ ghép cặp...", username)
+        # Không cấp token phiên (như chế độ worker): kết nối RESUME có thể tới
+        # node khác, nơi không biết token. Gửi WAITING trước: sự kiện ghép cặp
+        # có thể tới ngay khi vào hàng đợi
+        self.send_message(session, "WAITING", "Đang chờ đối thủ...")
+        self.enqueue_player(session)
+
+    def enqueue_player(self, session):
+        ticket_id = next(self.ticket_ids)
+        with self.tickets_lock:
+            self.tickets[ticket_id] = session
+            self.ticket_of[session] = ticket_id
+        self.backend.enqueue(self.node_id, ticket_id, describe_player(session))
+
+    def take_ticket(self, ticket_id):
+        """Lấy session của người chơi đang chờ (None nếu đã ngắt kết nối)"""
+        with self.tickets_lock:
+            session = self.tickets.pop(ticket_id, None)
+            if session is not None:
+                del self.ticket_of[session]
+        if session is None or session.closed:
+            return None
+        return session
+
+    # ---------- Sự kiện từ backend / node khác ----------
+
+    def on_cluster_event(self, event):
+        kind = event['type']
+        if kind == 'match':
+            self.open_room(event)
+        elif kind == 'requeue':
+            session = self.take_ticket(event['ticket'])
+            if session is not None:
+                self.enqueue_player(session)
+        else:
+            room = self.rooms.get(event['room_id'])
+            if room is None:
+                return
+            remote = room.get_player_session(event['player_num'])
+            if not isinstance(remote, RemoteSession):
+                return
+            if kind == 'setup':
+                self.handle_setup(remote, [[tuple(cell) for cell in ship]
+                                          for ship in event['ships']])
+            elif kind == 'shot':
+                self.handle_shoot(remote, event['x'], event['y'], event['seq'])
+            elif kind == 'leave':
+                self.remote_left(room, remote)
+            elif kind == 'forfeit':
+                self.forfeit(room, remote.player_num)
+
+    def open_room(self, event):
+        """Tạo bản sao phòng cho cặp vừa ghép (node của player 1 chuyển tiếp cho node kia)"""
+        room_id = event['room_id']
+        players = event['players']
+        forwarded = players[0]['node'] != self.node_id
+
+        sessions = []
+        for info in players:
+            if info['node'] == self.node_id:
+                sessions.append(self.take_ticket(info['ticket']))
+            else:
+                sessions.append(RemoteSession(info))
+        player1, player2 = sessions
+
+        if player1 is None or player2 is None:
+            # Người chơi của node này vừa ngắt kết nối
+            if forwarded:
+                # Node của player 1 đã tạo phòng: báo player 2 rời phòng
+                self._relay_to(players[0]['node'],
+                               {'type': 'leave', 'room_id': room_id, 'player_num': 2})
+            elif player1 is None and isinstance(player2, RemoteSession):
+                self._relay_to(player2.node_id, {'type': 'requeue', 'ticket': players[1]['ticket']})
+            else:
+                survivor = player1 or player2
+                if survivor is not None:
+                    self.enqueue_player(survivor)
+            return
+
+        room = self.rooms.create_room(player1, player1.username, player2, player2.username,
+                                      room_id=room_id)
+        player1.room, player1.player_num = room, 1
+        player2.room, player2.player_num = room, 2
+
+        if self.journal is not None:
+            self.journal.room_created(room)
+        if not forwarded:
+            self.metrics.matches_total.inc()
+            if isinstance(player2, RemoteSession):
+                self._relay_to(player2.node_id, event)
+        log.info("Ghép cặp: %s vs %s (%s)", player1.username, player2.username,
+                 " / ".join(info['node'] for info in players), extra=log_fields(room_id=room_id))
+
+        self.send_message(player1, "MATCH_FOUND", player2.username)
+        self.send_message(player2, "MATCH_FOUND", player1.username)
+
+    def remote_left(self, room, remote):
+        """Đối thủ ở node khác đã ngắt kết nối"""
+        remote.closed = True
+        with room.lock:
+            finished_now = room.finish()
+            opponent = room.get_opponent_session(remote.player_num)
+            if finished_now:
+                self.publish_to_spectators(room)
+        if finished_now and self.journal is not None:
+            self.journal.finished(room.room_id)
+        if finished_now:
+            self.record_replay(room)
+        if finished_now and opponent is not None:
+            self.send_message(opponent, "OPPONENT_DISCONNECTED", "Đối thủ đã ngắt kết nối")
+
+    # ---------- Hành động của người chơi ở node này ----------
+
+    def handle_setup(self, session, ship_cells):
+        accepted = super().handle_setup(session, ship_cells)
+        if accepted and not isinstance(session, RemoteSession):
+            self.relay_event(session, {'type': 'setup', 'ships': ship_cells})
+        return accepted
+
+    def handle_shoot(self, session, x, y, seq=None):
+        applied = super().handle_shoot(session, x, y, seq)
+        if applied and not isinstance(session, RemoteSession):
+            self.relay_event(session, {'type': 'shot', 'x': x, 'y': y, 'seq': seq})
+        return applied
+
+    def start_turn_timer(self, room):
+        # Đồng hồ lượt chỉ chạy ở node của người đang có lượt; hết giờ thì
+        # node đó xử thua và gửi 'forfeit' sang node kia
+        if isinstance(room.get_player_session(room.current_turn), RemoteSession):
+            if room.turn_timer is not None:
+                self.timers.cancel(room.turn_timer)
+                room.turn_timer = None
+            return
+        super().start_turn_timer(room)
+
+    def record_result(self, room):
+        # Cả 2 node đều thấy ván kết thúc: chỉ node của player 1 ghi kết quả
+        # (các node có thể dùng chung một file players_db)
+        if isinstance(room.get_player_session(1), RemoteSession):
+            return
+        super().record_result(room)
+
+    def forfeit(self, room, player_num):
+        loser = room.get_player_session(player_num)
+        if not super().forfeit(room, player_num):
+            return False
+        if not isinstance(loser, RemoteSession):
+            self.relay_event(loser, {'type': 'forfeit'}, room)
+        return True
+
+    def disconnect_client(self, session):
+        with self.tickets_lock:
+            ticket_id = self.ticket_of.pop(session, None)
+            if ticket_id is not None:
+                del self.tickets[ticket_id]
+        if ticket_id is not None:
+            self.backend.cancel(self.node_id, ticket_id)
+        super().disconnect_client(session)
+
+    def leave_room(self, session):
+        # Rời hẳn (node không cấp token nên ngắt kết nối là rời): báo node của đối thủ
+        room = session.room
+        super().leave_room(session)
+        if room is not None and not isinstance(session, RemoteSession):
+            self.relay_event(session, {'type': 'leave'}, room)
+
+    def relay_event(self, session, event, room=None):
+        """Gửi sự kiện của người chơi ở node này sang node của đối thủ (nếu ở node khác)"""
+        room = room or session.room
+        if room is None:
+            return
+        opponent = room.get_opponent_session(session.player_num)
+        if not isinstance(opponent, RemoteSession):
+            return
+        event['room_id'] = room.room_id
+        event['player_num'] = session.player_num
+        if not self._relay_to(opponent.node_id, event) and event['type'] != 'leave':
+            # Mất liên lạc với node kia: coi như đối thủ đã ngắt kết nối
+            self.remote_left(room, opponent)
+
+    def _relay_to(self, node_id, event):
+        try:
+            self.backend.relay(node_id, event)
+            return True
+        except (OSError, KeyError) as e:
+            log.warning("Không gửi được sự kiện %s cho node %s: %s", event['type'], node_id, e)
+            return False
+
+    def send_messages(self, session, messages, key=None):
+        # Người chơi ở node khác nhận tin nhắn từ node của họ
+        if isinstance(session, RemoteSession):
+            return
+        super().send_messages(session, messages, key)
+
+
+def parse_address(text, default_port=DEFAULT_COORDINATOR_PORT):
+    """'host:port' -> (host, port)"""
+    host, _, port = text.rpartition(':')
+    if not host:
+        return text, default_port
+    return host, int(port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Battleship cluster coordinator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_COORDINATOR_PORT)
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--log-format', choices=LOG_FORMATS, default='text')
+    args = parser.parse_args()
+
+    log_listener = setup_logging(args.log_level, fmt=args.log_format)
+    coordinator = CoordinatorServer((args.host, args.port))
+    log.info("Coordinator đang chạy tại %s:%s", args.host, args.port)
+    try:
+        coordinator.serve_forever()
+    except KeyboardInterrupt:
+        log.info("Đang tắt coordinator...")
+    finally:
+        coordinator.server_close()
+        log_listener.stop()
@@ -0,0 +1,70 @@
+"""
+Fleet - Kiểm tra đội tàu người chơi gửi lên trong SETUP
+
+Đội tàu hợp lệ: đúng 5 tàu dài 5, 4, 3, 3, 2 ô, mỗi tàu nằm thẳng (ngang hoặc
+dọc), trong bảng, không chồng lên nhau.
+
+SETUP gửi từng tàu riêng (fleet_from_ships): các tàu được đặt sát nhau vẫn
+giữ đúng như client đã xếp. Mọi vị trí đặt tàu hợp lệ được tính sẵn thành
+bitmask, nên kiểm tra một tàu chỉ là một lần tra dict.
+"""
+from bitboard import BOARD_SIZE, BOARD_CELLS, CELL_BITS, in_bounds, ship_mask
+
+# Đội tàu chuẩn (giống client.setup_ships và client_gui)
+FLEET_SIZES = (5, 4, 3, 3, 2)
+# Tên tàu gửi kèm SUNK (theo thứ tự FLEET_SIZES; 2 tàu 3 ô theo thứ tự client gửi)
+SHIP_NAMES = ("Tàu sân bay", "Tàu chiến", "Tàu khu trục 1", "Tàu khu trục 2", "Tàu ngầm")
+
+
+def _build_placement_cells():
+    """{mask tàu: (chỉ số các ô của tàu, ...)} cho mọi vị trí đặt tàu hợp lệ"""
+    cells = {}
+    for index in range(BOARD_CELLS):
+        y, x = divmod(index, BOARD_SIZE)
+        for size in set(FLEET_SIZES):
+            for horizontal in (True, False):
+                mask = ship_mask(x, y, size, horizontal)
+                if mask:
+                    cells[mask] = tuple(i for i in range(BOARD_CELLS) if mask >> i & 1)
+    return cells
+
+
+PLACEMENT_CELLS = _build_placement_cells()
+
+# Vị trí (slot) của từng độ dài tàu trong FLEET_SIZES, vd: 3 -> (2, 3)
+_SLOTS_BY_SIZE = {
+    size: tuple(slot for slot, s in enumerate(FLEET_SIZES) if s == size)
+    for size in set(FLEET_SIZES)
+}
+
+
+def fleet_from_ships(ships):
+    """
+    Kiểm tra đội tàu gửi theo từng tàu: [[(x, y), ...], ...]
+    Trả về: tuple mask các tàu (theo thứ tự FLEET_SIZES, các tàu cùng độ dài
+    theo thứ tự gửi), hoặc None nếu sai số tàu / độ dài, tàu không thẳng,
+    ngoài bảng, trùng ô hoặc chồng lên nhau
+    """
+    if len(ships) != len(FLEET_SIZES):
+        return None
+    fleet = [0] * len(FLEET_SIZES)
+    board = 0
+    for cells in ships:
+        mask = 0
+        for x, y in cells:
+            if not in_bounds(x, y):
+                return None
+            mask |= CELL_BITS[y * BOARD_SIZE + x]
+        # Ô trùng trong một tàu làm mask ít ô hơn số ô gửi lên
+        placement = PLACEMENT_CELLS.get(mask)
+        if placement is None or len(placement) != len(cells) or mask & board:
+            return None
+        for slot in _SLOTS_BY_SIZE[len(placement)]:
+            if not fleet[slot]:
+                break
+        else:
+            return None
+        fleet[slot] = mask
+        board |= mask
+    return tuple(fleet)
+
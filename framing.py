@@ -0,0 +1,119 @@
+"""
+Framing - Đóng gói tin nhắn với tiền tố độ dài (length-prefixed)
+Dùng chung cho server, client console và client GUI
+
+Mỗi gói tin trên đường truyền có dạng: [4 byte độ dài, big-endian][payload]
+TCP là luồng byte nên một lần recv() có thể chứa nhiều gói tin (hoặc chỉ một
+phần của gói tin); FrameReader gom buffer và tách ra đúng từng gói.
+ExactFrameReader đọc đúng từng gói một, không đọc trước byte của gói sau.
+"""
+import struct
+
+HEADER = struct.Struct('!I')
+HEADER_SIZE = HEADER.size
+
+# Giới hạn kích thước một gói tin (chống client gửi độ dài rác)
+MAX_FRAME_SIZE = 64 * 1024
+
+RECV_SIZE = 4096
+
+
+class FrameError(ValueError):
+    """Gói tin không hợp lệ (độ dài vượt giới hạn)"""
+
+
+def _to_bytes(message):
+    if isinstance(message, str):
+        return message.encode('utf-8')
+    return bytes(message)
+
+
+def encode_frame(message):
+    """Đóng gói một tin nhắn (str hoặc bytes) thành một frame"""
+    payload = _to_bytes(message)
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_frames(messages):
+    """Đóng gói nhiều tin nhắn vào một buffer duy nhất"""
+    buffer = bytearray()
+    for message in messages:
+        payload = _to_bytes(message)
+        buffer += HEADER.pack(len(payload))
+        buffer += payload
+    return bytes(buffer)
+
+
+class FrameReader:
+    """Buffer đọc: nhận byte thô, trả về danh sách payload hoàn chỉnh"""
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Thêm dữ liệu vừa nhận vào buffer
+        Trả về: list các payload (bytes) đã nhận đủ, có thể rỗng
+        """
+        self.buffer += data
+        frames = []
+        offset = 0
+        buffer_len = len(self.buffer)
+
+        while buffer_len - offset >= HEADER_SIZE:
+            (length,) = HEADER.unpack_from(self.buffer, offset)
+            if length > self.max_frame_size:
+                raise FrameError(f"Gói tin quá lớn: {length} bytes")
+
+            end = offset + HEADER_SIZE + length
+            if end > buffer_len:
+                break
+
+            frames.append(bytes(self.buffer[offset + HEADER_SIZE:end]))
+            offset = end
+
+        if offset:
+            del self.buffer[:offset]
+        return frames
+
+    def read_from(self, sock, bufsize=RECV_SIZE):
+        """
+        Đọc một lần từ socket
+        Trả về: list payload, hoặc None nếu kết nối đã đóng
+        """
+        data = sock.recv(bufsize)
+        if not data:
+            return None
+        return self.feed(data)
+
+
+
+class ExactFrameReader(FrameReader):
+    """
+    Mỗi lần đọc đúng một gói tin (header rồi payload), không lấy thêm byte nào
+    của gói sau: dùng khi socket có thể được chuyển cho process khác giữa hai gói
+    """
+
+    def read_from(self, sock, bufsize=RECV_SIZE):
+        header = _recv_exact(sock, HEADER_SIZE)
+        if header is None:
+            return None
+        (length,) = HEADER.unpack(header)
+        if length > self.max_frame_size:
+            raise FrameError(f"Gói tin quá lớn: {length} bytes")
+        payload = _recv_exact(sock, length)
+        if payload is None:
+            return None
+        return [payload]
+
+
+def _recv_exact(sock, size):
+    """Đọc đủ size byte; None nếu kết nối đóng giữa chừng"""
+    buffer = bytearray()
+    while len(buffer) < size:
+        data = sock.recv(size - len(buffer))
+        if not data:
+            return None
+        buffer += data
+    return bytes(buffer)
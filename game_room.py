@@ -1,25 +1,71 @@
 """
 Game Room - Quản lý phòng chơi cho 2 người chơi
+Bản đồ tàu và các ô bị bắn lưu dưới dạng bitboard (số nguyên 100 bit)
 """
-import json
+import threading
+import time
+from bitboard import BOARD_CELLS, BOARD_SIZE, CELL_BITS
+from fleet import PLACEMENT_CELLS
+
+# Vòng đời của phòng: created -> setup -> playing -> finished -> reaped
+ROOM_CREATED = 0    # Vừa ghép cặp, chưa ai xếp tàu
+ROOM_SETUP = 1      # Đang xếp tàu
+ROOM_PLAYING = 2    # Đang bắn
+ROOM_FINISHED = 3   # Đã có người thắng hoặc có người ngắt kết nối
+ROOM_REAPED = 4     # Đã bị dọn khỏi server
+
+ROOM_STATE_NAMES = ('created', 'setup', 'playing', 'finished', 'reaped')
+
+# Giá trị trong bảng ô -> tàu cho ô không có tàu
+NO_SHIP = 0xFF
+# Kết quả process_shoot của một phát trượt
+MISS_RESULT = (False, False, None, None)
 
 class GameRoom:
     """Class quản lý một phòng chơi với 2 người chơi"""
     
-    def __init__(self, room_id, player1_socket, player1_name, player2_socket, player2_name):
+    # Không dùng __dict__ cho mỗi phòng: server có thể giữ rất nhiều phòng
+    __slots__ = (
+        'room_id', 'lock',
+        'player1_session', 'player1_name', 'player2_session', 'player2_name',
+        'player1_map', 'player2_map', 'player1_hit', 'player2_hit',
+        'player1_fired', 'player2_fired', 'player1_last_shot', 'player2_last_shot',
+        'player1_ready', 'player2_ready', 'current_turn',
+        'player1_ship_count', 'player2_ship_count',
+        'player1_ships', 'player2_ships', 'player1_ship_at', 'player2_ship_at',
+        'player1_ship_left', 'player2_ship_left', 'player1_cells_left', 'player2_cells_left',
+        'state', 'finished_at', 'winner', 'turn_timer', 'spectators', 'shots',
+    )
+    
+    def __init__(self, room_id, player1_session, player1_name, player2_session, player2_name):
         self.room_id = room_id
-        self.player1_socket = player1_socket
+        
+        # Lock riêng của phòng: server giữ lock này khi đọc/ghi trạng thái game
+        self.lock = threading.Lock()
+        self.player1_session = player1_session  # PlayerSession của người chơi 1
         self.player1_name = player1_name
-        self.player2_socket = player2_socket
+        self.player2_session = player2_session
         self.player2_name = player2_name
         
-        # Bản đồ tàu của mỗi người (lưu trữ tọa độ các ô có tàu)
-        self.player1_map = set()  # Set các tuple (x, y)
-        self.player2_map = set()
+        # Bản đồ tàu của mỗi người (bitboard: bit y*10+x = 1 nếu có tàu)
+        self.player1_map = 0
+        self.player2_map = 0
+        
+        # Các ô đã bị bắn trúng (bitboard)
+        self.player1_hit = 0  # Ô của player1 bị bắn trúng
+        self.player2_hit = 0  # Ô của player2 bị bắn trúng
+        
+        # Mọi ô đã bị bắn (trúng hoặc trượt, bitboard): bắn lại một ô bị từ chối
+        self.player1_fired = 0  # Ô của player1 đã bị bắn
+        self.player2_fired = 0  # Ô của player2 đã bị bắn
         
-        # Các ô đã bị bắn
-        self.player1_hit = set()  # Ô của player1 bị bắn trúng
-        self.player2_hit = set()  # Ô của player2 bị bắn trúng
+        # Mọi phát bắn theo thứ tự, 1 byte / phát (y*10 + x): dùng cho replay;
+        # người bắn suy ra được (player 1 đi trước, trúng thì bắn tiếp)
+        self.shots = bytearray()
+        
+        # Phát bắn gần nhất có số thứ tự của mỗi người: (seq, x, y, kết quả process_shoot)
+        self.player1_last_shot = None
+        self.player2_last_shot = None
         
         # Trạng thái setup
         self.player1_ready = False
@@ -28,88 +74,257 @@ class GameRoom:
         # Lượt chơi (1 hoặc 2)
         self.current_turn = 1
         
-        # Số ô tàu ban đầu (để kiểm tra game over)
+        # Số ô tàu ban đầu
         self.player1_ship_count = 0
         self.player2_ship_count = 0
         
-        # Trạng thái game
-        self.game_started = False
-        self.game_over = False
+        # Từng con tàu (mask, theo thứ tự FLEET_SIZES) và bảng tra ô -> số thứ tự
+        # tàu (bytes 100 phần tử, NO_SHIP nếu ô trống)
+        self.player1_ships = ()
+        self.player2_ships = ()
+        self.player1_ship_at = None
+        self.player2_ship_at = None
+        
+        # Số ô chưa bị trúng của từng tàu và của cả đội tàu (0 = thua)
+        self.player1_ship_left = None
+        self.player2_ship_left = None
+        self.player1_cells_left = 0
+        self.player2_cells_left = 0
+        
+        # Trạng thái phòng (ROOM_*) và thời điểm kết thúc (time.monotonic)
+        self.state = ROOM_CREATED
+        self.finished_at = None
+        # Người thắng (1 hoặc 2); None nếu chưa xong hoặc kết thúc vì ngắt kết nối
+        self.winner = None
+        
+        # Timer hết giờ của lượt hiện tại (server đặt, xem BattleshipServer.start_turn_timer)
+        self.turn_timer = None
+        
+        # Người xem: tuple thay mới khi thêm / bớt (hiếm), gửi cho cả phòng
+        # (mỗi phát bắn) chỉ cần đọc, không phải chép
+        self.spectators = ()
+    
+    @property
+    def game_started(self):
+        """Game đã bắt đầu bắn (kể cả khi đã kết thúc)"""
+        return self.state >= ROOM_PLAYING
+    
+    @property
+    def game_over(self):
+        """Game đã kết thúc"""
+        return self.state >= ROOM_FINISHED
     
-    def set_player_map(self, player_num, map_data):
+    @property
+    def state_name(self):
+        return ROOM_STATE_NAMES[self.state]
+    
+    def start_game(self):
+        """Chuyển sang giai đoạn bắn (khi cả 2 đã xếp tàu)"""
+        if self.state < ROOM_PLAYING:
+            self.state = ROOM_PLAYING
+    
+    def finish(self, winner=None):
+        """Kết thúc phòng; trả về False nếu phòng đã kết thúc trước đó"""
+        if self.state >= ROOM_FINISHED:
+            return False
+        self.state = ROOM_FINISHED
+        self.finished_at = time.monotonic()
+        self.winner = winner
+        return True
+    
+    def set_player_map(self, player_num, ships):
         """
         Lưu bản đồ tàu của người chơi
-        map_data: list of tuples [(x1,y1), (x2,y2), ...]
+        ships: mask từng tàu đã kiểm tra (kết quả fleet_from_ships)
         """
+        board = 0
+        ship_at = bytearray([NO_SHIP]) * BOARD_CELLS
+        ship_left = []
+        for number, ship in enumerate(ships):
+            board |= ship
+            cells = PLACEMENT_CELLS[ship]
+            for index in cells:
+                ship_at[index] = number
+            ship_left.append(len(cells))
+        
         if player_num == 1:
-            self.player1_map = set(map_data)
-            self.player1_ship_count = len(map_data)
+            self.player1_map = board
+            self.player1_ship_count = self.player1_cells_left = sum(ship_left)
+            self.player1_ships = tuple(ships)
+            self.player1_ship_at = bytes(ship_at)
+            self.player1_ship_left = ship_left
             self.player1_ready = True
         else:
-            self.player2_map = set(map_data)
-            self.player2_ship_count = len(map_data)
+            self.player2_map = board
+            self.player2_ship_count = self.player2_cells_left = sum(ship_left)
+            self.player2_ships = tuple(ships)
+            self.player2_ship_at = bytes(ship_at)
+            self.player2_ship_left = ship_left
             self.player2_ready = True
+        
+        if self.state == ROOM_CREATED:
+            self.state = ROOM_SETUP
+    
+    def is_player_ready(self, player_num):
+        """Người chơi đã gửi bản đồ tàu chưa"""
+        if player_num == 1:
+            return self.player1_ready
+        else:
+            return self.player2_ready
     
     def is_both_ready(self):
         """Kiểm tra cả 2 người chơi đã sẵn sàng chưa"""
         return self.player1_ready and self.player2_ready
     
-    def process_shoot(self, player_num, x, y):
+    def process_shoot(self, player_num, x, y, seq=None):
         """
         Xử lý bắn
-        Trả về: (is_hit, is_game_over, winner)
+        Trả về: (is_hit, is_game_over, winner, sunk)
+        sunk: số thứ tự tàu vừa bị bắn chìm (xem get_ship), hoặc None
+        seq: số thứ tự phát bắn do client đặt; kết quả được ghi lại cho find_retry
+        Ô ngoài bảng hoặc đã bắn rồi: ValueError, trạng thái phòng không đổi
         """
         if self.game_over:
-            return False, True, None
+            return False, True, None, None
+        
+        if not (0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE):
+            raise ValueError("Tọa độ ngoài bảng")
+        index = y * BOARD_SIZE + x
+        bit = CELL_BITS[index]
         
         # Player 1 bắn vào bản đồ của Player 2
         if player_num == 1:
-            target_map = self.player2_map
-            target_hit = self.player2_hit
-            is_hit = (x, y) in target_map
-            
-            if is_hit:
-                self.player2_hit.add((x, y))
-                # Kiểm tra game over
-                if len(self.player2_hit) == self.player2_ship_count:
-                    self.game_over = True
-                    return True, True, 1
-                # Trúng thì KHÔNG đổi lượt (được bắn tiếp)
-                return is_hit, False, None
-            else:
+            fired = self.player2_fired
+            if fired & bit:
+                raise ValueError("Bạn đã bắn ô này rồi!")
+            self.player2_fired = fired | bit
+            ship = self.player2_ship_at[index]
+            if ship == NO_SHIP:
                 # Trượt thì mới đổi lượt
                 self.current_turn = 2
-                return is_hit, False, None
+                result = MISS_RESULT
+            else:
+                self.player2_hit |= bit
+                self.player2_cells_left = cells_left = self.player2_cells_left - 1
+                ship_left = self.player2_ship_left
+                result = None
         
         # Player 2 bắn vào bản đồ của Player 1
         else:
-            target_map = self.player1_map
-            target_hit = self.player1_hit
-            is_hit = (x, y) in target_map
+            fired = self.player1_fired
+            if fired & bit:
+                raise ValueError("Bạn đã bắn ô này rồi!")
+            self.player1_fired = fired | bit
+            ship = self.player1_ship_at[index]
+            if ship == NO_SHIP:
+                self.current_turn = 1
+                result = MISS_RESULT
+            else:
+                self.player1_hit |= bit
+                self.player1_cells_left = cells_left = self.player1_cells_left - 1
+                ship_left = self.player1_ship_left
+                result = None
+        
+        self.shots.append(index)
+        if result is None:
+            # Trúng thì KHÔNG đổi lượt (được bắn tiếp)
+            ship_left[ship] -= 1
+            sunk = ship if ship_left[ship] == 0 else None
             
-            if is_hit:
-                self.player1_hit.add((x, y))
-                # Kiểm tra game over
-                if len(self.player1_hit) == self.player1_ship_count:
-                    self.game_over = True
-                    return True, True, 2
-                # Trúng thì KHÔNG đổi lượt (được bắn tiếp)
-                return is_hit, False, None
+            # Game over: mọi ô tàu đều đã bị trúng
+            if cells_left == 0:
+                self.finish(player_num)
+                result = (True, True, player_num, sunk)
             else:
-                # Trượt thì mới đổi lượt
-                self.current_turn = 1
-                return is_hit, False, None
+                result = (True, False, None, sunk)
+        
+        if seq is not None:
+            if player_num == 1:
+                self.player1_last_shot = (seq, x, y, result)
+            else:
+                self.player2_last_shot = (seq, x, y, result)
+        return result
+    
+    def find_retry(self, player_num, seq, x, y):
+        """
+        Phát bắn gửi lại (cùng seq với phát bắn gần nhất của người chơi)
+        Trả về: kết quả đã ghi của phát bắn đó, hoặc None nếu đây là phát bắn mới
+        seq cũ hơn, hoặc cùng seq nhưng khác ô: ValueError
+        """
+        if player_num == 1:
+            last_shot = self.player1_last_shot
+        else:
+            last_shot = self.player2_last_shot
+        if last_shot is None or seq > last_shot[0]:
+            return None
+        if seq == last_shot[0] and (x, y) == last_shot[1:3]:
+            return last_shot[3]
+        raise ValueError("Số thứ tự phát bắn không hợp lệ")
+    
+    def snapshot(self, player_num):
+        """
+        Trạng thái phòng nhìn từ phía người chơi (các bitboard, dùng cho RESUME)
+        Trả về: (tàu của mình, ô đối thủ đã bắn vào mình, ô mình bắn trúng,
+                 ô mình bắn trượt, ô các tàu đối thủ đã chìm)
+        """
+        if player_num == 1:
+            ships, incoming = self.player1_map, self.player1_fired
+            fired, hits = self.player2_fired, self.player2_hit
+            enemy_ships, enemy_left = self.player2_ships, self.player2_ship_left
+        else:
+            ships, incoming = self.player2_map, self.player2_fired
+            fired, hits = self.player1_fired, self.player1_hit
+            enemy_ships, enemy_left = self.player1_ships, self.player1_ship_left
+        
+        sunk = 0
+        if enemy_left is not None:
+            for ship, left in zip(enemy_ships, enemy_left):
+                if left == 0:
+                    sunk |= ship
+        return ships, incoming, hits, fired & ~hits, sunk
+    
+    def spectator_view(self):
+        """
+        Trạng thái phòng cho người xem (không lộ tàu chưa bị bắn)
+        Trả về: (giai đoạn, rồi với bảng của player 1 và player 2: ô bị bắn
+                 trúng, ô bị bắn trượt, ô tàu đã chìm)
+        """
+        if self.state >= ROOM_FINISHED:
+            phase = "ENDED" if self.winner is None else f"WIN{self.winner}"
+        elif self.state == ROOM_PLAYING:
+            phase = f"TURN{self.current_turn}"
+        else:
+            phase = "SETUP"
+        # Bảng của player 1 là bảng player 2 bắn vào và ngược lại
+        board1 = self.snapshot(2)[2:]
+        board2 = self.snapshot(1)[2:]
+        return (phase,) + board1 + board2
+    
+    def add_spectator(self, session):
+        """Thêm người xem (gọi khi đang giữ self.lock)"""
+        self.spectators += (session,)
+    
+    def remove_spectator(self, session):
+        """Bớt người xem (gọi khi đang giữ self.lock)"""
+        self.spectators = tuple(s for s in self.spectators if s is not session)
+    
+    def get_ship(self, player_num, number):
+        """Mask con tàu thứ `number` của người chơi"""
+        if player_num == 1:
+            return self.player1_ships[number]
+        else:
+            return self.player2_ships[number]
     
     def is_player_turn(self, player_num):
         """Kiểm tra có phải lượt của người chơi này không"""
         return self.current_turn == player_num
     
-    def get_opponent_socket(self, player_num):
-        """Lấy socket của đối thủ"""
+    def get_opponent_session(self, player_num):
+        """Lấy session của đối thủ"""
         if player_num == 1:
-            return self.player2_socket
+            return self.player2_session
         else:
-            return self.player1_socket
+            return self.player1_session
     
     def get_opponent_name(self, player_num):
         """Lấy tên của đối thủ"""
@@ -118,9 +333,16 @@ class GameRoom:
         else:
             return self.player1_name
     
-    def get_player_socket(self, player_num):
-        """Lấy socket của người chơi"""
+    def get_player_session(self, player_num):
+        """Lấy session của người chơi"""
+        if player_num == 1:
+            return self.player1_session
+        else:
+            return self.player2_session
+    
+    def set_player_session(self, player_num, session):
+        """Thay session của người chơi (vd: người chơi kết nối lại)"""
         if player_num == 1:
-            return self.player1_socket
+            self.player1_session = session
         else:
-            return self.player2_socket
+            self.player2_session = session
@@ -0,0 +1,342 @@
+"""
+Journal - Nhật ký sự kiện phòng chơi để khôi phục phòng sau khi server khởi động lại
+
+- Chỉ ghi nối thêm (append-only): tạo phòng, xếp tàu, phát bắn kèm kết quả, kết thúc
+- Thread xử lý client chỉ đưa một tuple vào hàng đợi (không encode, không I/O);
+  thread nền gom mọi sự kiện đang chờ, ghi một lần và fsync một lần cho cả lô
+  (group commit) mỗi commit_interval giây
+- Snapshot định kỳ: chép sự kiện của các phòng còn đang chơi sang file mới rồi
+  bỏ journal cũ, nên thời gian replay không tăng theo số ván đã chơi
+- Khởi động: đọc snapshot + journal cùng thế hệ rồi chạy lại các sự kiện trên
+  GameRoom (GameRoom xử lý tất định nên dựng lại đúng trạng thái)
+
+File trong thư mục journal (g = thế hệ):
+  snapshot-<g>.log   sự kiện của các phòng đang chơi lúc bắt đầu thế hệ g
+  journal-<g>.log    sự kiện ghi thêm sau đó
+Mỗi sự kiện là một frame (framing.py); frame cuối bị ghi dở khi crash bị bỏ qua.
+"""
+import json
+import os
+import re
+import struct
+import threading
+from collections import deque
+
+from bitboard import BOARD_SIZE
+from framing import HEADER, MAX_FRAME_SIZE, encode_frame
+from protocol import BOARD_BYTES
+from serverlog import log
+
+# Chu kỳ ghi + fsync một lô (giây): sự kiện có thể mất khi crash tối đa chừng này
+DEFAULT_COMMIT_INTERVAL = 0.01
+# Số sự kiện ghi thêm trước khi tạo snapshot mới
+DEFAULT_SNAPSHOT_EVERY = 50_000
+
+# Loại sự kiện
+EVENT_CREATE = 1    # (room_id, tên player 1, tên player 2, token player 1, token player 2)
+EVENT_SHOT = 3      # (room_id, player_num, x, y, seq, trúng?)
+EVENT_FINISH = 4    # (room_id, người thắng hoặc 0)
+EVENT_SHIPS = 5     # (room_id, player_num, tuple mask từng tàu)
+
+EVENT_HEADER = struct.Struct('>BI')     # loại, room_id
+SETUP_PLAYER = struct.Struct('>B')
+SHOT_STRUCT = struct.Struct('>BBBI')    # player_num, ô (y*10+x), cờ, seq
+FINISH_STRUCT = struct.Struct('>B')
+
+# Cờ của phát bắn
+SHOT_HIT = 1
+SHOT_HAS_SEQ = 2
+
+FILE_PATTERN = re.compile(r"(snapshot|journal)-(\d+)\.log")
+
+
+class JournalError(ValueError):
+    """Sự kiện trong journal không hợp lệ"""
+
+
+def _token(session):
+    return session.token if session is not None else None
+
+
+def encode_event(event):
+    """Tuple sự kiện -> payload"""
+    kind, room_id = event[0], event[1]
+    header = EVENT_HEADER.pack(kind, room_id)
+    if kind == EVENT_SHOT:
+        player_num, x, y, seq, is_hit = event[2:]
+        flags = (SHOT_HIT if is_hit else 0) | (SHOT_HAS_SEQ if seq is not None else 0)
+        return header + SHOT_STRUCT.pack(player_num, y * BOARD_SIZE + x, flags, seq or 0)
+    if kind == EVENT_SHIPS:
+        return header + SETUP_PLAYER.pack(event[2]) + b''.join(
+            ship.to_bytes(BOARD_BYTES, 'little') for ship in event[3])
+    if kind == EVENT_CREATE:
+        return header + json.dumps(event[2:]).encode('utf-8')
+    return header + FINISH_STRUCT.pack(event[2] or 0)
+
+
+def decode_event(payload):
+    """Payload -> tuple sự kiện"""
+    try:
+        kind, room_id = EVENT_HEADER.unpack_from(payload)
+        body = payload[EVENT_HEADER.size:]
+        if kind == EVENT_SHOT:
+            player_num, index, flags, seq = SHOT_STRUCT.unpack(body)
+            y, x = divmod(index, BOARD_SIZE)
+            return (kind, room_id, player_num, x, y,
+                    seq if flags & SHOT_HAS_SEQ else None, bool(flags & SHOT_HIT))
+        if kind == EVENT_SHIPS:
+            (player_num,) = SETUP_PLAYER.unpack_from(body)
+            ships = tuple(int.from_bytes(body[pos:pos + BOARD_BYTES], 'little')
+                          for pos in range(SETUP_PLAYER.size, len(body), BOARD_BYTES))
+            return kind, room_id, player_num, ships
+        if kind == EVENT_CREATE:
+            player1_name, player2_name, *tokens = json.loads(body)
+            token1, token2 = tokens or (None, None)
+            return kind, room_id, player1_name, player2_name, token1, token2
+        if kind == EVENT_FINISH:
+            return kind, room_id, FINISH_STRUCT.unpack(body)[0]
+    except (struct.error, ValueError, TypeError) as e:
+        raise JournalError(f"Sự kiện không hợp lệ: {e}")
+    raise JournalError(f"Loại sự kiện không hợp lệ: {kind}")
+
+
+def read_frames(path):
+    """
+    Đọc mọi frame đầy đủ trong file
+    Trả về: (list payload, số byte hợp lệ); phần đuôi ghi dở bị bỏ qua
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    frames = []
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        (length,) = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + length
+        if length > MAX_FRAME_SIZE or end > len(data):
+            break
+        frames.append(data[offset + HEADER.size:end])
+        offset = end
+    return frames, offset
+
+
+class RoomJournal(threading.Thread):
+    """
+    Thread nền ghi journal theo lô
+    Gọi open() (đọc lại các phòng đang chơi) trước start()
+    """
+
+    def __init__(self, directory, commit_interval=DEFAULT_COMMIT_INTERVAL,
+                 snapshot_every=DEFAULT_SNAPSHOT_EVERY, sync=True):
+        super().__init__(name="RoomJournal", daemon=True)
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        self.sync = sync
+
+        # deque.append / popleft an toàn giữa các thread, không cần lock
+        self.pending = deque()
+        self.stopped = threading.Event()
+
+        # Chỉ thread ghi dùng: payload các sự kiện của từng phòng đang chơi
+        self.live = {}   # {room_id: [payload, ...]}
+        self.generation = 0
+        self.file = None
+        self.since_snapshot = 0
+
+    # ---------- Ghi sự kiện (gọi từ thread xử lý client) ----------
+
+    def room_created(self, room):
+        # Token phiên được ghi kèm để người chơi RESUME được sau khi server khởi động lại
+        self.pending.append((EVENT_CREATE, room.room_id, room.player1_name, room.player2_name,
+                             _token(room.player1_session), _token(room.player2_session)))
+
+    def setup(self, room_id, player_num, ships):
+        self.pending.append((EVENT_SHIPS, room_id, player_num, ships))
+
+    def shot(self, room_id, player_num, x, y, seq, is_hit):
+        self.pending.append((EVENT_SHOT, room_id, player_num, x, y, seq, is_hit))
+
+    def finished(self, room_id, winner=None):
+        self.pending.append((EVENT_FINISH, room_id, winner))
+
+    # ---------- Khởi động ----------
+
+    def open(self):
+        """
+        Đọc snapshot + journal mới nhất và bắt đầu thế hệ mới
+        Trả về: {room_id: [sự kiện, ...]} của các phòng chưa kết thúc
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        generation = self._latest_generation()
+
+        events = {}
+        paths = [self._path('snapshot', generation), self._path('journal', generation)]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            frames, valid = read_frames(path)
+            if valid != os.path.getsize(path):
+                log.warning("Journal %s bị ghi dở ở cuối, bỏ %d byte",
+                            path, os.path.getsize(path) - valid)
+            for payload in frames:
+                try:
+                    event = decode_event(payload)
+                except JournalError as e:
+                    log.warning("Bỏ qua sự kiện hỏng trong %s: %s", path, e)
+                    continue
+                room_id = event[1]
+                if event[0] == EVENT_FINISH:
+                    events.pop(room_id, None)
+                    self.live.pop(room_id, None)
+                else:
+                    events.setdefault(room_id, []).append(event)
+                    self.live.setdefault(room_id, []).append(payload)
+
+        # Snapshot ngay: gọn lại file và bỏ phần đuôi ghi dở
+        self.generation = generation
+        self.snapshot()
+        return events
+
+    def _latest_generation(self):
+        """Thế hệ có snapshot hoàn chỉnh mới nhất (0 nếu chưa có)"""
+        latest = 0
+        for name in os.listdir(self.directory):
+            match = FILE_PATTERN.fullmatch(name)
+            if match and match.group(1) == 'snapshot':
+                latest = max(latest, int(match.group(2)))
+        return latest
+
+    def _path(self, kind, generation):
+        return os.path.join(self.directory, f"{kind}-{generation}.log")
+
+    # ---------- Thread ghi ----------
+
+    def run(self):
+        while not self.stopped.wait(self.commit_interval):
+            try:
+                self.commit()
+                if self.since_snapshot >= self.snapshot_every:
+                    self.snapshot()
+            except OSError as e:
+                log.error("Lỗi khi ghi journal: %s", e)
+        self.commit()
+
+    def commit(self):
+        """Ghi mọi sự kiện đang chờ bằng một lần write + một lần fsync"""
+        pending = self.pending
+        if not pending:
+            return
+        buffer = bytearray()
+        live = self.live
+        count = 0
+        while pending:
+            event = pending.popleft()
+            room_id = event[1]
+            payload = encode_event(event)
+            if event[0] == EVENT_FINISH:
+                live.pop(room_id, None)
+            else:
+                live.setdefault(room_id, []).append(payload)
+            buffer += HEADER.pack(len(payload))
+            buffer += payload
+            count += 1
+
+        self.file.write(buffer)
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        self.since_snapshot += count
+
+    def snapshot(self):
+        """
+        Bắt đầu thế hệ mới: snapshot = sự kiện của các phòng đang chơi
+        Snapshot được ghi ra file tạm rồi đổi tên, nên một snapshot tồn tại
+        luôn là snapshot hoàn chỉnh; file của thế hệ cũ bị xóa sau đó
+        """
+        old_generation = self.generation
+        generation = old_generation + 1
+        snapshot_path = self._path('snapshot', generation)
+        journal_path = self._path('journal', generation)
+
+        temp_path = snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for payloads in self.live.values():
+                for payload in payloads:
+                    f.write(encode_frame(payload))
+            f.flush()
+            os.fsync(f.fileno())
+        new_file = open(journal_path, 'wb')
+        os.replace(temp_path, snapshot_path)
+        self._sync_directory()
+
+        if self.file is not None:
+            self.file.close()
+        self.file = new_file
+        self.generation = generation
+        self.since_snapshot = 0
+
+        for name in os.listdir(self.directory):
+            match = FILE_PATTERN.fullmatch(name)
+            if match and int(match.group(2)) < generation:
+                os.remove(os.path.join(self.directory, name))
+        log.info("Journal: snapshot thế hệ %d, %d phòng đang chơi", generation, len(self.live))
+
+    def _sync_directory(self):
+        # fsync thư mục để việc đổi tên snapshot cũng bền vững (chỉ Unix)
+        if not self.sync or not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def stop(self):
+        """Ghi nốt các sự kiện đang chờ rồi đóng file"""
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        if self.file is not None:
+            self.file.close()
+
+
+def restore_rooms(registry, events):
+    """
+    Dựng lại các phòng chưa kết thúc từ sự kiện của journal
+    Phòng được khôi phục chưa có session: server tạo session chờ RESUME theo
+    token ghi trong sự kiện tạo phòng
+    Trả về: list GameRoom đã khôi phục (phòng lỗi không có trong list)
+    """
+    rooms = []
+    for room_id, room_events in events.items():
+        try:
+            room = _replay_room(registry, room_id, room_events)
+        except (JournalError, ValueError, TypeError, LookupError) as e:
+            log.warning("Không khôi phục được phòng %s: %s", room_id, e)
+            room = registry.get(room_id)
+            if room is not None:
+                room.finish()
+            continue
+        rooms.append(room)
+    if events:
+        registry.advance_ids(max(events))
+    return rooms
+
+
+def _replay_room(registry, room_id, room_events):
+    kind, _, player1_name, player2_name = room_events[0][:4]
+    if kind != EVENT_CREATE:
+        raise JournalError("Thiếu sự kiện tạo phòng")
+    room = registry.create_room(None, player1_name, None, player2_name, room_id=room_id)
+
+    for event in room_events[1:]:
+        kind = event[0]
+        if kind == EVENT_SHIPS:
+            room.set_player_map(event[2], event[3])
+            if room.is_both_ready():
+                room.start_game()
+        elif kind == EVENT_SHOT:
+            _, _, player_num, x, y, seq, is_hit = event
+            if room.process_shoot(player_num, x, y, seq)[0] != is_hit:
+                raise JournalError(f"Kết quả phát bắn ({x},{y}) không khớp")
+    return room
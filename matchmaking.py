@@ -0,0 +1,361 @@
+"""
+Matchmaking - Ghép cặp người chơi
+- MatchQueue: ghép ngay khi CONNECT, thêm / lấy ra / hủy đều O(1)
+- Matchmaker: ghép theo lô mỗi tick với chiến lược thay thế được
+  (FIFO, theo rating, theo khu vực / độ trễ)
+"""
+import threading
+import time
+from collections import deque
+from serverlog import log
+
+# Khi số ô đã hủy (tombstone) trong deque vượt quá số người đang chờ + ngưỡng
+# này thì dựng lại deque để bộ nhớ không phình ra
+COMPACT_SLACK = 64
+
+class MatchQueue:
+    """
+    Hàng đợi FIFO các PlayerSession đang chờ ghép cặp
+    Hủy (cancel) không xóa khỏi deque mà đánh dấu entry là rỗng; pop() bỏ qua
+    các entry rỗng và các session đã ngắt kết nối
+    """
+
+    def __init__(self):
+        self.queue = deque()   # [entry, ...] với entry = [session] hoặc [None]
+        self.entries = {}      # {session: entry}
+        self.tombstones = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, session):
+        return session in self.entries
+
+    def push(self, session):
+        """Thêm người chơi vào cuối hàng đợi"""
+        with self.lock:
+            self._push(session)
+
+    def pop(self):
+        """Lấy người chơi còn kết nối chờ lâu nhất, hoặc None"""
+        with self.lock:
+            return self._pop()
+
+    def cancel(self, session):
+        """Xóa người chơi khỏi hàng đợi; trả về True nếu người đó đang chờ"""
+        with self.lock:
+            entry = self.entries.pop(session, None)
+            if entry is None:
+                return False
+            entry[0] = None
+            self.tombstones += 1
+            if self.tombstones > len(self.entries) + COMPACT_SLACK:
+                self._compact()
+            return True
+
+    def pair_or_push(self, session):
+        """
+        Lấy một đối thủ đang chờ; nếu không có ai thì đưa session vào hàng đợi
+        Trả về: session đối thủ, hoặc None nếu session đã được đưa vào hàng đợi
+        """
+        with self.lock:
+            opponent = self._pop()
+            if opponent is None:
+                self._push(session)
+            return opponent
+
+    def _push(self, session):
+        if session in self.entries:
+            return
+        entry = [session]
+        self.entries[session] = entry
+        self.queue.append(entry)
+
+    def _pop(self):
+        queue = self.queue
+        while queue:
+            session = queue.popleft()[0]
+            if session is None:
+                self.tombstones -= 1
+                continue
+
+            del self.entries[session]
+            # Bỏ qua session đã ngắt kết nối hoặc đã vào phòng khác
+            if session.closed or session.room is not None:
+                continue
+            return session
+        return None
+
+    def _compact(self):
+        self.queue = deque(entry for entry in self.queue if entry[0] is not None)
+        self.tombstones = 0
+
+
+# ==================== Matchmaker ghép cặp theo tick ====================
+
+# Mặc định cho người chơi chưa có thông tin
+DEFAULT_RATING = 1000
+# Chu kỳ ghép cặp (giây)
+DEFAULT_TICK_INTERVAL = 0.1
+# Chờ quá lâu thì ghép với bất kỳ ai (giây)
+DEFAULT_MAX_WAIT = 30.0
+# Số mẫu thời gian chờ giữ lại để tính phân vị
+WAIT_SAMPLES = 1024
+# Cửa sổ tính số cặp / giây (giây)
+RATE_WINDOW = 10.0
+
+ANY_DISTANCE = float('inf')
+
+
+class Ticket:
+    """Một người chơi trong hàng đợi của Matchmaker"""
+    __slots__ = ('session', 'rating', 'region', 'latency', 'enqueued_at', 'key', 'paired')
+
+    def __init__(self, session, enqueued_at):
+        self.session = session
+        self.rating = session.rating
+        self.region = session.region
+        self.latency = session.latency
+        self.enqueued_at = enqueued_at
+        self.key = None
+        self.paired = False
+
+
+class PairingStrategy:
+    """
+    Chiến lược ghép cặp: mỗi ticket thuộc một bucket (key); 2 ticket được ghép
+    nếu khoảng cách giữa 2 bucket không vượt quá mức cho phép. Mức cho phép
+    nới dần theo thời gian chờ và không giới hạn sau max_wait giây.
+    """
+    name = None
+
+    def __init__(self, relax_interval=5.0, max_relax=0, max_wait=DEFAULT_MAX_WAIT):
+        self.relax_interval = relax_interval
+        self.max_relax = max_relax
+        self.max_wait = max_wait
+
+    def bucket(self, ticket):
+        return None
+
+    def distance(self, key_a, key_b):
+        return 0
+
+    def max_distance(self, wait):
+        if wait >= self.max_wait:
+            return ANY_DISTANCE
+        return min(self.max_relax, int(wait // self.relax_interval))
+
+
+class FifoStrategy(PairingStrategy):
+    """Ai đến trước ghép trước"""
+    name = 'fifo'
+
+
+class RatingBucketStrategy(PairingStrategy):
+    """Ghép người chơi cùng khoảng rating, nới thêm 1 bucket mỗi relax_interval giây"""
+    name = 'rating'
+
+    def __init__(self, bucket_size=100, relax_interval=5.0, max_relax=5,
+                 max_wait=DEFAULT_MAX_WAIT):
+        super().__init__(relax_interval, max_relax, max_wait)
+        self.bucket_size = bucket_size
+
+    def bucket(self, ticket):
+        return int(ticket.rating // self.bucket_size)
+
+    def distance(self, key_a, key_b):
+        return abs(key_a - key_b)
+
+
+class RegionLatencyStrategy(PairingStrategy):
+    """
+    Ghép người chơi cùng khu vực và cùng mức độ trễ
+    Khác khu vực tính thêm region_penalty bậc khoảng cách
+    """
+    name = 'region'
+
+    def __init__(self, latency_step=50, region_penalty=3, relax_interval=5.0, max_relax=4,
+                 max_wait=DEFAULT_MAX_WAIT):
+        super().__init__(relax_interval, max_relax, max_wait)
+        self.latency_step = latency_step
+        self.region_penalty = region_penalty
+
+    def bucket(self, ticket):
+        latency = ticket.latency or 0
+        return (ticket.region, int(latency // self.latency_step))
+
+    def distance(self, key_a, key_b):
+        penalty = 0 if key_a[0] == key_b[0] else self.region_penalty
+        return abs(key_a[1] - key_b[1]) + penalty
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (FifoStrategy, RatingBucketStrategy, RegionLatencyStrategy)
+}
+
+
+def percentile(sorted_values, p):
+    """Phân vị p (0-100) của một list đã sắp xếp"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+    return sorted_values[index]
+
+
+class Matchmaker:
+    """
+    Hàng đợi ghép cặp theo lô: CONNECT chỉ thêm ticket (O(1)), mỗi tick ghép
+    tất cả các cặp có thể theo chiến lược rồi gọi on_match(player1, player2)
+    ngoài lock
+    """
+
+    def __init__(self, strategy, on_match):
+        self.strategy = strategy
+        self.on_match = on_match
+
+        # dict giữ thứ tự chèn = thứ tự chờ; thêm / hủy đều O(1)
+        self.tickets = {}  # {session: Ticket}
+        self.lock = threading.Lock()
+
+        # Số liệu
+        self.pairs_total = 0
+        self.pair_times = deque(maxlen=WAIT_SAMPLES * 8)   # thời điểm ghép từng cặp
+        self.wait_times = deque(maxlen=WAIT_SAMPLES)       # thời gian chờ (giây)
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def __contains__(self, session):
+        return session in self.tickets
+
+    def enqueue(self, session, now=None):
+        """Thêm người chơi vào hàng đợi"""
+        if now is None:
+            now = time.monotonic()
+        ticket = Ticket(session, now)
+        ticket.key = self.strategy.bucket(ticket)
+        with self.lock:
+            self.tickets.setdefault(session, ticket)
+
+    def cancel(self, session):
+        """Xóa người chơi khỏi hàng đợi; trả về True nếu người đó đang chờ"""
+        with self.lock:
+            return self.tickets.pop(session, None) is not None
+
+    def tick(self, now=None):
+        """
+        Ghép cặp một lượt cho toàn bộ hàng đợi
+        Trả về: số cặp đã ghép
+        """
+        if now is None:
+            now = time.monotonic()
+
+        with self.lock:
+            # Bỏ các session đã ngắt kết nối hoặc đã có phòng
+            stale = [s for s in self.tickets if s.closed or s.room is not None]
+            for session in stale:
+                del self.tickets[session]
+
+            # Độ trễ / rating có được sau khi vào hàng đợi (PONG, kho người chơi
+            # tra database về sau CONNECT): xếp lại bucket
+            for ticket in self.tickets.values():
+                session = ticket.session
+                if ticket.latency != session.latency or ticket.rating != session.rating:
+                    ticket.latency = session.latency
+                    ticket.rating = session.rating
+                    ticket.key = self.strategy.bucket(ticket)
+
+            pairs = self._pair(list(self.tickets.values()), now)
+            for first, second in pairs:
+                del self.tickets[first.session]
+                del self.tickets[second.session]
+                self.wait_times.append(now - first.enqueued_at)
+                self.wait_times.append(now - second.enqueued_at)
+                self.pair_times.append(now)
+            self.pairs_total += len(pairs)
+
+        for first, second in pairs:
+            self.on_match(first.session, second.session)
+        return len(pairs)
+
+    def _pair(self, tickets, now):
+        """Ghép các ticket (đã theo thứ tự chờ), người chờ lâu nhất được ưu tiên"""
+        strategy = self.strategy
+
+        buckets = {}  # {key: deque[Ticket]} theo thứ tự chờ
+        for ticket in tickets:
+            ticket.paired = False
+            buckets.setdefault(ticket.key, deque()).append(ticket)
+
+        pairs = []
+        for ticket in tickets:
+            if ticket.paired:
+                continue
+            allowed = strategy.max_distance(now - ticket.enqueued_at)
+
+            best = None
+            best_distance = None
+            for key, group in buckets.items():
+                distance = strategy.distance(ticket.key, key)
+                if distance > allowed:
+                    continue
+                if best is not None and distance >= best_distance:
+                    continue
+
+                # Bỏ các ticket đã ghép ở đầu bucket
+                while group and group[0].paired:
+                    group.popleft()
+                candidate = None
+                for other in group:
+                    if other is not ticket and not other.paired:
+                        candidate = other
+                        break
+                if candidate is not None:
+                    best, best_distance = candidate, distance
+
+            if best is not None:
+                ticket.paired = best.paired = True
+                pairs.append((ticket, best))
+        return pairs
+
+    def stats(self, now=None):
+        """Số liệu: người đang chờ, số cặp, cặp/giây và phân vị thời gian chờ"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            waiting = len(self.tickets)
+            pairs_total = self.pairs_total
+            recent = sum(1 for t in self.pair_times if t >= now - RATE_WINDOW)
+            waits = sorted(self.wait_times)
+
+        return {
+            'strategy': self.strategy.name,
+            'waiting': waiting,
+            'pairs_total': pairs_total,
+            'pairs_per_sec': recent / RATE_WINDOW,
+            'wait_p50': percentile(waits, 50),
+            'wait_p90': percentile(waits, 90),
+            'wait_p99': percentile(waits, 99),
+        }
+
+
+class MatchmakerTicker(threading.Thread):
+    """Thread nền gọi Matchmaker.tick() định kỳ"""
+
+    def __init__(self, matchmaker, interval=DEFAULT_TICK_INTERVAL):
+        super().__init__(name="MatchmakerTicker", daemon=True)
+        self.matchmaker = matchmaker
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.matchmaker.tick()
+            except Exception as e:
+                log.exception("Lỗi khi ghép cặp: %s", e)
+
+    def stop(self):
+        self.stopped.set()
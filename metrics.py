@@ -0,0 +1,320 @@
+"""
+Metrics - Số liệu vận hành của server theo định dạng text của Prometheus
+- Counter: đếm tăng dần (kết nối, gói tin theo lệnh, byte đã gửi, ...)
+- Gauge: giá trị tức thời, đọc qua hàm callback lúc xuất số liệu
+- CallbackCounter: counter mà tổng do đối tượng khác giữ (vd: RoomRegistry)
+- Histogram: phân bố độ trễ (accept, parse, dispatch, process_shoot, send)
+MetricsHTTPServer phục vụ GET /metrics trên một cổng cục bộ
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Mốc histogram độ trễ (giây): 1µs .. 1s
+LATENCY_BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005,
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    pairs.extend(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Gốc chung: tên, mô tả, nhãn; mỗi bộ giá trị nhãn là một child riêng"""
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.children = {}    # {label values: child}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+
+    def labels(self, *values):
+        """Child ứng với bộ giá trị nhãn (tạo mới nếu chưa có)"""
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self.children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def _render_child(self, values, child):
+        labels = _format_labels(self.labelnames, values)
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class Gauge(Metric):
+    """
+    Gauge đọc giá trị từ hàm callback khi xuất số liệu (không tốn gì trên đường nóng)
+    Có labelname thì callback trả về dict {giá trị nhãn: số}
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, callback, labelname=None):
+        self.callback = callback
+        self.labelname = labelname
+        super().__init__(name, help_text)
+
+    def _new_child(self):
+        return None
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.callback()
+        if self.labelname is None:
+            lines.append(f"{self.name} {_format_value(value)}")
+        else:
+            for key, item in sorted(value.items()):
+                labels = _format_labels((self.labelname,), (key,))
+                lines.append(f"{self.name}{labels} {_format_value(item)}")
+        return lines
+
+
+class CallbackCounter(Gauge):
+    """Counter đọc tổng từ callback khi xuất số liệu (giá trị chỉ tăng)"""
+    kind = 'counter'
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # ô cuối: > mốc lớn nhất
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def _render_child(self, values, child):
+        with child.lock:
+            counts = list(child.counts)
+            total_sum = child.sum
+
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, [f'le="{_format_value(bound)}"'])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Tập hợp các metric của server, xuất ra một khối text"""
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, callback, labelname=None):
+        return self._add(Gauge(name, help_text, callback, labelname))
+
+    def callback_counter(self, name, help_text, callback):
+        return self._add(CallbackCounter(name, help_text, callback))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServerMetrics:
+    """Bộ metric chuẩn của BattleshipServer"""
+
+    def __init__(self):
+        self.registry = registry = MetricsRegistry()
+
+        self.connections_total = registry.counter(
+            'battleship_connections_total', 'Số kết nối đã chấp nhận')
+        self.disconnections_total = registry.counter(
+            'battleship_disconnections_total', 'Số kết nối đã đóng')
+        self.messages_received = registry.counter(
+            'battleship_messages_received_total', 'Gói tin nhận được theo lệnh', ('command',))
+        self.protocol_errors = registry.counter(
+            'battleship_protocol_errors_total', 'Gói tin sai định dạng')
+        self.messages_sent = registry.counter(
+            'battleship_messages_sent_total', 'Gói tin đã gửi theo lệnh', ('command',))
+        self.bytes_sent = registry.counter(
+            'battleship_bytes_sent_total', 'Số byte đã đưa vào hàng đợi gửi')
+        self.send_errors = registry.counter(
+            'battleship_send_errors_total', 'Lỗi khi gửi tin nhắn')
+        self.slow_clients = registry.counter(
+            'battleship_slow_clients_total', 'Client bị ngắt vì hàng đợi gửi đầy')
+        self.matches_total = registry.counter(
+            'battleship_matches_total', 'Số cặp đã ghép')
+        self.games_finished = registry.counter(
+            'battleship_games_finished_total', 'Số game kết thúc có người thắng')
+        self.shots_total = registry.counter(
+            'battleship_shots_total', 'Số phát bắn theo kết quả', ('result',))
+        self.idle_disconnects = registry.counter(
+            'battleship_idle_disconnects_total', 'Kết nối bị ngắt vì im lặng quá lâu')
+        self.turn_timeouts = registry.counter(
+            'battleship_turn_timeouts_total', 'Lượt bị xử thua vì hết giờ')
+        self.spectators_total = registry.counter(
+            'battleship_spectators_total', 'Số lần SPECTATE được chấp nhận')
+        self.replays_recorded = registry.counter(
+            'battleship_replays_recorded_total', 'Số ván đã lưu vào kho replay')
+        self.replays_served = registry.counter(
+            'battleship_replays_served_total', 'Số ván đã gửi cho REPLAY')
+        self.leaderboards_served = registry.counter(
+            'battleship_leaderboards_served_total', 'Số lần trả về bảng xếp hạng (LEADERBOARD)')
+
+        self.accept_seconds = registry.histogram(
+            'battleship_accept_seconds', 'Thời gian nhận một kết nối mới')
+        self.parse_seconds = registry.histogram(
+            'battleship_parse_seconds', 'Thời gian giải mã một gói tin')
+        self.dispatch_seconds = registry.histogram(
+            'battleship_dispatch_seconds', 'Thời gian xử lý một gói tin theo lệnh', ('command',))
+        self.process_shoot_seconds = registry.histogram(
+            'battleship_process_shoot_seconds', 'Thời gian GameRoom.process_shoot')
+        self.send_seconds = registry.histogram(
+            'battleship_send_seconds', 'Thời gian mã hóa và gửi một lô tin nhắn')
+
+    def bind(self, server):
+        """Thêm các gauge đọc trạng thái của server"""
+        registry = self.registry
+        registry.gauge(
+            'battleship_connections_open', 'Số kết nối đang mở',
+            lambda: self.connections_total.children[()].value
+            - self.disconnections_total.children[()].value)
+        registry.gauge(
+            'battleship_rooms', 'Số phòng đang sống theo trạng thái',
+            lambda: server.rooms.stats()['by_state'], labelname='state')
+        registry.callback_counter(
+            'battleship_rooms_created_total', 'Số phòng đã tạo',
+            lambda: server.rooms.totals()[0])
+        registry.callback_counter(
+            'battleship_rooms_reaped_total', 'Số phòng đã kết thúc được bộ dọn giải phóng',
+            lambda: server.rooms.totals()[1])
+        registry.gauge(
+            'battleship_waiting_players', 'Số người chơi đang chờ ghép cặp',
+            lambda: len(server.matchmaker if server.matchmaker is not None
+                        else server.waiting_players))
+        matchmaker = server.matchmaker
+        if matchmaker is not None:
+            def wait_quantiles():
+                stats = matchmaker.stats()
+                return {'0.5': stats['wait_p50'], '0.9': stats['wait_p90'],
+                        '0.99': stats['wait_p99']}
+
+            registry.gauge(
+                'battleship_match_pairs_per_second', 'Số cặp ghép được mỗi giây (trung bình gần đây)',
+                lambda: matchmaker.stats()['pairs_per_sec'])
+            registry.gauge(
+                'battleship_match_wait_seconds', 'Phân vị thời gian chờ ghép cặp (giây)',
+                wait_quantiles, labelname='quantile')
+
+    def render(self):
+        return self.registry.render()
+
+
+class MetricsHTTPServer(threading.Thread):
+    """Thread nền phục vụ GET /metrics (mặc định chỉ nghe trên 127.0.0.1)"""
+
+    def __init__(self, registry, host='127.0.0.1', port=9100):
+        super().__init__(name="MetricsHTTPServer", daemon=True)
+        self.httpd = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry
+
+    def run(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,281 @@
+"""
+Outbound - Hàng đợi gửi riêng cho từng kết nối, không chặn thread gọi
+
+Thread xử lý người chơi A không bao giờ bị chặn vì socket của người chơi B chậm:
+dữ liệu được đưa vào hàng đợi của B và gửi không chặn; phần chưa gửi được sẽ do
+tầng I/O (OutboundPump ở chế độ thread, coroutine ghi ở chế độ asyncio) gửi tiếp
+khi socket ghi được. Khi hàng đợi vượt giới hạn, áp dụng chính sách:
+- drop:       bỏ tin nhắn mới
+- disconnect: ngắt kết nối client chậm
+- coalesce:   tin nhắn có key thay thế tin nhắn cùng key chưa gửi (giữ bản mới
+              nhất); nếu vẫn vượt giới hạn thì ngắt kết nối
+"""
+import select
+import selectors
+import socket
+import threading
+from collections import deque
+
+POLICY_DROP = 'drop'
+POLICY_DISCONNECT = 'disconnect'
+POLICY_COALESCE = 'coalesce'
+POLICIES = (POLICY_DROP, POLICY_DISCONNECT, POLICY_COALESCE)
+
+# Giới hạn dữ liệu chờ gửi của một kết nối (byte)
+DEFAULT_MAX_PENDING = 256 * 1024
+
+# Gửi không chặn mà không phải đổi chế độ blocking của socket (thread đọc vẫn
+# dùng recv chặn). Windows không có MSG_DONTWAIT: xem _send_when_writable
+HAS_DONTWAIT = hasattr(socket, 'MSG_DONTWAIT')
+# Không có MSG_DONTWAIT: mỗi lần chỉ gửi tối đa chừng này byte khi socket ghi được
+SEND_CHUNK = 4096
+
+
+class OutboundQueue:
+    """Hàng đợi dữ liệu (đã đóng frame) chờ gửi của một kết nối"""
+
+    __slots__ = (
+        'entries', 'keyed', 'pending_bytes', 'max_pending', 'policy',
+        'dropped', 'coalesced', 'overflowed', 'registered', 'wakeup', 'lock',
+    )
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING, policy=POLICY_DISCONNECT):
+        self.entries = deque()    # [[key, data], ...]
+        self.keyed = {}           # {key: entry} cho chính sách coalesce
+        self.pending_bytes = 0
+        self.max_pending = max_pending
+        self.policy = policy
+
+        # Số liệu
+        self.dropped = 0
+        self.coalesced = 0
+        self.overflowed = False   # đã vượt giới hạn với chính sách disconnect
+
+        # Đang được OutboundPump theo dõi (chế độ thread)
+        self.registered = False
+        # asyncio.Event đánh thức coroutine ghi (chế độ asyncio)
+        self.wakeup = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def push(self, data, key=None):
+        """
+        Thêm dữ liệu vào cuối hàng đợi (gọi khi đang giữ self.lock)
+        Trả về: False nếu client phải bị ngắt kết nối
+        """
+        if self.overflowed:
+            return False
+
+        if key is not None and self.policy == POLICY_COALESCE:
+            entry = self.keyed.get(key)
+            if entry is not None:
+                # Thay tin nhắn cũ cùng key bằng bản mới nhất
+                self.pending_bytes += len(data) - len(entry[1])
+                entry[1] = data
+                self.coalesced += 1
+                return True
+
+        if self.pending_bytes + len(data) > self.max_pending:
+            if self.policy == POLICY_DROP:
+                self.dropped += 1
+                return True
+            self.overflowed = True
+            return False
+
+        entry = [key, data]
+        self.entries.append(entry)
+        if key is not None:
+            self.keyed[key] = entry
+        self.pending_bytes += len(data)
+        return True
+
+    def take(self):
+        """Lấy toàn bộ dữ liệu đang chờ thành một buffer (gọi khi giữ self.lock)"""
+        if not self.entries:
+            return b""
+        data = b"".join(entry[1] for entry in self.entries)
+        self.entries.clear()
+        self.keyed.clear()
+        self.pending_bytes = 0
+        return data
+
+    def push_front(self, data):
+        """Trả lại phần chưa gửi được lên đầu hàng đợi (gọi khi giữ self.lock)"""
+        if data:
+            self.entries.appendleft([None, data])
+            self.pending_bytes += len(data)
+
+    def clear(self):
+        self.entries.clear()
+        self.keyed.clear()
+        self.pending_bytes = 0
+
+
+def _send_dontwait(sock, data):
+    """Gửi nhiều nhất có thể mà không chặn; trả về số byte đã gửi"""
+    try:
+        return sock.send(data, socket.MSG_DONTWAIT)
+    except (BlockingIOError, InterruptedError):
+        return 0
+
+
+def _send_when_writable(sock, data):
+    """
+    Như _send_dontwait cho hệ điều hành không có MSG_DONTWAIT: chỉ gửi khi
+    select (timeout 0) báo socket ghi được, và gửi tối đa SEND_CHUNK byte để
+    send trên socket blocking không phải chờ buffer trống
+    """
+    try:
+        _, writable, _ = select.select((), (sock,), (), 0)
+    except ValueError as e:
+        # Socket đã đóng (fileno = -1)
+        raise OSError(str(e))
+    if not writable:
+        return 0
+    try:
+        return sock.send(data[:SEND_CHUNK])
+    except (BlockingIOError, InterruptedError):
+        return 0
+
+
+send_nonblocking = _send_dontwait if HAS_DONTWAIT else _send_when_writable
+
+
+class OutboundPump(threading.Thread):
+    """
+    Thread I/O duy nhất gửi nốt dữ liệu còn tồn của mọi kết nối (chế độ thread)
+    Thread gọi send() thử gửi không chặn ngay; phần còn lại đăng ký với
+    selector và được gửi khi socket ghi được. Chỉ thread này chạm vào selector:
+    các thread khác gửi yêu cầu (đăng ký / đóng) qua hàng đợi và đánh thức nó.
+    """
+
+    def __init__(self, on_overflow):
+        super().__init__(name="OutboundPump", daemon=True)
+        # on_overflow(session): gọi khi client phải bị ngắt vì quá chậm
+        self.on_overflow = on_overflow
+
+        self.selector = selectors.DefaultSelector()
+        self.requests = deque()        # [(action, session), ...]
+        self.requests_lock = threading.Lock()
+        self.waker_r, self.waker_w = socket.socketpair()
+        self.waker_r.setblocking(False)
+        self.waker_w.setblocking(False)
+        self.selector.register(self.waker_r, selectors.EVENT_READ, None)
+        self.stopped = threading.Event()
+
+    def send(self, session, data, key=None):
+        """Gửi dữ liệu cho session mà không chặn thread gọi"""
+        queue = session.outbound
+        with queue.lock:
+            if not queue.registered and not queue.entries:
+                # Đường nhanh: hàng đợi rỗng -> thử gửi thẳng
+                sent = send_nonblocking(session.socket, data)
+                if sent == len(data):
+                    return
+                data = data[sent:]
+                key = None
+            accepted = queue.push(data, key)
+            need_register = accepted and not queue.registered
+            if need_register:
+                queue.registered = True
+
+        if not accepted:
+            self.on_overflow(session)
+        elif need_register:
+            self._request('register', session)
+
+    def close(self, session):
+        """
+        Bỏ dữ liệu còn tồn và đóng socket của session
+        Nếu socket đang nằm trong selector thì để thread I/O hủy đăng ký rồi
+        mới đóng, tránh số fd bị dùng lại khi selector vẫn còn giữ nó
+        """
+        queue = session.outbound
+        with queue.lock:
+            queue.clear()
+            registered = queue.registered
+        if registered:
+            self._request('close', session)
+        else:
+            _close_socket(session.socket)
+
+    def _request(self, action, session):
+        with self.requests_lock:
+            self.requests.append((action, session))
+        try:
+            self.waker_w.send(b"\0")
+        except OSError:
+            pass
+
+    def run(self):
+        while not self.stopped.is_set():
+            for key, _ in self.selector.select(timeout=1.0):
+                if key.data is None:
+                    self._drain_waker()
+                else:
+                    self._flush(key.data)
+            self._handle_requests()
+
+    def _drain_waker(self):
+        try:
+            while self.waker_r.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def _handle_requests(self):
+        with self.requests_lock:
+            requests = list(self.requests)
+            self.requests.clear()
+
+        for action, session in requests:
+            if action == 'register':
+                try:
+                    self.selector.register(session.socket, selectors.EVENT_WRITE, session)
+                except (KeyError, ValueError, OSError):
+                    # Đã đăng ký hoặc socket đã đóng
+                    pass
+            else:
+                self._unregister(session)
+                with session.outbound.lock:
+                    session.outbound.registered = False
+                _close_socket(session.socket)
+
+    def _unregister(self, session):
+        try:
+            self.selector.unregister(session.socket)
+        except (KeyError, ValueError, OSError):
+            pass
+
+    def _flush(self, session):
+        queue = session.outbound
+        with queue.lock:
+            data = queue.take()
+            try:
+                sent = send_nonblocking(session.socket, data)
+            except OSError:
+                # Kết nối hỏng: thread đọc của client sẽ tự phát hiện và dọn
+                sent = len(data)
+            queue.push_front(data[sent:])
+            done = not queue.entries
+            if done:
+                queue.registered = False
+
+        if done:
+            self._unregister(session)
+
+    def stop(self):
+        self.stopped.set()
+        try:
+            self.waker_w.send(b"\0")
+        except OSError:
+            pass
+
+
+def _close_socket(sock):
+    try:
+        sock.close()
+    except OSError:
+        pass
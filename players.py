@@ -0,0 +1,335 @@
+"""
+Players - Kho thông tin người chơi (SQLite): số ván thắng / thua và rating Elo
+
+- Mỗi ván kết thúc có người thắng (GAME_OVER) chỉ đưa một tuple vào hàng đợi;
+  thread nền gom các ván đang chờ và cập nhật trong một transaction cho cả lô
+  (giống group commit của journal.py)
+- Rating được đọc lại trong chính transaction ghi (BEGIN IMMEDIATE), nên nhiều
+  process (worker / node) dùng chung một file vẫn không mất cập nhật
+- Bảng xếp hạng (LEADERBOARD) đọc từ TopIndex trong bộ nhớ, cập nhật dần theo
+  từng ván; chỉ khi index hụt dưới số người tối đa cần trả về mới đọc lại top
+  từ index rating của bảng (LIMIT, không quét bảng)
+- Rating lúc CONNECT đọc từ RatingCache trong bộ nhớ (LRU các người chơi gần
+  đây, không truy vấn SQLite trên thread / event loop xử lý client). Người chưa
+  có trong cache được thread nền tra ở lô kế tiếp; mỗi refresh_interval thread
+  nền chỉ đọc lại rating của những người trong cache để thấy ván do process khác ghi
+"""
+import bisect
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from matchmaking import DEFAULT_RATING
+from serverlog import log
+
+# Chu kỳ ghi một lô (giây)
+DEFAULT_COMMIT_INTERVAL = 0.05
+# Số người tối đa / mặc định trả về cho LEADERBOARD
+DEFAULT_TOP_SIZE = 100
+DEFAULT_LEADERBOARD_SIZE = 10
+# Index giữ gấp đôi số người tối đa: người trong top bị tụt hạng làm index co
+# lại, chỉ khi còn ít hơn DEFAULT_TOP_SIZE người mới phải nạp lại từ database
+TOP_INDEX_FACTOR = 2
+# Chu kỳ đọc lại top từ database (giây): thấy cả ván do process khác ghi
+DEFAULT_REFRESH_INTERVAL = 5.0
+# Số người chơi tối đa giữ rating trong bộ nhớ (LRU)
+DEFAULT_RATING_CACHE = 10_000
+# Số tên mỗi truy vấn IN (...) (SQLite giới hạn số tham số của một câu lệnh)
+LOOKUP_CHUNK = 500
+# Hệ số K của Elo: mức thay đổi rating tối đa sau một ván
+K_FACTOR = 32
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS players (
+        name TEXT PRIMARY KEY,
+        rating REAL NOT NULL,
+        wins INTEGER NOT NULL DEFAULT 0,
+        losses INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS players_by_rating ON players (rating DESC)",
+)
+SELECT_PLAYER = "SELECT rating, wins, losses FROM players WHERE name = ?"
+SELECT_TOP = "SELECT name, rating, wins, losses FROM players ORDER BY rating DESC LIMIT ?"
+SELECT_RATINGS = "SELECT name, rating FROM players WHERE name IN ({})"
+UPSERT_PLAYER = (
+    "INSERT INTO players (name, rating, wins, losses) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (name) DO UPDATE SET "
+    "rating = excluded.rating, wins = excluded.wins, losses = excluded.losses"
+)
+
+
+def elo_update(winner_rating, loser_rating, k=K_FACTOR):
+    """Rating mới (người thắng, người thua) sau một ván"""
+    expected = 1.0 / (1.0 + 10 ** ((loser_rating - winner_rating) / 400.0))
+    change = k * (1.0 - expected)
+    return winner_rating + change, loser_rating - change
+
+
+class TopIndex:
+    """
+    Top người chơi theo rating, sắp xếp sẵn (cao -> thấp)
+    Luôn là top chính xác của len(entries) người đứng đầu: người rơi khỏi
+    index không được thay bằng ai (không biết người kế tiếp) nên index co lại
+    tới khi được nạp lại từ database. Không gọi đồng thời (PlayerStore giữ lock)
+    """
+
+    def __init__(self, capacity=DEFAULT_TOP_SIZE):
+        self.capacity = capacity
+        self.keys = []       # [(-rating, tên), ...] tăng dần = rating giảm dần
+        self.stats = {}      # {tên: (rating, thắng, thua)}
+        # True khi index chứa mọi người chơi (bảng có ít hơn capacity người)
+        self.complete = False
+
+    def __len__(self):
+        return len(self.keys)
+
+    def load(self, rows):
+        """Nạp lại từ kết quả SELECT_TOP (đã sắp xếp theo rating giảm dần)"""
+        self.keys = [(-rating, name) for name, rating, _, _ in rows]
+        self.keys.sort()
+        self.stats = {name: (rating, wins, losses) for name, rating, wins, losses in rows}
+        self.complete = len(rows) < self.capacity
+
+    def update(self, name, rating, wins, losses):
+        """Rating / thành tích mới của một người chơi: O(log n) tìm + O(n) dịch list"""
+        keys = self.keys
+        # Người ngoài index có rating không cao hơn người cuối (tính trước khi bỏ tên này)
+        boundary = keys[-1] if keys else None
+        old = self.stats.pop(name, None)
+        if old is not None:
+            del keys[bisect.bisect_left(keys, (-old[0], name))]
+
+        key = (-rating, name)
+        # Chỉ thêm khi chắc chắn thuộc top: cao hơn người cuối, hoặc index đang
+        # chứa mọi người chơi
+        if not (self.complete or (boundary is not None and key < boundary)):
+            self.complete = False
+            return
+        bisect.insort(keys, key)
+        self.stats[name] = (rating, wins, losses)
+        if len(keys) > self.capacity:
+            _, dropped = keys.pop()
+            del self.stats[dropped]
+            self.complete = False
+
+    def top(self, count):
+        """[(tên, rating, thắng, thua), ...] của count người đứng đầu"""
+        return [(name,) + self.stats[name] for _, name in self.keys[:count]]
+
+
+class RatingCache:
+    """
+    Rating của các người chơi gần đây (vừa CONNECT hoặc vừa chơi), tối đa
+    capacity người; đầy thì bỏ người lâu không dùng nhất. Không gọi đồng thời
+    (PlayerStore giữ lock)
+    """
+
+    def __init__(self, capacity=DEFAULT_RATING_CACHE):
+        self.capacity = capacity
+        self.ratings = OrderedDict()   # {tên: rating}, cũ -> mới
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def get(self, name):
+        """Rating trong cache (đánh dấu vừa dùng), hoặc None"""
+        rating = self.ratings.get(name)
+        if rating is not None:
+            self.ratings.move_to_end(name)
+        return rating
+
+    def put(self, name, rating):
+        self.ratings[name] = rating
+        self.ratings.move_to_end(name)
+        if len(self.ratings) > self.capacity:
+            self.ratings.popitem(last=False)
+
+    def refresh(self, name, rating):
+        """Cập nhật rating đọc lại từ database (người đã rời cache thì bỏ qua)"""
+        if name in self.ratings:
+            self.ratings[name] = rating
+
+    def names(self):
+        return list(self.ratings)
+
+
+class PlayerStore(threading.Thread):
+    """
+    Thread nền ghi kết quả các ván vào SQLite theo lô
+    Gọi open() trước start()
+    """
+
+    def __init__(self, path, commit_interval=DEFAULT_COMMIT_INTERVAL,
+                 top_size=DEFAULT_TOP_SIZE, refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                 rating_cache_size=DEFAULT_RATING_CACHE):
+        super().__init__(name="PlayerStore", daemon=True)
+        self.path = path
+        self.commit_interval = commit_interval
+        self.refresh_interval = refresh_interval
+
+        # deque.append / popleft an toàn giữa các thread, không cần lock
+        self.pending = deque()
+        self.lookups = deque()   # (tên, callback) chờ thread nền tra rating
+        self.stopped = threading.Event()
+
+        # Kết nối database: chỉ thread nền dùng (sau open())
+        self.db = None
+        # Rating và index bảng xếp hạng, giữ lock khi đọc / ghi
+        self.ratings = RatingCache(rating_cache_size)
+        self.top_size = top_size
+        self.top_index = TopIndex(top_size * TOP_INDEX_FACTOR)
+        self.lock = threading.Lock()
+        self.refreshed_at = 0.0
+
+    # ---------- Gọi từ thread xử lý client ----------
+
+    def game_over(self, winner_name, loser_name):
+        """Ghi nhận một ván có người thắng (ghi vào database ở lô kế tiếp)"""
+        if winner_name != loser_name:
+            self.pending.append((winner_name, loser_name))
+
+    def rating(self, name, callback=None):
+        """
+        Rating đã lưu của người chơi (DEFAULT_RATING nếu chưa chơi ván nào)
+        Chưa có trong cache: trả về DEFAULT_RATING, thread nền tra database ở lô
+        kế tiếp rồi gọi callback(rating)
+        """
+        with self.lock:
+            rating = self.ratings.get(name)
+        if rating is not None:
+            return rating
+        self.lookups.append((name, callback))
+        return DEFAULT_RATING
+
+    def leaderboard(self, count=DEFAULT_LEADERBOARD_SIZE):
+        """[(tên, rating, thắng, thua), ...] của count người đứng đầu"""
+        with self.lock:
+            return self.top_index.top(count)
+
+    # ---------- Khởi động ----------
+
+    def open(self):
+        """Tạo bảng (nếu chưa có) và nạp bảng xếp hạng"""
+        # Thread nền dùng kết nối này; chỉ một thread dùng tại một thời điểm
+        self.db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        # WAL: kết nối đọc không bị chặn khi đang ghi một lô
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.refresh()
+        log.info("Kho người chơi tại %s: %d người trong bảng xếp hạng",
+                 self.path, len(self.top_index))
+
+    # ---------- Thread ghi ----------
+
+    def run(self):
+        while not self.stopped.wait(self.commit_interval):
+            try:
+                self.commit()
+                self.load_lookups()
+                if time.monotonic() - self.refreshed_at >= self.refresh_interval:
+                    self.refresh()
+                    self.refresh_ratings()
+            except sqlite3.Error as e:
+                log.error("Lỗi khi ghi kho người chơi: %s", e)
+        self.commit()
+
+    def commit(self):
+        """Cập nhật mọi ván đang chờ trong một transaction"""
+        pending = self.pending
+        if not pending:
+            return
+        games = []
+        while pending:
+            games.append(pending.popleft())
+
+        db = self.db
+        rows = {}   # {tên: [rating, thắng, thua]} của lô này
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for winner_name, loser_name in games:
+                    winner = self._load(rows, winner_name)
+                    loser = self._load(rows, loser_name)
+                    winner[0], loser[0] = elo_update(winner[0], loser[0])
+                    winner[1] += 1
+                    loser[2] += 1
+                db.executemany(UPSERT_PLAYER, [(name,) + tuple(row) for name, row in rows.items()])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            # Lô chưa được ghi: đưa lại lên đầu hàng đợi (giữ thứ tự) để thử ở lô sau
+            pending.extendleft(reversed(games))
+            raise
+
+        with self.lock:
+            ratings = self.ratings
+            top_index = self.top_index
+            for name, (rating, wins, losses) in rows.items():
+                ratings.put(name, rating)
+                top_index.update(name, rating, wins, losses)
+            refill = len(top_index) < self.top_size and not top_index.complete
+        if refill:
+            self.refresh()
+
+    def _load(self, rows, name):
+        row = rows.get(name)
+        if row is None:
+            found = self.db.execute(SELECT_PLAYER, (name,)).fetchone()
+            row = rows[name] = list(found) if found is not None else [DEFAULT_RATING, 0, 0]
+        return row
+
+    def refresh(self):
+        """Nạp lại bảng xếp hạng từ index rating (các dòng đầu, đủ cho TopIndex)"""
+        rows = self.db.execute(SELECT_TOP, (self.top_index.capacity,)).fetchall()
+        with self.lock:
+            self.top_index.load(rows)
+        self.refreshed_at = time.monotonic()
+
+    def load_lookups(self):
+        """Tra rating của những người rating() chưa thấy trong cache, rồi gọi callback"""
+        lookups = self.lookups
+        if not lookups:
+            return
+        requests = []
+        while lookups:
+            requests.append(lookups.popleft())
+
+        found = self._select_ratings({name for name, _ in requests})
+        with self.lock:
+            for name, _ in requests:
+                self.ratings.put(name, found.get(name, DEFAULT_RATING))
+        for name, callback in requests:
+            if callback is not None and name in found:
+                callback(found[name])
+
+    def refresh_ratings(self):
+        """Đọc lại rating của những người trong cache (thấy cả ván do process khác ghi)"""
+        with self.lock:
+            names = self.ratings.names()
+        found = self._select_ratings(names)
+        with self.lock:
+            for name, rating in found.items():
+                self.ratings.refresh(name, rating)
+
+    def _select_ratings(self, names):
+        """{tên: rating} của các người chơi đã có trong database"""
+        names = list(names)
+        found = {}
+        for start in range(0, len(names), LOOKUP_CHUNK):
+            chunk = names[start:start + LOOKUP_CHUNK]
+            query = SELECT_RATINGS.format(", ".join("?" * len(chunk)))
+            found.update(self.db.execute(query, chunk))
+        return found
+
+    def stop(self):
+        """Ghi nốt các ván đang chờ rồi đóng database"""
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        if self.db is not None:
+            self.db.close()
@@ -0,0 +1,468 @@
+"""
+Protocol - Mã hóa / giải mã gói tin giữa server và client
+Dùng chung cho server.py, client.py và client_gui.py
+
+Một gói tin được biểu diễn trong code là tuple (COMMAND, field1, field2, ...).
+Có 2 cách mã hóa (codec), chọn lúc CONNECT:
+- text:   "COMMAND|field1|field2" (UTF-8), tọa độ dạng "x,y", SETUP là JSON
+          (mỗi tàu một list ô)
+- binary: 1 byte opcode + các field đóng gói:
+          tọa độ = 1 byte (y*10 + x), token (HIT/MISS/...) = 1 byte,
+          mỗi tàu của SETUP = 2 byte (ô đầu + độ dài / hướng), số thứ tự = 4 byte,
+          chuỗi = UTF-8 tới hết gói, dữ liệu nhị phân (BLOB) = nguyên byte tới hết gói
+
+Gói CONNECT luôn ở dạng text: "CONNECT|username" hoặc "CONNECT|username|binary",
+có thể kèm khu vực (dùng khi ghép cặp theo khu vực): "CONNECT|username|text|eu".
+Gói RESUME (kết nối lại bằng token phiên) cũng vậy: "RESUME|token|binary",
+gói SPECTATE (xem một phòng): "SPECTATE|room_id|binary", gói REPLAY (xem lại
+ván đã lưu): "REPLAY|room_id|binary" và gói LEADERBOARD: "LEADERBOARD|10|binary".
+Sau gói đầu tiên, mọi gói tin (cả 2 chiều) dùng codec đã chọn.
+"""
+import json
+import re
+import struct
+from bitboard import BOARD_SIZE, BOARD_CELLS, bitboard_to_cells, cells_to_bitboard, in_bounds
+
+BOARD_BYTES = (BOARD_CELLS + 7) // 8
+BOARD_HEX_DIGITS = (BOARD_CELLS + 3) // 4
+
+# Độ dài tối đa của tên khu vực trong CONNECT
+MAX_REGION_LENGTH = 32
+# Giới hạn độ dài chuỗi JSON của SETUP: đội tàu 17 ô * "[9, 9], " + ngoặc của 5 tàu ~ 160 ký tự
+MAX_SETUP_TEXT = 256
+# Chuỗi SETUP chỉ được chứa số, ngoặc vuông, dấu phẩy và khoảng trắng
+SETUP_TEXT_PATTERN = re.compile(r"\[[\[\]0-9, ]*\]")
+
+# Byte thứ 2 của một tàu trong SETUP (binary): độ dài ở 7 bit thấp, bit cao = tàu dọc
+SHIP_VERTICAL = 0x80
+SHIP_SIZE_MASK = 0x7F
+
+# Số thứ tự (SEQ): số nguyên không dấu 32 bit
+SEQ_STRUCT = struct.Struct('>I')
+MAX_SEQ = 2**32 - 1
+
+
+class ProtocolError(ValueError):
+    """Gói tin sai định dạng"""
+
+
+def _check_cell(x, y):
+    if not in_bounds(x, y):
+        raise ProtocolError(f"Tọa độ ngoài bảng: ({x},{y})")
+
+
+# ==================== Định nghĩa gói tin ====================
+
+# Kiểu field
+STR = 'str'        # chuỗi (chỉ được là field cuối cùng)
+COORD = 'coord'    # tọa độ (x, y)
+TOKEN = 'token'    # một giá trị trong danh sách token cố định của gói tin
+CELLS = 'cells'    # danh sách ô tàu [(x, y), ...]
+SHIPS = 'ships'    # danh sách tàu, mỗi tàu một list ô [[(x, y), ...], ...] (chỉ được là field cuối)
+SEQ = 'seq'        # số thứ tự do client đặt (0 .. MAX_SEQ)
+BOARD = 'board'    # bitboard 100 bit (text: số hex, binary: 13 byte)
+BLOB = 'blob'      # dữ liệu nhị phân (text: hex, binary: nguyên byte; chỉ được là field cuối)
+
+
+class MessageSpec:
+    """
+    Mô tả một loại gói tin: opcode, kiểu các field, danh sách token
+    optional: số field cuối có thể bỏ trống (giải mã thành None)
+    """
+    __slots__ = ('command', 'opcode', 'fields', 'tokens', 'token_index', 'required')
+
+    def __init__(self, command, opcode, fields, tokens=(), optional=0):
+        self.command = command
+        self.opcode = opcode
+        self.fields = fields
+        self.tokens = tokens
+        self.token_index = {token: i for i, token in enumerate(tokens)}
+        self.required = len(fields) - optional
+
+
+SPECS = [
+    # Client -> Server
+    # CONNECT|username|codec|region: khu vực tùy chọn
+    MessageSpec("CONNECT", 0x01, (STR, STR, STR), optional=1),
+    # SETUP|[[[x,y],...],...]: mỗi tàu một list ô, để server biết ranh giới các tàu nằm sát nhau
+    MessageSpec("SETUP", 0x02, (SHIPS,)),
+    # SHOOT|x,y|seq: seq (tùy chọn) để server nhận ra phát bắn gửi lại
+    MessageSpec("SHOOT", 0x03, (COORD, SEQ), optional=1),
+    # RESUME|token|codec: nhận lại phiên (và phòng) sau khi rớt mạng
+    MessageSpec("RESUME", 0x04, (STR, STR), optional=1),
+    # Heartbeat (cả 2 chiều): bên nhận PING trả lời PONG
+    MessageSpec("PING", 0x05, ()),
+    MessageSpec("PONG", 0x06, ()),
+    # SPECTATE|room_id|codec: xem một phòng đang chơi
+    MessageSpec("SPECTATE", 0x07, (STR, STR), optional=1),
+    # REPLAY|room_id hoặc REPLAY|tên người chơi (|codec): xem lại ván đã kết thúc
+    MessageSpec("REPLAY", 0x08, (STR, STR), optional=1),
+    # LEADERBOARD|số người|codec: bảng xếp hạng (cả 2 tham số đều tùy chọn)
+    MessageSpec("LEADERBOARD", 0x09, (SEQ, STR), optional=2),
+    # Server -> Client
+    MessageSpec("WAITING", 0x10, (STR,)),
+    MessageSpec("MATCH_FOUND", 0x11, (STR,)),
+    MessageSpec("GAME_START", 0x12, (TOKEN,), ("YOUR_TURN", "WAIT")),
+    MessageSpec("RESULT", 0x13, (TOKEN, COORD), ("HIT", "MISS")),
+    MessageSpec("OPPONENT_SHOOT", 0x14, (TOKEN, COORD), ("HIT", "MISS")),
+    MessageSpec("TURN", 0x15, (TOKEN,), ("YOUR_TURN",)),
+    MessageSpec("GAME_OVER", 0x16, (TOKEN,), ("WIN", "LOSE")),
+    MessageSpec("OPPONENT_DISCONNECTED", 0x17, (STR,)),
+    MessageSpec("ERROR", 0x18, (STR,)),
+    # Tàu bị bắn chìm: các ô của tàu + tên tàu
+    MessageSpec("SUNK", 0x19, (CELLS, STR)),            # gửi người bắn
+    MessageSpec("OPPONENT_SUNK", 0x1A, (CELLS, STR)),   # gửi người bị bắn
+    # Token phiên, gửi ngay sau CONNECT (dùng cho RESUME)
+    MessageSpec("SESSION", 0x1B, (STR,)),
+    # Trạng thái phòng sau RESUME: giai đoạn, tàu của mình, các ô đối thủ đã
+    # bắn vào mình, các ô mình bắn trúng / trượt, các ô tàu đối thủ đã chìm,
+    # tên đối thủ
+    MessageSpec("RESUMED", 0x1C, (TOKEN, BOARD, BOARD, BOARD, BOARD, BOARD, STR),
+                ("SETUP", "READY", "YOUR_TURN", "WAIT")),
+    # Gửi người xem: tên người chơi 1 / 2 của phòng đang xem
+    MessageSpec("WATCHING", 0x1D, (TOKEN, STR), ("1", "2")),
+    # Gửi người xem: giai đoạn, rồi với bảng của player 1 và player 2: các ô
+    # bị bắn trúng, bị bắn trượt, ô tàu đã chìm (không lộ tàu chưa bị bắn)
+    MessageSpec("WATCH", 0x1E, (TOKEN, BOARD, BOARD, BOARD, BOARD, BOARD, BOARD),
+                ("SETUP", "TURN1", "TURN2", "WIN1", "WIN2", "ENDED")),
+    # Một ván đã lưu (bản ghi nguyên dạng trong kho replay, xem replay.py)
+    MessageSpec("REPLAY_DATA", 0x1F, (BLOB,)),
+    # Hết kết quả REPLAY: số ván đã gửi
+    MessageSpec("REPLAY_END", 0x20, (STR,)),
+    # Một dòng của bảng xếp hạng: hạng, rating, số ván thắng, số ván thua, tên
+    MessageSpec("RANK", 0x21, (SEQ, SEQ, SEQ, SEQ, STR)),
+    # Hết bảng xếp hạng: số dòng đã gửi
+    MessageSpec("LEADERBOARD_END", 0x22, (STR,)),
+]
+
+SPECS_BY_COMMAND = {spec.command: spec for spec in SPECS}
+SPECS_BY_OPCODE = {spec.opcode: spec for spec in SPECS}
+
+
+def _get_spec(command):
+    spec = SPECS_BY_COMMAND.get(command)
+    if spec is None:
+        raise ProtocolError(f"Lệnh không hợp lệ: {command}")
+    return spec
+
+
+# ==================== Codec text ====================
+
+class TextCodec:
+    """Định dạng gốc: COMMAND|DATA (UTF-8)"""
+    name = 'text'
+
+    def encode(self, message):
+        command = message[0]
+        spec = _get_spec(command)
+        parts = [command]
+        for field_type, value in zip(spec.fields, message[1:]):
+            if value is None:
+                break
+            if field_type == COORD:
+                parts.append(f"{value[0]},{value[1]}")
+            elif field_type == CELLS:
+                parts.append(json.dumps([[x, y] for x, y in value]))
+            elif field_type == SHIPS:
+                parts.append(json.dumps([[[x, y] for x, y in ship] for ship in value]))
+            elif field_type == BOARD:
+                parts.append(format(value, 'x'))
+            elif field_type == BLOB:
+                parts.append(value.hex())
+            else:
+                parts.append(str(value))
+        return "|".join(parts).encode('utf-8')
+
+    def decode(self, payload):
+        """Trả về: (command, fields)"""
+        if isinstance(payload, (bytes, bytearray)):
+            try:
+                payload = payload.decode('utf-8')
+            except UnicodeDecodeError as e:
+                raise ProtocolError(f"Gói tin không phải UTF-8: {e}")
+
+        command, _, data = payload.partition('|')
+        spec = _get_spec(command)
+
+        if command == "CONNECT":
+            # "CONNECT|name", "CONNECT|name|codec" hoặc "CONNECT|name|codec|region"
+            # (tên có thể chứa '|')
+            head, _, last = data.rpartition('|')
+            if last in CODECS:
+                return command, (head, last, None)
+            username, _, codec_name = head.rpartition('|')
+            if codec_name in CODECS:
+                if len(last) > MAX_REGION_LENGTH:
+                    raise ProtocolError(f"Tên khu vực quá dài: {len(last)} ký tự")
+                return command, (username, codec_name, last or None)
+            return command, (data, TEXT_CODEC.name, None)
+
+        field_count = len(spec.fields)
+        if not data and not spec.required:
+            # Không có tham số (PING / PONG, LEADERBOARD không kèm số người)
+            return command, (None,) * field_count
+        if not field_count:
+            raise ProtocolError(f"Sai số lượng tham số cho {command}")
+        parts = data.split('|', field_count - 1)
+        if not spec.required <= len(parts) <= field_count:
+            raise ProtocolError(f"Sai số lượng tham số cho {command}")
+
+        fields = []
+        for field_type, part in zip(spec.fields, parts):
+            if field_type == COORD:
+                try:
+                    x, y = map(int, part.split(','))
+                except ValueError:
+                    raise ProtocolError(f"Tọa độ không hợp lệ: {part}")
+                _check_cell(x, y)
+                fields.append((x, y))
+            elif field_type == CELLS:
+                fields.append(self._decode_cells(part))
+            elif field_type == SHIPS:
+                fields.append(self._decode_ships(part))
+            elif field_type == TOKEN:
+                if part not in spec.token_index:
+                    raise ProtocolError(f"Giá trị không hợp lệ cho {command}: {part}")
+                fields.append(part)
+            elif field_type == SEQ:
+                if not (part.isascii() and part.isdigit()) or int(part) > MAX_SEQ:
+                    raise ProtocolError(f"Số thứ tự không hợp lệ: {part}")
+                fields.append(int(part))
+            elif field_type == BOARD:
+                fields.append(self._decode_board(part))
+            elif field_type == BLOB:
+                try:
+                    fields.append(bytes.fromhex(part))
+                except ValueError:
+                    raise ProtocolError(f"Dữ liệu hex không hợp lệ cho {command}")
+            else:
+                fields.append(part)
+        fields.extend([None] * (field_count - len(parts)))
+        return command, tuple(fields)
+
+    def _decode_board(self, text):
+        if not (text.isascii() and text.isalnum()) or len(text) > BOARD_HEX_DIGITS:
+            raise ProtocolError(f"Bitmap không hợp lệ: {text}")
+        try:
+            board = int(text, 16)
+        except ValueError:
+            raise ProtocolError(f"Bitmap không hợp lệ: {text}")
+        if board >> BOARD_CELLS:
+            raise ProtocolError("Bitmap có bit ngoài bảng")
+        return board
+
+    def _load_json(self, text):
+        # Từ chối payload quá lớn hoặc có ký tự lạ trước khi đưa vào json.loads
+        if len(text) > MAX_SETUP_TEXT:
+            raise ProtocolError("Danh sách ô quá lớn")
+        if not SETUP_TEXT_PATTERN.fullmatch(text):
+            raise ProtocolError("Danh sách ô không hợp lệ")
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            raise ProtocolError(f"Danh sách ô không hợp lệ: {e}")
+
+    def _decode_cells(self, text):
+        try:
+            cells = [(int(x), int(y)) for x, y in self._load_json(text)]
+        except (ValueError, TypeError) as e:
+            raise ProtocolError(f"Danh sách ô không hợp lệ: {e}")
+        for x, y in cells:
+            _check_cell(x, y)
+        return cells
+
+    def _decode_ships(self, text):
+        try:
+            ships = [[(int(x), int(y)) for x, y in ship] for ship in self._load_json(text)]
+        except (ValueError, TypeError) as e:
+            raise ProtocolError(f"Dữ liệu SETUP không hợp lệ (mỗi tàu một list ô): {e}")
+        for ship in ships:
+            for x, y in ship:
+                _check_cell(x, y)
+        return ships
+
+
+# ==================== Codec binary ====================
+
+def _encode_ship(cells):
+    """Tàu (list ô thẳng hàng, liền nhau) -> 2 byte: ô đầu, độ dài | cờ dọc"""
+    cells = sorted(cells, key=lambda cell: (cell[1], cell[0]))
+    if not cells or len(cells) > SHIP_SIZE_MASK:
+        raise ProtocolError("Tàu không hợp lệ")
+    x, y = cells[0]
+    vertical = len(cells) > 1 and cells[1][0] == x
+    expected = [(x, y + i) if vertical else (x + i, y) for i in range(len(cells))]
+    if cells != expected:
+        raise ProtocolError("Tàu phải nằm thẳng và liền nhau")
+    return bytes((y * BOARD_SIZE + x, len(cells) | (SHIP_VERTICAL if vertical else 0)))
+
+
+def _decode_ship(head, flags):
+    """2 byte -> list ô của tàu"""
+    length = flags & SHIP_SIZE_MASK
+    if head >= BOARD_CELLS or not length:
+        raise ProtocolError("Tàu không hợp lệ")
+    y, x = divmod(head, BOARD_SIZE)
+    if flags & SHIP_VERTICAL:
+        cells = [(x, y + i) for i in range(length)]
+    else:
+        cells = [(x + i, y) for i in range(length)]
+    for cx, cy in cells:
+        _check_cell(cx, cy)
+    return cells
+
+
+class BinaryCodec:
+    """Định dạng nhị phân gọn: 1 byte opcode + field đóng gói"""
+    name = 'binary'
+
+    def encode(self, message):
+        spec = _get_spec(message[0])
+        buffer = bytearray((spec.opcode,))
+        for field_type, value in zip(spec.fields, message[1:]):
+            if value is None:
+                break
+            if field_type == COORD:
+                buffer.append(value[1] * BOARD_SIZE + value[0])
+            elif field_type == TOKEN:
+                buffer.append(spec.token_index[value])
+            elif field_type == CELLS:
+                buffer += cells_to_bitboard(value).to_bytes(BOARD_BYTES, 'little')
+            elif field_type == SHIPS:
+                for ship in value:
+                    buffer += _encode_ship(ship)
+            elif field_type == SEQ:
+                buffer += SEQ_STRUCT.pack(value)
+            elif field_type == BOARD:
+                buffer += value.to_bytes(BOARD_BYTES, 'little')
+            elif field_type == BLOB:
+                buffer += value
+            else:
+                buffer += str(value).encode('utf-8')
+        return bytes(buffer)
+
+    def decode(self, payload):
+        """Trả về: (command, fields)"""
+        if not payload:
+            raise ProtocolError("Gói tin rỗng")
+
+        spec = SPECS_BY_OPCODE.get(payload[0])
+        if spec is None:
+            raise ProtocolError(f"Opcode không hợp lệ: {payload[0]}")
+
+        fields = []
+        pos = 1
+        size = len(payload)
+        try:
+            for field_type in spec.fields:
+                if pos == size and len(fields) >= spec.required:
+                    # Các field tùy chọn ở cuối bị bỏ trống
+                    fields.append(None)
+                    continue
+                if field_type == COORD:
+                    index = payload[pos]
+                    if index >= BOARD_CELLS:
+                        raise ProtocolError(f"Tọa độ ngoài bảng: {index}")
+                    y, x = divmod(index, BOARD_SIZE)
+                    fields.append((x, y))
+                    pos += 1
+                elif field_type == TOKEN:
+                    fields.append(spec.tokens[payload[pos]])
+                    pos += 1
+                elif field_type == CELLS or field_type == BOARD:
+                    chunk = payload[pos:pos + BOARD_BYTES]
+                    if len(chunk) != BOARD_BYTES:
+                        raise ProtocolError("Bitmap bị thiếu")
+                    bitmap = int.from_bytes(chunk, 'little')
+                    if bitmap >> BOARD_CELLS:
+                        raise ProtocolError("Bitmap có bit ngoài bảng")
+                    fields.append(bitboard_to_cells(bitmap) if field_type == CELLS else bitmap)
+                    pos += BOARD_BYTES
+                elif field_type == SEQ:
+                    if size < pos + SEQ_STRUCT.size:
+                        raise IndexError
+                    fields.append(SEQ_STRUCT.unpack_from(payload, pos)[0])
+                    pos += SEQ_STRUCT.size
+                elif field_type == SHIPS:
+                    if (size - pos) % 2:
+                        raise IndexError
+                    fields.append([_decode_ship(payload[i], payload[i + 1])
+                                   for i in range(pos, size, 2)])
+                    pos = size
+                elif field_type == BLOB:
+                    fields.append(bytes(payload[pos:]))
+                    pos = size
+                else:
+                    fields.append(bytes(payload[pos:]).decode('utf-8'))
+                    pos = size
+        except IndexError:
+            raise ProtocolError(f"Gói tin {spec.command} bị thiếu dữ liệu")
+        except UnicodeDecodeError as e:
+            raise ProtocolError(f"Chuỗi không phải UTF-8: {e}")
+
+        if pos != size:
+            raise ProtocolError(f"Gói tin {spec.command} thừa dữ liệu")
+        return spec.command, tuple(fields)
+
+
+TEXT_CODEC = TextCodec()
+BINARY_CODEC = BinaryCodec()
+
+CODECS = {
+    TEXT_CODEC.name: TEXT_CODEC,
+    BINARY_CODEC.name: BINARY_CODEC,
+}
+
+
+def get_codec(name):
+    """Lấy codec theo tên (mặc định text nếu không rõ)"""
+    return CODECS.get(name, TEXT_CODEC)
+
+
+def encode_connect(username, codec_name=TEXT_CODEC.name, region=None):
+    """Gói CONNECT luôn ở dạng text, kèm tên codec muốn dùng và khu vực (nếu có)"""
+    if region:
+        return f"CONNECT|{username}|{codec_name}|{region}".encode('utf-8')
+    if codec_name == TEXT_CODEC.name:
+        return f"CONNECT|{username}".encode('utf-8')
+    return f"CONNECT|{username}|{codec_name}".encode('utf-8')
+
+
+def encode_resume(token, codec_name=TEXT_CODEC.name):
+    """Gói RESUME luôn ở dạng text (giống CONNECT), kèm tên codec muốn dùng"""
+    if codec_name == TEXT_CODEC.name:
+        return f"RESUME|{token}".encode('utf-8')
+    return f"RESUME|{token}|{codec_name}".encode('utf-8')
+
+
+def encode_spectate(room_id, codec_name=TEXT_CODEC.name):
+    """Gói SPECTATE luôn ở dạng text (giống CONNECT), kèm tên codec muốn dùng"""
+    if codec_name == TEXT_CODEC.name:
+        return f"SPECTATE|{room_id}".encode('utf-8')
+    return f"SPECTATE|{room_id}|{codec_name}".encode('utf-8')
+
+
+def encode_replay(query, codec_name=TEXT_CODEC.name):
+    """Gói REPLAY gửi đầu tiên ở dạng text (giống CONNECT), kèm tên codec muốn dùng"""
+    if codec_name == TEXT_CODEC.name:
+        return f"REPLAY|{query}".encode('utf-8')
+    return f"REPLAY|{query}|{codec_name}".encode('utf-8')
+
+
+def encode_leaderboard(count, codec_name=TEXT_CODEC.name):
+    """Gói LEADERBOARD gửi đầu tiên ở dạng text (giống CONNECT), kèm tên codec muốn dùng"""
+    if codec_name == TEXT_CODEC.name:
+        return f"LEADERBOARD|{count}".encode('utf-8')
+    return f"LEADERBOARD|{count}|{codec_name}".encode('utf-8')
+
+
+def parse_number(text):
+    """Số nguyên không âm chỉ gồm chữ số ASCII, hoặc None ('²' thỏa isdigit() nhưng int() lỗi)"""
+    if text.isascii() and text.isdigit():
+        return int(text)
+    return None
+
+
+def format_message(message):
+    """Chuỗi dễ đọc của một gói tin (dùng để in log)"""
+    return TEXT_CODEC.encode(message).decode('utf-8')
@@ -0,0 +1,186 @@
+"""
+Room Registry - Quản lý vòng đời các phòng chơi trên server
+Tạo phòng, tra cứu theo room_id và dọn (reap) các phòng đã kết thúc
+"""
+import itertools
+import threading
+import time
+from game_room import GameRoom, ROOM_FINISHED, ROOM_REAPED, ROOM_STATE_NAMES
+from serverlog import log
+
+# Thời gian giữ lại phòng đã kết thúc trước khi dọn (giây)
+DEFAULT_RETENTION = 60.0
+# Chu kỳ chạy của bộ dọn phòng (giây)
+DEFAULT_REAP_INTERVAL = 10.0
+# Số shard của registry
+DEFAULT_SHARDS = 16
+
+class RoomShard:
+    """Một phần của registry: dict phòng riêng với lock riêng"""
+    __slots__ = ('rooms', 'lock', 'created_total', 'reaped_total')
+
+    def __init__(self):
+        self.rooms = {}  # {room_id: GameRoom}
+        self.lock = threading.Lock()
+        self.created_total = 0
+        self.reaped_total = 0
+
+
+class RoomRegistry:
+    """
+    Danh sách các phòng đang sống và số liệu vòng đời phòng
+    Phòng được chia vào nhiều shard theo room_id để các game không liên quan
+    không tranh nhau một lock chung; trạng thái trong phòng được bảo vệ bởi
+    lock riêng của từng phòng (GameRoom.lock)
+    """
+
+    def __init__(self, retention=DEFAULT_RETENTION, shard_count=DEFAULT_SHARDS,
+                 first_id=1, id_step=1):
+        """
+        first_id, id_step: id cấp ra là first_id, first_id + id_step, ... (vd: worker
+        i trong N worker dùng i + 1, bước N nên id không trùng giữa các worker)
+        """
+        self.retention = retention
+        self.shards = tuple(RoomShard() for _ in range(shard_count))
+
+        # Bảo vệ cấp id và việc thay room_ids (advance_ids / last_id)
+        self.first_id = first_id
+        self.id_step = id_step
+        self.room_ids = itertools.count(first_id, id_step)
+        self.ids_lock = threading.Lock()
+
+    def shard_for(self, room_id):
+        # Chia theo id // id_step: id cách nhau id_step vẫn rải đều mọi shard
+        return self.shards[room_id // self.id_step % len(self.shards)]
+
+    def create_room(self, player1_session, player1_name, player2_session, player2_name,
+                    room_id=None):
+        """
+        Tạo phòng mới với room_id tăng dần
+        room_id: dùng id cho sẵn (vd: id chung của cả cluster)
+        """
+        if room_id is None:
+            with self.ids_lock:
+                room_id = next(self.room_ids)
+        room = GameRoom(room_id, player1_session, player1_name, player2_session, player2_name)
+        shard = self.shard_for(room.room_id)
+        with shard.lock:
+            shard.rooms[room.room_id] = room
+            shard.created_total += 1
+        return room
+
+    def advance_ids(self, room_id):
+        """
+        Phòng tạo sau có id lớn hơn room_id (vd: sau khi khôi phục phòng cũ);
+        không bao giờ lùi lại id đã dùng
+        """
+        # Id nhỏ nhất của dãy lớn hơn room_id
+        after = self.first_id + max(0, (room_id - self.first_id) // self.id_step + 1) * self.id_step
+        with self.ids_lock:
+            self.room_ids = itertools.count(max(next(self.room_ids), after), self.id_step)
+
+    def last_id(self):
+        """Id lớn nhất đã cấp hoặc đã khôi phục (không tiêu id mới)"""
+        with self.ids_lock:
+            room_id = next(self.room_ids)
+            self.room_ids = itertools.count(room_id, self.id_step)
+        return room_id - 1
+
+    def get(self, room_id):
+        return self.shard_for(room_id).rooms.get(room_id)
+
+    def __len__(self):
+        return sum(len(shard.rooms) for shard in self.shards)
+
+    def reap(self, now=None):
+        """
+        Dọn các phòng đã kết thúc quá thời gian giữ lại
+        Trả về: số phòng đã dọn
+        """
+        if now is None:
+            now = time.monotonic()
+        deadline = now - self.retention
+
+        reaped = 0
+        for shard in self.shards:
+            with shard.lock:
+                expired = [
+                    room for room in shard.rooms.values()
+                    if room.state == ROOM_FINISHED and room.finished_at <= deadline
+                ]
+                for room in expired:
+                    del shard.rooms[room.room_id]
+                shard.reaped_total += len(expired)
+
+            for room in expired:
+                self._release(room)
+            reaped += len(expired)
+        return reaped
+
+    def _release(self, room):
+        """Cắt liên kết session <-> phòng để bộ nhớ được giải phóng"""
+        with room.lock:
+            room.state = ROOM_REAPED
+            sessions = (room.player1_session, room.player2_session)
+            room.player1_session = None
+            room.player2_session = None
+            spectators = room.spectators
+            room.spectators = ()
+
+        for session in sessions:
+            if session is not None and session.room is room:
+                session.room = None
+        for session in spectators:
+            if session.watching is room:
+                session.watching = None
+
+    def totals(self):
+        """(tổng phòng đã tạo, tổng phòng đã dọn) - không duyệt từng phòng"""
+        created_total = reaped_total = 0
+        for shard in self.shards:
+            with shard.lock:
+                created_total += shard.created_total
+                reaped_total += shard.reaped_total
+        return created_total, reaped_total
+
+    def stats(self):
+        """Số liệu phòng: đang sống theo từng trạng thái, tổng đã tạo / đã dọn"""
+        by_state = {name: 0 for name in ROOM_STATE_NAMES[:ROOM_REAPED]}
+        live = created_total = reaped_total = 0
+
+        for shard in self.shards:
+            with shard.lock:
+                rooms = list(shard.rooms.values())
+                created_total += shard.created_total
+                reaped_total += shard.reaped_total
+
+            live += len(rooms)
+            for room in rooms:
+                by_state[room.state_name] += 1
+
+        return {
+            'live': live,
+            'by_state': by_state,
+            'created_total': created_total,
+            'reaped_total': reaped_total,
+            'shards': len(self.shards),
+        }
+
+
+class RoomReaper(threading.Thread):
+    """Thread nền định kỳ dọn các phòng đã kết thúc"""
+
+    def __init__(self, registry, interval=DEFAULT_REAP_INTERVAL):
+        super().__init__(name="RoomReaper", daemon=True)
+        self.registry = registry
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            reaped = self.registry.reap()
+            if reaped:
+                log.info("Đã dọn %d phòng, còn %d phòng", reaped, len(self.registry))
+
+    def stop(self):
+        self.stopped.set()
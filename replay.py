@@ -0,0 +1,209 @@
+"""
+Replay - Kho lưu các ván đã kết thúc để xem lại (REPLAY)
+
+Mỗi ván là một bản ghi nhị phân gọn (byte order big-endian, bitboard little-endian
+như trong protocol.py):
+  độ dài phần sau (4) | room_id (8) | người thắng (1, 0 = không có) | số phát bắn (2)
+  | đội tàu player 1 (13) | đội tàu player 2 (13) | độ dài tên 1 (1) | độ dài tên 2 (1)
+  | tên 1 | tên 2 | các phát bắn (1 byte / phát: y*10 + x)
+Người bắn của từng phát không cần lưu: player 1 bắn trước, trúng thì bắn tiếp,
+trượt thì đổi lượt (tính lại được từ 2 đội tàu).
+
+Bản ghi được ghi nối thêm vào các segment kích thước cố định (replay-<n>.seg),
+mỗi segment được mmap một lần; segment đầy thì mở segment mới. Phục vụ REPLAY chỉ
+cần tra index rồi cắt đúng đoạn byte trong mmap, không giải mã bản ghi.
+Index (room_id -> vị trí, tên người chơi -> các room_id) được dựng lại lúc mở kho
+bằng cách đọc phần đầu của từng bản ghi.
+"""
+import mmap
+import os
+import re
+import struct
+import threading
+
+from bitboard import BOARD_SIZE, CELL_BITS
+from protocol import BOARD_BYTES
+from serverlog import log
+
+# Kích thước một segment (byte): ~25.000 ván trung bình
+DEFAULT_SEGMENT_BYTES = 4 * 1024 * 1024
+# Số ván gần nhất trả về khi xem lại theo tên người chơi
+DEFAULT_PLAYER_LIMIT = 10
+
+LENGTH = struct.Struct('>I')
+# room_id, người thắng, số phát bắn, đội tàu 1, đội tàu 2, độ dài tên 1, độ dài tên 2
+RECORD_HEADER = struct.Struct(f'>QBH{BOARD_BYTES}s{BOARD_BYTES}sBB')
+MAX_NAME_BYTES = 255
+
+SEGMENT_PATTERN = re.compile(r"replay-(\d+)\.seg")
+
+
+class ReplayError(ValueError):
+    """Bản ghi replay không hợp lệ"""
+
+
+def encode_record(room):
+    """GameRoom đã kết thúc -> bản ghi (kèm tiền tố độ dài)"""
+    name1 = room.player1_name.encode('utf-8')[:MAX_NAME_BYTES]
+    name2 = room.player2_name.encode('utf-8')[:MAX_NAME_BYTES]
+    shots = bytes(room.shots)
+    header = RECORD_HEADER.pack(
+        room.room_id, room.winner or 0, len(shots),
+        room.player1_map.to_bytes(BOARD_BYTES, 'little'),
+        room.player2_map.to_bytes(BOARD_BYTES, 'little'),
+        len(name1), len(name2),
+    )
+    body = header + name1 + name2 + shots
+    return LENGTH.pack(len(body)) + body
+
+
+def decode_record(record):
+    """
+    Bản ghi (kèm tiền tố độ dài, như trong REPLAY_DATA) -> các field
+    Trả về: (room_id, tên 1, tên 2, người thắng hoặc None, đội tàu 1, đội tàu 2,
+             [(người bắn, x, y, trúng?), ...])
+    """
+    try:
+        (length,) = LENGTH.unpack_from(record)
+        (room_id, winner, shot_count, fleet1, fleet2,
+         name1_len, name2_len) = RECORD_HEADER.unpack_from(record, LENGTH.size)
+    except struct.error as e:
+        raise ReplayError(f"Bản ghi replay không hợp lệ: {e}")
+    pos = LENGTH.size + RECORD_HEADER.size
+    if length != len(record) - LENGTH.size or pos + name1_len + name2_len + shot_count != len(record):
+        raise ReplayError("Bản ghi replay sai độ dài")
+
+    name1 = bytes(record[pos:pos + name1_len]).decode('utf-8', 'ignore')
+    pos += name1_len
+    name2 = bytes(record[pos:pos + name2_len]).decode('utf-8', 'ignore')
+    pos += name2_len
+
+    fleets = (int.from_bytes(fleet1, 'little'), int.from_bytes(fleet2, 'little'))
+    shots = []
+    player_num = 1
+    for index in record[pos:]:
+        if index >= BOARD_SIZE * BOARD_SIZE:
+            raise ReplayError(f"Ô không hợp lệ trong replay: {index}")
+        y, x = divmod(index, BOARD_SIZE)
+        # Bắn vào đội tàu của đối thủ; trượt thì đổi lượt
+        is_hit = bool(fleets[2 - player_num] & CELL_BITS[index])
+        shots.append((player_num, x, y, is_hit))
+        if not is_hit:
+            player_num = 3 - player_num
+    return room_id, name1, name2, winner or None, fleets[0], fleets[1], shots
+
+
+class ReplayArchive:
+    """
+    Kho replay trên đĩa: ghi nối thêm (một lock), đọc không cần lock
+    Bản ghi được ghi vào mmap trước, tiền tố độ dài ghi sau cùng: process bị
+    kill giữa chừng thì bản ghi dở có độ dài 0 và bị bỏ qua khi mở lại
+    """
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.files = []
+        self.segments = []      # [mmap, ...] theo số thứ tự segment
+        self.write_pos = 0      # vị trí ghi trong segment cuối
+
+        # Index: chỉ thêm sau khi bản ghi đã nằm trọn trong mmap
+        self.by_room = {}       # {room_id: (segment, offset, độ dài)}
+        self.by_player = {}     # {tên: [room_id, ...]} (cũ -> mới)
+        self.last_room_id = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.by_room)
+
+    def open(self):
+        """Mở các segment có sẵn và dựng lại index"""
+        os.makedirs(self.directory, exist_ok=True)
+        numbers = sorted(
+            int(match.group(1))
+            for match in map(SEGMENT_PATTERN.fullmatch, os.listdir(self.directory))
+            if match
+        )
+        for number in numbers:
+            self.write_pos = self._scan(self._map_segment(number, create=False))
+        if not self.segments:
+            self._map_segment(0, create=True)
+        log.info("Kho replay tại %s: %d ván trong %d segment",
+                 self.directory, len(self.by_room), len(self.segments))
+
+    def _map_segment(self, number, create):
+        path = os.path.join(self.directory, f"replay-{number}.seg")
+        f = open(path, 'w+b' if create else 'r+b')
+        if create or os.fstat(f.fileno()).st_size == 0:
+            # Cấp sẵn cả segment (vùng chưa ghi toàn byte 0 = hết dữ liệu)
+            f.truncate(self.segment_bytes)
+        segment = mmap.mmap(f.fileno(), 0)
+        self.files.append(f)
+        self.segments.append(segment)
+        return len(self.segments) - 1
+
+    def _scan(self, index):
+        """Đọc phần đầu các bản ghi của một segment vào index; trả về vị trí hết dữ liệu"""
+        segment = self.segments[index]
+        size = len(segment)
+        offset = 0
+        while offset + LENGTH.size + RECORD_HEADER.size <= size:
+            (length,) = LENGTH.unpack_from(segment, offset)
+            end = offset + LENGTH.size + length
+            if length < RECORD_HEADER.size or end > size:
+                break
+            room_id, *_, name1_len, name2_len = RECORD_HEADER.unpack_from(segment, offset + LENGTH.size)
+            names = offset + LENGTH.size + RECORD_HEADER.size
+            name1 = segment[names:names + name1_len].decode('utf-8', 'ignore')
+            name2 = segment[names + name1_len:names + name1_len + name2_len].decode('utf-8', 'ignore')
+            self._index(room_id, name1, name2, (index, offset, end - offset))
+            offset = end
+        return offset
+
+    def _index(self, room_id, name1, name2, location):
+        # Cùng room_id (vd: id bắt đầu lại khi không có journal): giữ bản mới nhất
+        self.by_room[room_id] = location
+        for name in {name1, name2}:
+            self.by_player.setdefault(name, []).append(room_id)
+        self.last_room_id = max(self.last_room_id, room_id)
+
+    def record(self, room):
+        """Lưu một ván đã kết thúc"""
+        data = encode_record(room)
+        if len(data) > self.segment_bytes:
+            raise ReplayError("Bản ghi replay lớn hơn một segment")
+        with self.lock:
+            if self.write_pos + len(data) > len(self.segments[-1]):
+                self.segments[-1].flush()
+                self._map_segment(len(self.segments), create=True)
+                self.write_pos = 0
+            segment = self.segments[-1]
+            offset = self.write_pos
+            segment[offset + LENGTH.size:offset + len(data)] = data[LENGTH.size:]
+            segment[offset:offset + LENGTH.size] = data[:LENGTH.size]
+            self.write_pos = offset + len(data)
+            self._index(room.room_id, room.player1_name, room.player2_name,
+                        (len(self.segments) - 1, offset, len(data)))
+
+    def get(self, room_id):
+        """Bản ghi (bytes, chưa giải mã) của ván room_id, None nếu không có"""
+        location = self.by_room.get(room_id)
+        if location is None:
+            return None
+        index, offset, length = location
+        return self.segments[index][offset:offset + length]
+
+    def find_player(self, name, limit=DEFAULT_PLAYER_LIMIT):
+        """room_id các ván gần nhất của người chơi (mới -> cũ)"""
+        room_ids = self.by_player.get(name, ())
+        return room_ids[:-limit - 1:-1]
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments:
+                segment.flush()
+                segment.close()
+            for f in self.files:
+                f.close()
+            self.segments = []
+            self.files = []
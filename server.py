@@ -2,44 +2,167 @@
 Server Battleship Game - Multi-threaded TCP Server
 Đóng vai trò Trọng Tài và Mai Mối
 """
+import argparse
+import os
 import socket
 import threading
-import json
-from game_room import GameRoom
+import time
+from bitboard import bitboard_to_cells
+from fleet import SHIP_NAMES, fleet_from_ships
+from framing import encode_frame, encode_frames
+from protocol import ProtocolError, TEXT_CODEC, get_codec, format_message, parse_number
+from matchmaking import (
+    MatchQueue, Matchmaker, MatchmakerTicker, STRATEGIES, DEFAULT_TICK_INTERVAL,
+)
+from registry import (
+    RoomRegistry, RoomReaper,
+    DEFAULT_RETENTION, DEFAULT_REAP_INTERVAL, DEFAULT_SHARDS,
+)
+from outbound import (
+    OutboundQueue, OutboundPump, POLICIES, POLICY_COALESCE, POLICY_DISCONNECT, DEFAULT_MAX_PENDING,
+)
+from session import PlayerSession, SessionTokens, DEFAULT_RESUME_GRACE, mark_ping, record_pong
+from timerwheel import TimerWheel, TimerTicker
+from journal import RoomJournal, restore_rooms, DEFAULT_SNAPSHOT_EVERY
+from replay import ReplayArchive, DEFAULT_SEGMENT_BYTES, DEFAULT_PLAYER_LIMIT
+from players import PlayerStore, DEFAULT_LEADERBOARD_SIZE, DEFAULT_TOP_SIZE
+from metrics import ServerMetrics, MetricsHTTPServer
+from serverlog import log, fields as log_fields, trace_enabled, setup_logging, LOG_FORMATS
+
+# Heartbeat, ngắt kết nối im lặng và thời gian mỗi lượt (giây)
+DEFAULT_HEARTBEAT_INTERVAL = 10.0
+DEFAULT_IDLE_TIMEOUT = 30.0
+DEFAULT_TURN_TIMEOUT = 60.0
 
 class BattleshipServer:
-    def __init__(self, host='0.0.0.0', port=8080):
+    def __init__(self, host='0.0.0.0', port=8080,
+                 room_retention=DEFAULT_RETENTION, reap_interval=DEFAULT_REAP_INTERVAL,
+                 room_shards=DEFAULT_SHARDS, room_id_first=1, room_id_step=1,
+                 matchmaking='instant', match_tick=DEFAULT_TICK_INTERVAL,
+                 send_queue_bytes=DEFAULT_MAX_PENDING, slow_client_policy=POLICY_DISCONNECT,
+                 metrics_host='127.0.0.1', metrics_port=0,
+                 journal_dir=None, snapshot_every=DEFAULT_SNAPSHOT_EVERY,
+                 resume_grace=DEFAULT_RESUME_GRACE,
+                 heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 turn_timeout=DEFAULT_TURN_TIMEOUT,
+                 replay_dir=None, replay_segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 players_db=None):
         self.host = host
         self.port = port
         self.server_socket = None
         
-        # Hàng đợi người chơi chờ ghép cặp
-        self.waiting_players = []  # [(socket, username), ...]
-        self.waiting_lock = threading.Lock()
+        # Hàng đợi người chơi chờ ghép cặp (thêm/lấy/hủy đều O(1), có lock riêng)
+        self.waiting_players = MatchQueue()
+        
+        # matchmaking='instant': ghép ngay lúc CONNECT bằng waiting_players
+        # Các chế độ khác (fifo/rating/region): ghép theo lô mỗi match_tick giây
+        if matchmaking == 'instant':
+            self.matchmaker = None
+        else:
+            strategy = STRATEGIES[matchmaking]()
+            self.matchmaker = Matchmaker(strategy, on_match=self.start_match)
+        self.match_tick = match_tick
+        
+        # Danh sách các phòng chơi; phòng đã kết thúc được dọn sau room_retention giây
+        # room_id_first / room_id_step: dãy id phòng (mỗi worker một dãy riêng)
+        self.rooms = RoomRegistry(retention=room_retention, shard_count=room_shards,
+                                  first_id=room_id_first, id_step=room_id_step)
+        self.reap_interval = reap_interval
+        
+        # Mỗi kết nối có hàng đợi gửi riêng tối đa send_queue_bytes byte;
+        # slow_client_policy quyết định xử lý thế nào khi client đọc không kịp
+        self.send_queue_bytes = send_queue_bytes
+        self.slow_client_policy = slow_client_policy
+        self.outbound = None
+        
+        # Số liệu vận hành; metrics_port > 0 thì phục vụ GET /metrics (Prometheus)
+        self.metrics = ServerMetrics()
+        self.metrics.bind(self)
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self.metrics_server = None
         
-        # Danh sách các phòng chơi
-        self.rooms = {}  # {room_id: GameRoom}
-        self.room_counter = 0
-        self.rooms_lock = threading.Lock()
+        # Token phiên cấp lúc CONNECT: người chơi rớt mạng giữa ván được giữ
+        # phòng resume_grace giây để RESUME (0 = ngắt là kết thúc ván ngay)
+        self.tokens = SessionTokens(resume_grace)
         
-        # Map socket -> (room_id, player_num, username)
-        self.player_info = {}  # {socket: (room_id, player_num, username)}
-        self.player_info_lock = threading.Lock()
+        # Mọi timeout (heartbeat, kết nối im lặng, hết giờ lượt, hết hạn RESUME)
+        # nằm trên một bánh xe hẹn giờ: đặt / hủy O(1), mỗi tick chỉ xét một ô
+        # heartbeat_interval: kết nối im lặng chừng này giây thì nhận PING;
+        # im lặng quá idle_timeout thì bị ngắt. turn_timeout: hết giờ lượt thì xử thua
+        self.timers = TimerWheel()
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.turn_timeout = turn_timeout
+        
+        # Journal sự kiện phòng (journal_dir=None: tắt); phòng đang chơi được
+        # dựng lại từ journal khi server khởi động
+        if journal_dir:
+            self.journal = RoomJournal(journal_dir, snapshot_every=snapshot_every)
+        else:
+            self.journal = None
+        
+        # Kho replay các ván đã kết thúc (replay_dir=None: tắt); id phòng mới
+        # không trùng với ván đã lưu
+        if replay_dir:
+            self.replays = ReplayArchive(replay_dir, segment_bytes=replay_segment_bytes)
+            self.replays.open()
+            self.rooms.advance_ids(self.replays.last_room_id)
+        else:
+            self.replays = None
+        
+        # Kho người chơi (players_db=None: tắt): thắng / thua, rating Elo cập nhật
+        # theo lô sau mỗi GAME_OVER, bảng xếp hạng đọc từ index trong bộ nhớ
+        if players_db:
+            self.players = PlayerStore(players_db)
+            self.players.open()
+        else:
+            self.players = None
+        
+        # Thông tin từng người chơi (phòng, vị trí, codec, buffer) nằm trong
+        # PlayerSession của kết nối đó, không cần tra bảng theo socket
+    
+    def open_listener(self):
+        """Mở socket lắng nghe tại host:port"""
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen(10)
+        return server_socket
     
     def start(self):
         """Khởi động server"""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(10)
+        self.start_journal()
+        self.start_players()
+        self.server_socket = self.open_listener()
         
-        print(f"[SERVER] Server đang chạy tại {self.host}:{self.port}")
-        print("[SERVER] Đang chờ kết nối từ các client...")
+        log.info("Server đang chạy tại %s:%s", self.host, self.port)
+        log.info("Đang chờ kết nối từ các client...")
+        
+        reaper = RoomReaper(self.rooms, interval=self.reap_interval)
+        reaper.start()
+        
+        timer_ticker = TimerTicker(self.timers)
+        timer_ticker.start()
+        
+        ticker = None
+        if self.matchmaker is not None:
+            ticker = MatchmakerTicker(self.matchmaker, interval=self.match_tick)
+            ticker.start()
+        
+        # Thread I/O gửi nốt dữ liệu cho các client đọc chậm
+        self.outbound = OutboundPump(on_overflow=self.drop_slow_client)
+        self.outbound.start()
+        
+        self.start_metrics()
         
         try:
             while True:
                 client_socket, address = self.server_socket.accept()
-                print(f"[SERVER] Kết nối mới từ {address}")
+                accepted_at = time.perf_counter()
+                # Gói tin nhỏ, gửi ngay (không chờ gom theo thuật toán Nagle)
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                log.info("Kết nối mới từ %s", address)
                 
                 # Tạo thread mới cho mỗi client
                 client_thread = threading.Thread(
@@ -48,200 +171,944 @@ class BattleshipServer:
                 )
                 client_thread.daemon = True
                 client_thread.start()
+                self.metrics.accept_seconds.observe(time.perf_counter() - accepted_at)
         
         except KeyboardInterrupt:
-            print("\n[SERVER] Đang tắt server...")
+            log.info("Đang tắt server...")
         finally:
+            reaper.stop()
+            timer_ticker.stop()
+            if ticker is not None:
+                ticker.stop()
+            self.outbound.stop()
+            self.stop_metrics()
+            self.stop_journal()
+            self.stop_players()
+            self.close_replays()
             self.server_socket.close()
     
-    def handle_client(self, client_socket, address):
-        """Xử lý một client (chạy trên thread riêng)"""
+    def start_metrics(self):
+        """Mở cổng HTTP cục bộ phục vụ /metrics (nếu được cấu hình)"""
+        if self.metrics_port:
+            self.metrics_server = MetricsHTTPServer(
+                self.metrics.registry, self.metrics_host, self.metrics_port)
+            self.metrics_server.start()
+            log.info("Metrics tại http://%s:%s/metrics", self.metrics_host, self.metrics_port)
+    
+    def stop_metrics(self):
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+    
+    def start_journal(self):
+        """Khôi phục các phòng đang chơi từ journal rồi bắt đầu ghi journal"""
+        journal = self.journal
+        if journal is None or journal.is_alive():
+            return
+        events = journal.open()
+        rooms = restore_rooms(self.rooms, events)
+        # Phòng không khôi phục được: đánh dấu kết thúc để snapshot sau bỏ đi
+        restored = {room.room_id for room in rooms}
+        for room_id in events:
+            if room_id not in restored:
+                journal.finished(room_id)
+        # Người chơi của phòng khôi phục đang "rớt mạng": chờ RESUME bằng token cũ
+        for room in rooms:
+            tokens = events[room.room_id][0][4:]
+            for player_num, token in enumerate(tokens, 1):
+                if token:
+                    self.hold_restored_player(room, player_num, token)
+            if not all(tokens):
+                # Người chơi không có token (vd: phòng của worker) không RESUME được:
+                # giữ phòng grace giây rồi bỏ, để phòng được dọn và rời khỏi snapshot
+                self.timers.schedule(self.tokens.grace, self.restored_expired, room)
+            if room.game_started:
+                with room.lock:
+                    self.start_turn_timer(room)
+        journal.start()
+        log.info("Journal tại %s: đã khôi phục %d phòng", journal.directory, len(rooms))
+    
+    def hold_restored_player(self, room, player_num, token):
+        """Tạo session (chưa có kết nối) cho người chơi của phòng khôi phục từ journal"""
+        session = PlayerSession(None, None)
+        session.username = room.player1_name if player_num == 1 else room.player2_name
+        session.token = token
+        session.room, session.player_num = room, player_num
+        session.closed = True
+        room.set_player_session(player_num, session)
+        self.tokens.bind(session)
+        self.timers.schedule(self.tokens.grace, self.resume_expired, session)
+    
+    def restored_expired(self, timer, room):
+        """Hết thời gian giữ phòng khôi phục mà vẫn thiếu người chơi: kết thúc ván"""
+        with room.lock:
+            if not room.finish():
+                return
+            room.turn_timer = None
+            self.publish_to_spectators(room)
+            sessions = [room.get_player_session(player_num) for player_num in (1, 2)]
+        log.info("Bỏ phòng khôi phục từ journal: người chơi không kết nối lại",
+                 extra=log_fields(room_id=room.room_id))
+        if self.journal is not None:
+            self.journal.finished(room.room_id)
+        self.record_replay(room)
+        
+        for session in sessions:
+            if session is not None and not session.closed:
+                self.send_message(session, "OPPONENT_DISCONNECTED", "Đối thủ đã ngắt kết nối")
+    
+    def stop_journal(self):
+        if self.journal is not None:
+            self.journal.stop()
+    
+    def start_players(self):
+        if self.players is not None and not self.players.is_alive():
+            self.players.start()
+    
+    def stop_players(self):
+        if self.players is not None:
+            self.players.stop()
+    
+    def close_replays(self):
+        if self.replays is not None:
+            self.replays.close()
+    
+    def handle_client(self, client_socket, address, session=None):
+        """
+        Xử lý một client (chạy trên thread riêng)
+        session: PlayerSession đã tạo sẵn (vd: kết nối nhận từ process khác)
+        """
+        if session is None:
+            session = self.new_session(client_socket, address)
         try:
             while True:
-                data = client_socket.recv(4096).decode('utf-8')
-                if not data:
+                # Một lần recv có thể chứa nhiều gói tin (hoặc một phần gói tin)
+                frames = session.reader.read_from(client_socket)
+                if frames is None:
                     break
+                session.activity += 1
+                
+                for frame in frames:
+                    self.process_message(session, frame)
                 
-                print(f"[SERVER] Nhận từ {address}: {data}")
-                self.process_message(client_socket, data)
+                # Session đã đóng trong lúc xử lý (vd: socket đã chuyển sang process khác)
+                if session.closed:
+                    break
         
         except Exception as e:
-            print(f"[SERVER] Lỗi với client {address}: {e}")
+            log.warning("Lỗi với client %s: %s", address, e)
         finally:
-            self.disconnect_client(client_socket)
-            print(f"[SERVER] Client {address} đã ngắt kết nối")
+            self.disconnect_client(session)
+            log.info("Client %s đã ngắt kết nối", address)
+    
+    def new_session(self, client_socket, address):
+        """Tạo PlayerSession với hàng đợi gửi theo cấu hình của server"""
+        outbound = OutboundQueue(self.send_queue_bytes, self.slow_client_policy)
+        self.metrics.connections_total.inc()
+        session = PlayerSession(client_socket, address, outbound)
+        if self.heartbeat_interval:
+            self.timers.schedule(self.heartbeat_interval, self.check_connection, session, 0, 0.0)
+        return session
     
-    def process_message(self, client_socket, message):
-        """Xử lý tin nhắn từ client"""
-        parts = message.split('|', 1)
-        command = parts[0]
-        data = parts[1] if len(parts) > 1 else ""
+    def check_connection(self, timer, session, seen, idle):
+        """
+        Timer heartbeat của một kết nối (chạy mỗi heartbeat_interval giây)
+        seen: session.activity lúc kiểm tra trước; idle: số giây đã im lặng
+        """
+        if session.closed:
+            return
+        activity = session.activity
+        if activity != seen:
+            idle = 0.0
+        else:
+            idle += self.heartbeat_interval
+            if self.idle_timeout and idle >= self.idle_timeout:
+                self.metrics.idle_disconnects.inc()
+                log.warning("Client %s im lặng %.0f giây, ngắt kết nối", session.address, idle,
+                            extra=log_fields(session))
+                self.abort_connection(session)
+                return
+            # Im lặng một chu kỳ: hỏi thăm, client trả lời PONG
+            self.send_ping(session)
+        self.timers.schedule(self.heartbeat_interval, self.check_connection, session, activity, idle)
+    
+    def send_ping(self, session):
+        """Gửi PING; PONG trả về cập nhật độ trễ của session"""
+        mark_ping(session)
+        self.send_message(session, "PING")
+    
+    def process_message(self, session, payload):
+        """Xử lý tin nhắn từ client (payload đã tách khỏi frame)"""
+        metrics = self.metrics
+        started = time.perf_counter()
+        
+        try:
+            command, fields = session.codec.decode(payload)
+        except ProtocolError as e:
+            metrics.protocol_errors.inc()
+            log.warning("Gói tin không hợp lệ từ %s: %s", session.address, e)
+            self.send_message(session, "ERROR", str(e))
+            return
+        
+        parsed = time.perf_counter()
+        metrics.parse_seconds.observe(parsed - started)
+        metrics.messages_received.labels(command).inc()
+        
+        self.dispatch(session, command, fields)
         
+        finished = time.perf_counter()
+        metrics.dispatch_seconds.labels(command).observe(finished - parsed)
+        
+        # Log theo gói tin chỉ khi bật DEBUG và gói tin được lấy mẫu
+        if trace_enabled():
+            log.debug("Nhận từ %s: %s", session.address, format_message((command,) + fields),
+                      extra=log_fields(session, command, finished - started))
+    
+    def dispatch(self, session, command, fields):
+        """Gọi hàm xử lý theo lệnh"""
         if command == "CONNECT":
-            self.handle_connect(client_socket, data)
+            self.handle_connect(session, *fields)
         
         elif command == "SETUP":
-            self.handle_setup(client_socket, data)
+            self.handle_setup(session, fields[0])
         
         elif command == "SHOOT":
-            self.handle_shoot(client_socket, data)
+            (x, y), seq = fields
+            self.handle_shoot(session, x, y, seq)
+        
+        elif command == "RESUME":
+            self.handle_resume(session, *fields)
+        
+        elif command == "PING":
+            self.send_message(session, "PONG")
+        
+        elif command == "PONG":
+            record_pong(session)
+        
+        elif command == "SPECTATE":
+            self.handle_spectate(session, *fields)
+        
+        elif command == "REPLAY":
+            self.handle_replay(session, *fields)
+        
+        elif command == "LEADERBOARD":
+            self.handle_leaderboard(session, *fields)
     
-    def handle_connect(self, client_socket, username):
+    def handle_connect(self, session, username, codec_name=TEXT_CODEC.name, region=None):
         """Xử lý kết nối và ghép cặp"""
-        print(f"[SERVER] Player {username} đang chờ ghép cặp...")
+        if session.username:
+            # CONNECT lặp lại: không cấp token mới, không xếp hàng lần hai
+            self.send_message(session, "ERROR", "Đã kết nối rồi")
+            return
+        log.info("Player %s đang chờ ghép cặp...", username)
         
-        with self.waiting_lock:
-            # Nếu có người đang chờ -> Ghép cặp
-            if len(self.waiting_players) > 0:
-                opponent_socket, opponent_name = self.waiting_players.pop(0)
-                
-                # Tạo phòng chơi mới
-                with self.rooms_lock:
-                    self.room_counter += 1
-                    room_id = self.room_counter
-                    
-                    room = GameRoom(
-                        room_id,
-                        opponent_socket, opponent_name,
-                        client_socket, username
-                    )
-                    self.rooms[room_id] = room
-                    
-                    # Lưu thông tin người chơi
-                    with self.player_info_lock:
-                        self.player_info[opponent_socket] = (room_id, 1, opponent_name)
-                        self.player_info[client_socket] = (room_id, 2, username)
-                
-                print(f"[SERVER] Ghép cặp: {opponent_name} vs {username} (Room {room_id})")
-                
-                # Thông báo cho cả 2 người
-                self.send_message(opponent_socket, f"MATCH_FOUND|{username}")
-                self.send_message(client_socket, f"MATCH_FOUND|{opponent_name}")
-            
-            else:
-                # Chưa có ai -> Thêm vào hàng đợi
-                self.waiting_players.append((client_socket, username))
-                self.send_message(client_socket, "WAITING|Đang chờ đối thủ...")
-    
-    def handle_setup(self, client_socket, map_data):
-        """Xử lý giai đoạn setup (xếp tàu)"""
-        with self.player_info_lock:
-            if client_socket not in self.player_info:
-                return
-            
-            room_id, player_num, username = self.player_info[client_socket]
+        session.username = username
+        # Từ đây mọi gói tin với client này dùng codec đã chọn
+        session.codec = get_codec(codec_name)
+        session.region = region or ""
+        self.load_rating(session)
+        self.send_message(session, "SESSION", self.tokens.issue(session))
+        
+        if not self.find_match(session):
+            self.send_message(session, "WAITING", "Đang chờ đối thủ...")
+    
+    def load_rating(self, session):
+        """
+        Rating đã lưu của người chơi (dùng cho ghép cặp theo rating)
+        Chưa có trong bộ nhớ: thread nền của kho tra database rồi gán lại sau
+        (Matchmaker thấy rating mới ở tick kế tiếp)
+        """
+        if self.players is None:
+            return
+        try:
+            session.rating = self.players.rating(
+                session.username, lambda rating: setattr(session, 'rating', rating))
+        except Exception as e:
+            log.warning("Không đọc được rating của %s: %s", session.username, e)
+    
+    def find_match(self, session):
+        """
+        Đưa người chơi vào ghép cặp
+        Trả về: True nếu đã ghép được ngay, False nếu đang chờ
+        """
+        if self.matchmaker is not None:
+            # Ghép theo lô: chỉ thêm vào hàng đợi, MatchmakerTicker sẽ ghép;
+            # PONG về trước lượt ghép thì độ trễ đo được dùng cho chiến lược region
+            self.send_ping(session)
+            self.matchmaker.enqueue(session)
+            return False
+        
+        # Lấy đối thủ đang chờ (bỏ qua người đã ngắt kết nối), hoặc xếp hàng
+        opponent = self.waiting_players.pair_or_push(session)
+        if opponent is None:
+            return False
+        
+        self.start_match(opponent, session)
+        return True
+    
+    def start_match(self, player1, player2):
+        """Tạo phòng chơi mới cho 2 người chơi đã được ghép cặp"""
+        room = self.rooms.create_room(
+            player1, player1.username,
+            player2, player2.username
+        )
+        
+        # Gắn phòng vào session của mỗi người chơi
+        player1.room, player1.player_num = room, 1
+        player2.room, player2.player_num = room, 2
+        
+        # Một người có thể vừa ngắt kết nối ngay trước khi được gắn phòng:
+        # hủy phòng và ghép lại người còn lại
+        if player1.closed or player2.closed:
+            with room.lock:
+                cancelled = room.finish()
+            if cancelled:
+                for player in (player1, player2):
+                    player.room = None
+                    if not player.closed:
+                        self.find_match(player)
+            return None
         
-        room = self.rooms.get(room_id)
+        self.metrics.matches_total.inc()
+        if self.journal is not None:
+            self.journal.room_created(room)
+        log.info("Ghép cặp: %s vs %s", player1.username, player2.username,
+                 extra=log_fields(room_id=room.room_id))
+        
+        # Thông báo cho cả 2 người
+        self.send_message(player1, "MATCH_FOUND", player2.username)
+        self.send_message(player2, "MATCH_FOUND", player1.username)
+        return room
+    
+    def handle_setup(self, session, ship_cells):
+        """
+        Xử lý giai đoạn setup (xếp tàu)
+        ship_cells: list ô của từng tàu [[(x1,y1), ...], ...] (codec đã giải mã)
+        Trả về: True nếu bản đồ tàu đã được lưu vào phòng
+        """
+        room = session.room
         if not room:
             return
         
-        # Parse map data: "[(0,0),(0,1),(0,2),...]"
+        player_num = session.player_num
+        username = session.username
+        
+        # Kiểm tra từng tàu trước khi chạm vào phòng: đúng 5-4-3-3-2, thẳng,
+        # liền nhau, trong bảng, không chồng nhau (ô trùng lặp cũng bị loại)
+        ships = fleet_from_ships(ship_cells)
+        if ships is None:
+            log.warning("Đội tàu không hợp lệ", extra=log_fields(session, "SETUP"))
+            self.send_message(session, "ERROR", "Đội tàu không hợp lệ")
+            return
+        
         try:
-            map_positions = json.loads(map_data)  # List of [x, y]
-            map_tuples = [tuple(pos) for pos in map_positions]
-            room.set_player_map(player_num, map_tuples)
+            # Cập nhật trạng thái dưới lock của phòng, gửi tin nhắn sau khi nhả lock
+            with room.lock:
+                if room.game_over:
+                    return
+                # Không cho xếp lại tàu sau khi đã gửi SETUP
+                if room.is_player_ready(player_num):
+                    already_ready = True
+                else:
+                    already_ready = False
+                    room.set_player_map(player_num, ships)
+                    if self.journal is not None:
+                        self.journal.setup(room.room_id, player_num, ships)
+                
+                # Kiểm tra cả 2 đã sẵn sàng chưa (chỉ một người được bắt đầu game)
+                game_starting = room.is_both_ready() and not room.game_started
+                if game_starting:
+                    room.start_game()
+                    self.start_turn_timer(room)
+                    self.publish_to_spectators(room)
             
-            print(f"[SERVER] {username} đã setup {len(map_tuples)} ô tàu")
+            if already_ready:
+                self.send_message(session, "ERROR", "Bạn đã xếp tàu rồi!")
+                return
+            
+            if trace_enabled():
+                log.debug("%s đã setup %d tàu", username, len(ships),
+                          extra=log_fields(session, "SETUP"))
             
-            # Kiểm tra cả 2 đã sẵn sàng chưa
-            if room.is_both_ready():
-                room.game_started = True
-                print(f"[SERVER] Room {room_id} bắt đầu game!")
+            if game_starting:
+                log.info("Bắt đầu game!", extra=log_fields(room_id=room.room_id))
                 
                 # Player 1 đi trước
-                self.send_message(room.player1_socket, "GAME_START|YOUR_TURN")
-                self.send_message(room.player2_socket, "GAME_START|WAIT")
+                self.send_message(room.player1_session, "GAME_START", "YOUR_TURN")
+                self.send_message(room.player2_session, "GAME_START", "WAIT")
+            return True
         
         except Exception as e:
-            print(f"[SERVER] Lỗi khi parse map data: {e}")
+            log.exception("Lỗi khi xử lý setup: %s", e, extra=log_fields(session, "SETUP"))
     
-    def handle_shoot(self, client_socket, coordinates):
-        """Xử lý bắn"""
-        with self.player_info_lock:
-            if client_socket not in self.player_info:
-                return
-            
-            room_id, player_num, username = self.player_info[client_socket]
-        
-        room = self.rooms.get(room_id)
-        if not room or not room.game_started:
+    def handle_shoot(self, session, x, y, seq=None):
+        """
+        Xử lý bắn vào ô (x, y)
+        seq: số thứ tự phát bắn (tùy chọn); gửi lại cùng seq chỉ nhận lại kết quả cũ
+        Trả về: True nếu phát bắn đã làm thay đổi trạng thái phòng
+        """
+        room = session.room
+        if not room:
             return
         
-        # Kiểm tra lượt
-        if not room.is_player_turn(player_num):
-            self.send_message(client_socket, "ERROR|Chưa đến lượt bạn!")
-            return
+        player_num = session.player_num
+        username = session.username
         
-        # Parse tọa độ "x,y"
         try:
-            x, y = map(int, coordinates.split(','))
+            error = None
+            retried = None
+            with room.lock:
+                if not room.game_started:
+                    return
+                
+                try:
+                    if seq is not None:
+                        retried = room.find_retry(player_num, seq, x, y)
+                    if retried is not None:
+                        result = retried
+                    elif room.game_over:
+                        return
+                    # Kiểm tra lượt
+                    elif not room.is_player_turn(player_num):
+                        error = "Chưa đến lượt bạn!"
+                    else:
+                        # Xử lý bắn (ô đã bắn / ngoài bảng bị từ chối, không đổi trạng thái)
+                        started = time.perf_counter()
+                        result = room.process_shoot(player_num, x, y, seq)
+                        self.metrics.process_shoot_seconds.observe(time.perf_counter() - started)
+                        # Mỗi phát bắn bắt đầu lại đồng hồ của lượt (trúng: bắn tiếp)
+                        self.start_turn_timer(room)
+                        self.publish_to_spectators(room)
+                        journal = self.journal
+                        if journal is not None:
+                            # Ghi vào hàng đợi dưới lock phòng: đúng thứ tự các phát bắn
+                            journal.shot(room.room_id, player_num, x, y, seq, result[0])
+                            if result[1]:
+                                journal.finished(room.room_id, player_num)
+                except ValueError as e:
+                    error = str(e)
+                
+                if error is None:
+                    is_hit, is_game_over, winner, sunk = result
+                    opponent = room.get_opponent_session(player_num)
+                    if sunk is not None:
+                        sunk_ship = room.get_ship(3 - player_num, sunk)  # tàu của đối thủ
             
-            # Xử lý bắn
-            is_hit, is_game_over, winner = room.process_shoot(player_num, x, y)
+            # Từ chối trước khi gửi gì cho đối thủ
+            if error is not None:
+                self.send_message(session, "ERROR", error)
+                return
             
             result_type = "HIT" if is_hit else "MISS"
             
-            # Gửi kết quả cho người bắn
-            self.send_message(client_socket, f"RESULT|{result_type}|{x},{y}")
-            
-            # Gửi thông báo cho đối thủ
-            opponent_socket = room.get_opponent_socket(player_num)
-            self.send_message(opponent_socket, f"OPPONENT_SHOOT|{result_type}|{x},{y}")
+            # Gom tin nhắn theo người nhận để mỗi bên chỉ tốn một lần gửi
+            shooter_messages = [("RESULT", result_type, (x, y))]
+            opponent_messages = [("OPPONENT_SHOOT", result_type, (x, y))]
             
-            print(f"[SERVER] {username} bắn ({x},{y}) -> {result_type}")
+            if sunk is not None:
+                ship_cells = bitboard_to_cells(sunk_ship)
+                shooter_messages.append(("SUNK", ship_cells, SHIP_NAMES[sunk]))
+                opponent_messages.append(("OPPONENT_SUNK", ship_cells, SHIP_NAMES[sunk]))
             
             # Kiểm tra game over
             if is_game_over:
-                winner_socket = room.get_player_socket(winner)
-                loser_socket = room.get_opponent_socket(winner)
-                
-                self.send_message(winner_socket, "GAME_OVER|WIN")
-                self.send_message(loser_socket, "GAME_OVER|LOSE")
-                
-                print(f"[SERVER] Game over! Player {winner} thắng!")
+                # Người bắn phát cuối cùng là người thắng
+                shooter_messages.append(("GAME_OVER", "WIN"))
+                opponent_messages.append(("GAME_OVER", "LOSE"))
             
             else:
                 # Thông báo lượt chơi mới (chỉ khi trượt - đổi lượt)
                 if not is_hit:
-                    next_player_socket = room.get_player_socket(room.current_turn)
-                    self.send_message(next_player_socket, "TURN|YOUR_TURN")
+                    opponent_messages.append(("TURN", "YOUR_TURN"))
                 else:
                     # Trúng thì thông báo tiếp tục bắn
-                    self.send_message(client_socket, "TURN|YOUR_TURN")
+                    shooter_messages.append(("TURN", "YOUR_TURN"))
+            
+            if retried is not None:
+                # Phát bắn gửi lại: chỉ người bắn nhận lại kết quả, đối thủ đã được báo
+                if trace_enabled():
+                    log.debug("%s gửi lại phát bắn #%d (%d,%d)", username, seq, x, y,
+                              extra=log_fields(session, "SHOOT"))
+                self.send_messages(session, shooter_messages)
+                return
+            
+            self.metrics.shots_total.labels(result_type).inc()
+            if trace_enabled():
+                log.debug("%s bắn (%d,%d) -> %s", username, x, y, result_type,
+                          extra=log_fields(session, "SHOOT"))
+            if is_game_over:
+                self.metrics.games_finished.inc()
+                log.info("Game over! Player %d thắng!", winner,
+                         extra=log_fields(room_id=room.room_id, player=username))
+                self.record_replay(room)
+                self.record_result(room)
+            
+            self.send_messages(session, shooter_messages)
+            self.send_messages(opponent, opponent_messages)
+            return True
         
         except Exception as e:
-            print(f"[SERVER] Lỗi khi xử lý shoot: {e}")
+            log.exception("Lỗi khi xử lý shoot: %s", e, extra=log_fields(session, "SHOOT"))
+    
+    def handle_resume(self, session, token, codec_name=None):
+        """
+        Kết nối lại bằng token phiên: kết nối mới thay session cũ trong phòng và
+        nhận RESUMED (trạng thái 2 bảng + lượt) trong một lần gửi
+        """
+        session.codec = get_codec(codec_name or TEXT_CODEC.name)
+        if session.username:
+            self.send_message(session, "ERROR", "Đã kết nối rồi")
+            return
+        
+        old = self.tokens.take(token)
+        room = old.room if old is not None else None
+        if room is None:
+            self.send_message(session, "ERROR", "Phiên không tồn tại hoặc đã hết hạn")
+            return
+        
+        session.username = old.username
+        session.rating, session.region, session.latency = old.rating, old.region, old.latency
+        session.token = token
+        player_num = old.player_num
+        
+        with room.lock:
+            room.set_player_session(player_num, session)
+            session.room, session.player_num = room, player_num
+            old.room = None
+            ships, incoming, hits, misses, sunk = room.snapshot(player_num)
+            if not room.is_player_ready(player_num):
+                phase = "SETUP"
+            elif not room.game_started:
+                phase = "READY"
+            elif room.is_player_turn(player_num) and not room.game_over:
+                phase = "YOUR_TURN"
+            else:
+                phase = "WAIT"
+            game_over = room.game_over
+            winner = room.winner
+            opponent_name = room.get_opponent_name(player_num)
+        self.tokens.bind(session)
+        
+        # Kết nối cũ có thể chưa bị phát hiện là đã chết: cắt nó
+        if not old.closed:
+            self.abort_connection(old)
+        
+        log.info("%s đã kết nối lại", session.username, extra=log_fields(session, "RESUME"))
+        messages = [("RESUMED", phase, ships, incoming, hits, misses, sunk, opponent_name)]
+        if game_over:
+            # Ván đã kết thúc trong lúc mất kết nối
+            if winner is None:
+                messages.append(("OPPONENT_DISCONNECTED", "Đối thủ đã ngắt kết nối"))
+            else:
+                messages.append(("GAME_OVER", "WIN" if winner == player_num else "LOSE"))
+        self.send_messages(session, messages)
+
+    def handle_spectate(self, session, room_id, codec_name=None):
+        """
+        Xem một phòng: nhận tên 2 người chơi và trạng thái hiện tại, sau đó là
+        trạng thái mới sau mỗi thay đổi (bắt đầu game, mỗi phát bắn, kết thúc)
+        """
+        if codec_name:
+            session.codec = get_codec(codec_name)
+        if session.username:
+            self.send_message(session, "ERROR", "Người chơi không thể xem phòng khác")
+            return
+
+        room_number = parse_number(room_id)
+        room = self.rooms.get(room_number) if room_number is not None else None
+        if room is None:
+            self.send_message(session, "ERROR", "Phòng không tồn tại")
+            return
+
+        self.stop_spectating(session)
+        # Người xem đọc chậm: trạng thái mới thay trạng thái cũ chưa gửi
+        # (cùng key) thay vì dồn hàng đợi
+        with session.outbound.lock:
+            session.outbound.policy = POLICY_COALESCE
+
+        with room.lock:
+            room.add_spectator(session)
+            session.watching = room
+            # Gửi dưới lock phòng: trạng thái đầu tiên không thể tới sau một
+            # cập nhật mới hơn
+            self.send_messages(session, [("WATCHING", "1", room.player1_name),
+                                         ("WATCHING", "2", room.player2_name)])
+            self.send_messages(session, [("WATCH",) + room.spectator_view()],
+                               ("WATCH", room.room_id))
+        self.metrics.spectators_total.inc()
+        log.info("Client %s xem phòng (%d người xem)", session.address, len(room.spectators),
+                 extra=log_fields(room_id=room.room_id))
+
+    def handle_replay(self, session, query, codec_name=None):
+        """
+        Xem lại ván đã kết thúc: query là room_id (một ván) hoặc tên người chơi
+        (các ván gần nhất, mới trước; '@tên' nếu tên toàn chữ số)
+        Mỗi ván là một REPLAY_DATA chứa nguyên bản ghi trong kho (không giải mã),
+        cuối cùng là REPLAY_END|số ván
+        """
+        if codec_name:
+            # REPLAY là gói đầu tiên của kết nối (dạng text): chọn codec như CONNECT
+            session.codec = get_codec(codec_name)
+        replays = self.replays
+        if replays is None:
+            self.send_message(session, "ERROR", "Server không lưu replay")
+            return
+        
+        room_id = parse_number(query)
+        if room_id is not None:
+            room_ids = [room_id]
+        else:
+            room_ids = replays.find_player(query[1:] if query.startswith('@') else query,
+                                           DEFAULT_PLAYER_LIMIT)
+        messages = []
+        for room_id in room_ids:
+            record = replays.get(room_id)
+            if record is not None:
+                messages.append(("REPLAY_DATA", record))
+        messages.append(("REPLAY_END", str(len(messages))))
+        self.metrics.replays_served.inc(len(messages) - 1)
+        self.send_messages(session, messages)
     
-    def send_message(self, client_socket, message):
-        """Gửi tin nhắn đến client"""
+    def record_replay(self, room):
+        """Lưu ván vừa kết thúc vào kho replay (ván chưa bắt đầu bắn thì bỏ qua)"""
+        if self.replays is None or not room.game_started:
+            return
         try:
-            client_socket.send(message.encode('utf-8'))
-            print(f"[SERVER] Gửi: {message}")
+            self.replays.record(room)
         except Exception as e:
-            print(f"[SERVER] Lỗi khi gửi tin nhắn: {e}")
+            log.exception("Lỗi khi lưu replay: %s", e, extra=log_fields(room_id=room.room_id))
+            return
+        self.metrics.replays_recorded.inc()
     
-    def disconnect_client(self, client_socket):
-        """Xử lý ngắt kết nối"""
-        # Xóa khỏi hàng đợi
-        with self.waiting_lock:
-            self.waiting_players = [(s, n) for s, n in self.waiting_players if s != client_socket]
-        
-        # Xóa khỏi player_info và thông báo cho đối thủ
-        with self.player_info_lock:
-            if client_socket in self.player_info:
-                room_id, player_num, username = self.player_info[client_socket]
-                del self.player_info[client_socket]
-                
-                room = self.rooms.get(room_id)
-                if room:
-                    opponent_socket = room.get_opponent_socket(player_num)
-                    self.send_message(opponent_socket, "OPPONENT_DISCONNECTED|Đối thủ đã ngắt kết nối")
+    def handle_leaderboard(self, session, count=None, codec_name=None):
+        """
+        Bảng xếp hạng: count người có rating cao nhất (mặc định 10, tối đa 100),
+        mỗi người một RANK, cuối cùng là LEADERBOARD_END|số dòng
+        Đọc từ index trong bộ nhớ của PlayerStore, không truy vấn database
+        """
+        if codec_name:
+            # LEADERBOARD là gói đầu tiên của kết nối (dạng text): chọn codec như CONNECT
+            session.codec = get_codec(codec_name)
+        players = self.players
+        if players is None:
+            self.send_message(session, "ERROR", "Server không lưu thông tin người chơi")
+            return
         
+        count = min(count or DEFAULT_LEADERBOARD_SIZE, DEFAULT_TOP_SIZE)
+        messages = [
+            ("RANK", rank, max(0, round(rating)), wins, losses, name)
+            for rank, (name, rating, wins, losses) in enumerate(players.leaderboard(count), 1)
+        ]
+        messages.append(("LEADERBOARD_END", str(len(messages))))
+        self.metrics.leaderboards_served.inc()
+        self.send_messages(session, messages)
+    
+    def record_result(self, room):
+        """Ghi thắng / thua và cập nhật rating của ván vừa có người thắng"""
+        if self.players is None or not room.winner:
+            return
+        names = (room.player1_name, room.player2_name)
+        self.players.game_over(names[room.winner - 1], names[2 - room.winner])
+    
+    def stop_spectating(self, session):
+        """Bỏ người xem khỏi phòng đang xem (nếu có)"""
+        room = session.watching
+        if room is None:
+            return
+        session.watching = None
+        with room.lock:
+            room.remove_spectator(session)
+
+    def publish_to_spectators(self, room):
+        """
+        Gửi trạng thái mới của phòng cho mọi người xem (gọi khi đang giữ room.lock:
+        các cập nhật tới người xem theo đúng thứ tự thay đổi của phòng)
+        """
+        spectators = room.spectators
+        if spectators:
+            self.broadcast(spectators, ("WATCH",) + room.spectator_view(), ("WATCH", room.room_id))
+
+    def send_message(self, session, command, *fields):
+        """Gửi tin nhắn đến client, vd: send_message(session, "TURN", "YOUR_TURN")"""
+        self.send_messages(session, [(command,) + fields])
+    
+    def encode_messages(self, session, messages):
+        """Mã hóa các gói tin (tuple) theo codec của client"""
+        codec = session.codec
+        return [codec.encode(message) for message in messages]
+    
+    def send_messages(self, session, messages, key=None):
+        """
+        Gửi nhiều tin nhắn đến client trong một lần gửi
+        Không chặn: phần client chưa nhận kịp nằm trong hàng đợi gửi của session
+        key: với chính sách coalesce, lô tin nhắn mới thay lô cùng key chưa gửi
+        """
+        if session.closed:
+            # Người chơi đã rớt mạng (đang chờ RESUME): RESUMED sẽ gửi lại trạng thái
+            return
+        try:
+            started = time.perf_counter()
+            data = encode_frames(self.encode_messages(session, messages))
+            self.send_data(session, data, key)
+            self.record_sent(session, messages, len(data), started)
+        except Exception as e:
+            self.metrics.send_errors.inc()
+            log.warning("Lỗi khi gửi tin nhắn: %s", e, extra=log_fields(session))
+    
+    def send_data(self, session, data, key=None):
+        """Đưa dữ liệu đã đóng frame vào đường gửi không chặn của session"""
+        self.outbound.send(session, data, key)
+    
+    def broadcast(self, sessions, message, key=None):
+        """
+        Gửi cùng một gói tin cho nhiều client: mỗi codec chỉ mã hóa một lần,
+        các client cùng codec dùng chung một buffer đã đóng frame
+        """
+        started = time.perf_counter()
+        frames = {}     # {codec: frame}
+        sent = size = 0
+        for session in sessions:
+            if session.closed:
+                continue
+            codec = session.codec
+            data = frames.get(codec)
+            if data is None:
+                data = frames[codec] = encode_frame(codec.encode(message))
+            try:
+                self.send_data(session, data, key)
+            except Exception as e:
+                self.metrics.send_errors.inc()
+                log.warning("Lỗi khi gửi tin nhắn: %s", e, extra=log_fields(session))
+                continue
+            sent += 1
+            size += len(data)
+        
+        metrics = self.metrics
+        metrics.send_seconds.observe(time.perf_counter() - started)
+        metrics.bytes_sent.inc(size)
+        metrics.messages_sent.labels(message[0]).inc(sent)
+    
+    def record_sent(self, session, messages, size, started):
+        """Cập nhật metric gửi và log các tin nhắn đã gửi (DEBUG, có lấy mẫu)"""
+        metrics = self.metrics
+        metrics.send_seconds.observe(time.perf_counter() - started)
+        metrics.bytes_sent.inc(size)
+        for message in messages:
+            metrics.messages_sent.labels(message[0]).inc()
+        
+        if trace_enabled():
+            for message in messages:
+                log.debug("Gửi: %s", format_message(message),
+                          extra=log_fields(session, message[0]))
+    
+    def drop_slow_client(self, session):
+        """Hàng đợi gửi vượt giới hạn: ngắt kết nối client đọc chậm"""
+        queue = session.outbound
+        self.metrics.slow_clients.inc()
+        log.warning("Client %s đọc quá chậm (%d byte chờ gửi), ngắt kết nối",
+                    session.address, queue.pending_bytes, extra=log_fields(session))
+        self.abort_connection(session)
+    
+    def abort_connection(self, session):
+        """Cắt kết nối của session; thread đọc của client sẽ nhận EOF và chạy disconnect_client"""
         try:
-            client_socket.close()
-        except:
+            session.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
             pass
+    
+    def disconnect_client(self, session):
+        """Xử lý ngắt kết nối"""
+        session.closed = True
+        self.metrics.disconnections_total.inc()
+        self.stop_spectating(session)
+        
+        # Xóa khỏi hàng đợi
+        self.waiting_players.cancel(session)
+        if self.matchmaker is not None:
+            self.matchmaker.cancel(session)
+        
+        room = session.room
+        if (room is not None and session.token is not None
+                and self.tokens.grace > 0 and not room.game_over):
+            # Giữ phòng chờ người chơi RESUME; hết hạn thì resume_expired kết thúc ván
+            self.timers.schedule(self.tokens.grace, self.resume_expired, session)
+            log.info("%s rớt mạng, giữ phòng %.0f giây", session.username, self.tokens.grace,
+                     extra=log_fields(session))
+        else:
+            self.leave_room(session)
+        
+        self.close_socket(session)
+    
+    def leave_room(self, session):
+        """Người chơi rời hẳn: kết thúc phòng và thông báo cho đối thủ (nếu game chưa kết thúc)"""
+        self.tokens.discard(session)
+        room = session.room
+        if room is None:
+            return
+        session.room = None
+        with room.lock:
+            finished_now = room.finish()
+            opponent = room.get_opponent_session(session.player_num)
+            if finished_now:
+                self.publish_to_spectators(room)
+        if finished_now and self.journal is not None:
+            self.journal.finished(room.room_id)
+        if finished_now:
+            self.record_replay(room)
+        
+        # Gửi sau khi đã nhả lock của phòng
+        if finished_now and opponent is not None:
+            self.send_message(opponent, "OPPONENT_DISCONNECTED", "Đối thủ đã ngắt kết nối")
+    
+    def resume_expired(self, timer, session):
+        """Người chơi rớt mạng không RESUME kịp: kết thúc ván"""
+        # Token đã trỏ sang session mới (đã RESUME) thì không làm gì
+        if not self.tokens.discard(session):
+            return
+        log.info("%s không kết nối lại kịp", session.username, extra=log_fields(session))
+        self.leave_room(session)
+    
+    def start_turn_timer(self, room):
+        """Đặt lại đồng hồ lượt cho người đang có lượt (gọi khi đang giữ room.lock)"""
+        if room.turn_timer is not None:
+            self.timers.cancel(room.turn_timer)
+            room.turn_timer = None
+        if self.turn_timeout and not room.game_over:
+            room.turn_timer = self.timers.schedule(self.turn_timeout, self.turn_expired, room)
+    
+    def turn_expired(self, timer, room):
+        """Người có lượt không bắn trong turn_timeout giây: xử thua"""
+        with room.lock:
+            # Timer cũ (lượt đã đổi) hoặc ván đã xong
+            if room.turn_timer is not timer or room.game_over:
+                return
+            player_num = room.current_turn
+        log.info("Hết giờ lượt của player %d", player_num, extra=log_fields(room_id=room.room_id))
+        self.metrics.turn_timeouts.inc()
+        self.forfeit(room, player_num)
+    
+    def forfeit(self, room, player_num):
+        """Xử thua người chơi player_num và thông báo cho cả 2 bên; False nếu ván đã xong"""
+        with room.lock:
+            if not room.finish(3 - player_num):
+                return False
+            room.turn_timer = None
+            self.publish_to_spectators(room)
+            loser = room.get_player_session(player_num)
+            winner = room.get_opponent_session(player_num)
+        if self.journal is not None:
+            self.journal.finished(room.room_id, 3 - player_num)
+        self.metrics.games_finished.inc()
+        self.record_replay(room)
+        self.record_result(room)
+        
+        if loser is not None:
+            self.send_messages(loser, [("ERROR", "Hết giờ lượt, bạn bị xử thua"), ("GAME_OVER", "LOSE")])
+        if winner is not None:
+            self.send_message(winner, "GAME_OVER", "WIN")
+        return True
+    
+    def close_socket(self, session):
+        """Bỏ dữ liệu chờ gửi và đóng socket của client"""
+        self.outbound.close(session)
 
 if __name__ == "__main__":
-    server = BattleshipServer(host='0.0.0.0', port=8080)
-    server.start()
+    parser = argparse.ArgumentParser(description="Battleship Game Server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--mode', choices=['thread', 'async'], default='thread',
+                        help="thread = mỗi client một thread, async = một event loop asyncio")
+    parser.add_argument('--room-retention', type=float, default=DEFAULT_RETENTION,
+                        help="số giây giữ lại phòng đã kết thúc trước khi dọn")
+    parser.add_argument('--reap-interval', type=float, default=DEFAULT_REAP_INTERVAL,
+                        help="chu kỳ (giây) chạy bộ dọn phòng")
+    parser.add_argument('--room-shards', type=int, default=DEFAULT_SHARDS,
+                        help="số shard của danh sách phòng")
+    parser.add_argument('--matchmaking', choices=['instant'] + sorted(STRATEGIES),
+                        default='instant',
+                        help="instant = ghép ngay khi CONNECT; fifo/rating/region = ghép theo lô mỗi tick")
+    parser.add_argument('--match-tick', type=float, default=DEFAULT_TICK_INTERVAL,
+                        help="chu kỳ (giây) ghép cặp theo lô")
+    parser.add_argument('--send-queue-bytes', type=int, default=DEFAULT_MAX_PENDING,
+                        help="giới hạn dữ liệu chờ gửi của mỗi client (byte)")
+    parser.add_argument('--slow-client-policy', choices=POLICIES, default=POLICY_DISCONNECT,
+                        help="xử lý khi hàng đợi gửi đầy: drop = bỏ tin nhắn mới, "
+                             "disconnect = ngắt client, coalesce = gộp tin nhắn cùng loại")
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help="cổng HTTP phục vụ /metrics (Prometheus); 0 = tắt")
+    parser.add_argument('--metrics-host', default='127.0.0.1')
+    parser.add_argument('--log-level', default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="DEBUG = log từng gói tin nhận / gửi")
+    parser.add_argument('--log-sample', type=float, default=1.0,
+                        help="tỉ lệ gói tin được log ở cấp DEBUG (vd: 0.01 = 1%%)")
+    parser.add_argument('--log-format', choices=LOG_FORMATS, default='text')
+    parser.add_argument('--journal-dir',
+                        help="thư mục journal sự kiện phòng; khởi động lại sẽ khôi phục các "
+                             "phòng đang chơi (mặc định: tắt)")
+    parser.add_argument('--snapshot-every', type=int, default=DEFAULT_SNAPSHOT_EVERY,
+                        help="số sự kiện journal giữa hai lần snapshot")
+    parser.add_argument('--replay-dir',
+                        help="thư mục lưu các ván đã kết thúc để xem lại bằng REPLAY (mặc định: tắt)")
+    parser.add_argument('--replay-segment-bytes', type=int, default=DEFAULT_SEGMENT_BYTES,
+                        help="kích thước mỗi segment của kho replay")
+    parser.add_argument('--players-db',
+                        help="file SQLite lưu thắng / thua và rating của người chơi, "
+                             "phục vụ LEADERBOARD (mặc định: tắt)")
+    parser.add_argument('--resume-grace', type=float, default=DEFAULT_RESUME_GRACE,
+                        help="số giây giữ phòng cho người chơi rớt mạng chờ RESUME (0 = tắt)")
+    parser.add_argument('--heartbeat', type=float, default=DEFAULT_HEARTBEAT_INTERVAL,
+                        help="gửi PING cho kết nối im lặng sau chừng này giây (0 = tắt)")
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help="ngắt kết nối im lặng quá chừng này giây (0 = không ngắt)")
+    parser.add_argument('--turn-timeout', type=float, default=DEFAULT_TURN_TIMEOUT,
+                        help="số giây cho mỗi lượt bắn, hết giờ bị xử thua (0 = không giới hạn)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="số process worker cùng nhận kết nối trên cổng (0 = số core); "
+                             "> 1 thì ghép cặp qua broker chung (chỉ --mode thread)")
+    parser.add_argument('--coordinator', metavar='HOST:PORT',
+                        help="chạy như một node của cluster, ghép cặp qua coordinator "
+                             "(python cluster.py); chỉ --mode thread")
+    parser.add_argument('--node-id', help="tên node trong cluster (mặc định host:port)")
+    parser.add_argument('--relay-host', default='127.0.0.1',
+                        help="địa chỉ các node khác dùng để gửi sự kiện game cho node này")
+    parser.add_argument('--relay-port', type=int, default=0)
+    args = parser.parse_args()
+    if args.workers != 1 and args.mode != 'thread':
+        parser.error("--workers chỉ dùng được với --mode thread")
+    if args.coordinator and (args.workers != 1 or args.mode != 'thread'):
+        parser.error("--coordinator chỉ dùng được với --mode thread và 1 worker")
+    
+    log_options = dict(level=args.log_level, sample_rate=args.log_sample, fmt=args.log_format)
+    log_listener = setup_logging(**log_options)
+    
+    options = dict(
+        host=args.host, port=args.port,
+        room_retention=args.room_retention, reap_interval=args.reap_interval,
+        room_shards=args.room_shards,
+        matchmaking=args.matchmaking, match_tick=args.match_tick,
+        send_queue_bytes=args.send_queue_bytes, slow_client_policy=args.slow_client_policy,
+        metrics_host=args.metrics_host, metrics_port=args.metrics_port,
+        journal_dir=args.journal_dir, snapshot_every=args.snapshot_every,
+        resume_grace=args.resume_grace,
+        heartbeat_interval=args.heartbeat, idle_timeout=args.idle_timeout,
+        turn_timeout=args.turn_timeout,
+        replay_dir=args.replay_dir, replay_segment_bytes=args.replay_segment_bytes,
+        players_db=args.players_db,
+    )
+    try:
+        if args.workers != 1:
+            from workers import run_workers
+            run_workers(args.workers or os.cpu_count(), options, log_options)
+        elif args.coordinator:
+            from cluster import ClusterServer, SocketBackend, parse_address
+            backend = SocketBackend(parse_address(args.coordinator),
+                                    relay_host=args.relay_host, relay_port=args.relay_port)
+            node_id = args.node_id or f"{socket.gethostname()}:{args.port}"
+            ClusterServer(backend, node_id, **options).start()
+        elif args.mode == 'async':
+            from async_server import AsyncBattleshipServer
+            AsyncBattleshipServer(**options).start()
+        else:
+            BattleshipServer(**options).start()
+    finally:
+        log_listener.stop()
@@ -0,0 +1,128 @@
+"""
+Server Log - Ghi log có cấp độ, có cấu trúc, ghi ở thread nền
+
+- Thread xử lý client chỉ tạo LogRecord (khi cấp độ được bật) và đưa vào hàng
+  đợi; định dạng và ghi ra stdout do một thread nền (QueueListener) đảm nhận
+- Mỗi record có thể mang các trường room_id, player, command, latency_ms
+- Log theo từng gói tin (cấp DEBUG) được lấy mẫu: chỉ ghi 1 trên N gói tin
+"""
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOGGER_NAME = 'battleship'
+LOG_FORMATS = ('text', 'json')
+
+# Các trường có cấu trúc, theo thứ tự in ra
+FIELDS = ('room_id', 'player', 'command', 'latency_ms')
+
+log = logging.getLogger(LOGGER_NAME)
+
+
+def fields(session=None, command=None, latency=None, **extra):
+    """Tạo dict 'extra' cho một record từ session / lệnh / độ trễ (giây)"""
+    if session is not None:
+        room = session.room
+        if room is not None:
+            extra['room_id'] = room.room_id
+        if session.username:
+            extra['player'] = session.username
+    if command is not None:
+        extra['command'] = command
+    if latency is not None:
+        extra['latency_ms'] = round(latency * 1000, 3)
+    return extra
+
+
+class Sampler:
+    """Chọn 1 trên mỗi `every` lần gọi (rate=0.01 -> 1%, rate=0 -> không bao giờ)"""
+
+    def __init__(self, rate=1.0):
+        self.every = round(1 / rate) if rate > 0 else 0
+        # next() trên itertools.count là nguyên tử (không cần lock)
+        self.counter = itertools.count()
+
+    def __call__(self):
+        if self.every <= 1:
+            return self.every == 1
+        return next(self.counter) % self.every == 0
+
+
+_trace_sampler = Sampler(1.0)
+
+
+def trace_enabled():
+    """
+    Có ghi log cho gói tin này không (cấp DEBUG + lấy mẫu)
+    Gọi trước khi chuẩn bị tham số log để đường nóng không tốn gì khi tắt
+    """
+    return log.isEnabledFor(logging.DEBUG) and _trace_sampler()
+
+
+class TextFormatter(logging.Formatter):
+    """[SERVER] message room_id=1 player=An command=SHOOT latency_ms=0.05"""
+
+    def format(self, record):
+        text = f"[SERVER] {record.getMessage()}"
+        extra = [f"{name}={getattr(record, name)}" for name in FIELDS if hasattr(record, name)]
+        if extra:
+            text += " " + " ".join(extra)
+        if record.levelno >= logging.WARNING:
+            text = f"{record.levelname} {text}"
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi record là một dòng JSON"""
+
+    def format(self, record):
+        data = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for name in FIELDS:
+            if hasattr(record, name):
+                data[name] = getattr(record, name)
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler mặc định định dạng record ngay trên thread gọi; ở đây record
+    được đưa nguyên vào hàng đợi (tham số là chuỗi / tuple bất biến) để việc
+    định dạng diễn ra trên thread nền
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level='INFO', sample_rate=1.0, fmt='text', stream=None):
+    """
+    Cấu hình logger của server và khởi động thread ghi log nền
+    Trả về: QueueListener (gọi .stop() khi tắt server để ghi nốt log còn lại)
+    """
+    global _trace_sampler
+    _trace_sampler = Sampler(sample_rate)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, output)
+
+    log.handlers[:] = [DeferredQueueHandler(records)]
+    log.setLevel(level)
+    log.propagate = False
+
+    listener.start()
+    return listener
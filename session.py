@@ -0,0 +1,149 @@
+"""
+Player Session - Trạng thái của một kết nối phía server
+Một object cho mỗi client: socket, codec, buffer đọc, phòng đang chơi
+SessionTokens: token phiên cấp lúc CONNECT, giữ phòng một lúc khi rớt mạng
+"""
+import secrets
+import threading
+import time
+
+from framing import FrameReader
+from matchmaking import DEFAULT_RATING
+from outbound import OutboundQueue
+from protocol import TEXT_CODEC, get_codec
+
+# Thời gian giữ phòng cho người chơi rớt mạng chờ RESUME (giây)
+DEFAULT_RESUME_GRACE = 30.0
+
+class PlayerSession:
+    """Thông tin một người chơi đang kết nối (dùng __slots__ để tiết kiệm bộ nhớ)"""
+
+    __slots__ = (
+        'socket', 'address', 'username', 'codec', 'reader',
+        'room', 'player_num', 'closed',
+        'rating', 'region', 'latency', 'ping_sent', 'outbound', 'token', 'activity',
+        'watching',
+    )
+
+    def __init__(self, client_socket, address, outbound=None):
+        self.socket = client_socket   # socket (thread) hoặc StreamWriter (asyncio)
+        self.address = address
+        self.username = ""
+
+        # Codec (text/binary) chọn lúc CONNECT
+        self.codec = TEXT_CODEC
+
+        # Buffer đọc: tách các gói tin từ luồng byte
+        self.reader = FrameReader()
+
+        # Phòng đang chơi và vị trí trong phòng (1 hoặc 2)
+        self.room = None
+        self.player_num = 0
+
+        # Đã ngắt kết nối (disconnect_client đã chạy)
+        self.closed = False
+
+        # Thông tin cho Matchmaker: rating, khu vực, độ trễ đo được (ms)
+        self.rating = DEFAULT_RATING
+        self.region = ""
+        self.latency = None
+        # Lúc gửi PING chưa nhận PONG (time.monotonic(), 0 = không chờ); PONG
+        # về thì độ trễ = thời gian khứ hồi
+        self.ping_sent = 0.0
+
+        # Hàng đợi gửi (giới hạn và chính sách khi client đọc chậm do server đặt)
+        self.outbound = outbound if outbound is not None else OutboundQueue()
+
+        # Token phiên (cấp lúc CONNECT) để kết nối lại bằng RESUME
+        self.token = None
+
+        # Số lần nhận được dữ liệu (chỉ thread đọc tăng); heartbeat so sánh
+        # giá trị này giữa 2 lần kiểm tra để biết kết nối có im lặng không
+        self.activity = 0
+
+        # Phòng đang xem (SPECTATE); người xem không có room / player_num
+        self.watching = None
+
+    def __repr__(self):
+        return f"PlayerSession({self.username!r}, {self.address})"
+
+
+def describe_player(session):
+    """Thông tin người chơi (dạng JSON) gửi kèm khi chuyển sang process / node khác"""
+    return {
+        'username': session.username,
+        'codec': session.codec.name,
+        'address': list(session.address) if session.address else None,
+        'rating': session.rating,
+        'region': session.region,
+        'latency': session.latency,
+    }
+
+
+def restore_player(session, info):
+    """Gán lại thông tin từ describe_player vào session"""
+    session.username = info['username']
+    session.codec = get_codec(info['codec'])
+    session.rating = info['rating']
+    session.region = info['region']
+    session.latency = info['latency']
+
+
+
+def mark_ping(session, now=None):
+    """Ghi lúc gửi PING cho client để đo độ trễ khi PONG về"""
+    session.ping_sent = time.monotonic() if now is None else now
+
+
+def record_pong(session, now=None):
+    """PONG về: độ trễ (ms) = thời gian khứ hồi từ PING gần nhất; không có PING đang chờ thì bỏ qua"""
+    if not session.ping_sent:
+        return
+    if now is None:
+        now = time.monotonic()
+    session.latency = (now - session.ping_sent) * 1000
+    session.ping_sent = 0.0
+
+class SessionTokens:
+    """
+    Token phiên -> PlayerSession
+    Session rớt mạng khi đang trong phòng được "treo" grace giây (server đặt
+    timer): phòng vẫn giữ nguyên, kết nối mới gửi RESUME|token sẽ nhận lại session đó
+    """
+
+    def __init__(self, grace=DEFAULT_RESUME_GRACE):
+        self.grace = grace
+        self.sessions = {}      # {token: PlayerSession}
+        self.lock = threading.Lock()
+
+    def issue(self, session):
+        """Cấp token mới cho session"""
+        token = secrets.token_urlsafe(12)
+        session.token = token
+        with self.lock:
+            self.sessions[token] = session
+        return token
+
+    def bind(self, session):
+        """Gắn token của session (vd: session vừa RESUME, session khôi phục từ journal)"""
+        with self.lock:
+            self.sessions[session.token] = session
+
+    def discard(self, session):
+        """
+        Hủy token của session (phiên kết thúc hẳn hoặc hết thời gian chờ)
+        Trả về: False nếu token đã trỏ sang session khác (đã RESUME) hoặc đã bị hủy
+        """
+        with self.lock:
+            if self.sessions.get(session.token) is session:
+                del self.sessions[session.token]
+                return True
+            return False
+
+    def take(self, token):
+        """Lấy session theo token và bỏ token khỏi bảng (None nếu không có / hết hạn)"""
+        with self.lock:
+            return self.sessions.pop(token, None)
+
+    def __len__(self):
+        return len(self.sessions)
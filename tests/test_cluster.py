@@ -0,0 +1,189 @@
+"""Kiểm tra cluster 2 node trên cả 2 backend: ghép cặp khác node, 1 hop relay mỗi phát bắn, ngắt kết nối"""
+import socket
+import threading
+import unittest
+
+from cluster import ClusterServer, CoordinatorServer, InProcessBackend, SocketBackend
+from framing import FrameReader, encode_frame
+from outbound import OutboundPump
+from protocol import TEXT_CODEC
+
+FLEET = [
+    [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)],
+    [(0, 2), (1, 2), (2, 2), (3, 2)],
+    [(0, 4), (1, 4), (2, 4)],
+    [(0, 6), (1, 6), (2, 6)],
+    [(0, 8), (1, 8)],
+]
+TIMEOUT = 5
+
+
+class Client:
+    """Client text nối thẳng vào handle_client của một node qua socketpair"""
+
+    def __init__(self, node, name):
+        self.sock, server_side = socket.socketpair()
+        self.sock.settimeout(TIMEOUT)
+        self.reader = FrameReader()
+        self.inbox = []
+        self.received = []   # mọi lệnh đã nhận
+        self.thread = threading.Thread(target=node.handle_client,
+                                       args=(server_side, (name, 0)), daemon=True)
+        self.thread.start()
+
+    def send(self, *message):
+        self.sock.sendall(encode_frame(TEXT_CODEC.encode(message)))
+
+    def expect(self, command):
+        """Đọc tới gói tin command đầu tiên; trả về field của nó"""
+        while True:
+            while self.inbox:
+                message = self.inbox.pop(0)
+                if message[0] == command:
+                    return message[1:]
+            frames = self.reader.read_from(self.sock)
+            if frames is None:
+                raise AssertionError(f"Kết nối đóng trước khi nhận {command}")
+            for frame in frames:
+                received, fields = TEXT_CODEC.decode(frame)
+                self.received.append(received)
+                self.inbox.append((received,) + fields)
+
+    def close(self):
+        self.sock.close()
+        self.thread.join(TIMEOUT)
+
+
+class ClusterTestMixin:
+    """Dựng 2 node (a, b); lớp con tạo backend của từng node qua make_backend()"""
+
+    def setUp(self):
+        self.relayed = []   # (node gửi, node nhận, loại sự kiện)
+        self.nodes = [self.start_node(node_id) for node_id in ("a", "b")]
+
+    def start_node(self, node_id):
+        backend = self.make_backend()
+        relay = backend.relay
+
+        def counted_relay(target, event):
+            self.relayed.append((node_id, target, event['type']))
+            relay(target, event)
+
+        backend.relay = counted_relay
+        node = ClusterServer(backend, node_id, port=0, heartbeat_interval=0, turn_timeout=0)
+        node.outbound = OutboundPump(on_overflow=node.drop_slow_client)
+        node.outbound.start()
+        backend.attach(node_id, node.on_cluster_event, node.rooms.last_id())
+        self.addCleanup(node.outbound.stop)
+        self.addCleanup(backend.close)
+        return node
+
+    def connect(self, node, name):
+        client = Client(node, name)
+        self.addCleanup(client.close)
+        client.send("CONNECT", name, None)
+        return client
+
+    def match(self):
+        alice = self.connect(self.nodes[0], "alice")
+        alice.expect("WAITING")
+        bob = self.connect(self.nodes[1], "bob")
+        self.assertEqual(alice.expect("MATCH_FOUND"), ("bob",))
+        self.assertEqual(bob.expect("MATCH_FOUND"), ("alice",))
+        return alice, bob
+
+    def test_match_across_nodes(self):
+        alice, bob = self.match()
+        rooms = [node.rooms.stats()['live'] for node in self.nodes]
+        self.assertEqual(rooms, [1, 1])
+        # Không node nào cấp token RESUME trong cluster
+        self.assertNotIn("SESSION", alice.received + bob.received)
+
+    def test_repeat_connect_rejected(self):
+        alice = self.connect(self.nodes[0], "alice")
+        alice.expect("WAITING")
+        alice.send("CONNECT", "alice", None)
+        self.assertEqual(alice.expect("ERROR"), ("Đã kết nối rồi",))
+        # Chỉ một vé trong hàng đợi chung: bob ghép với alice, carol không gặp lại alice
+        bob = self.connect(self.nodes[1], "bob")
+        self.assertEqual(bob.expect("MATCH_FOUND"), ("alice",))
+        carol = self.connect(self.nodes[1], "carol")
+        carol.expect("WAITING")
+        dave = self.connect(self.nodes[0], "dave")
+        self.assertEqual(dave.expect("MATCH_FOUND"), ("carol",))
+
+    def test_one_relay_hop_per_shot(self):
+        alice, bob = self.match()
+        for client in (alice, bob):
+            client.send("SETUP", FLEET)
+        self.assertEqual(alice.expect("GAME_START"), ("YOUR_TURN",))
+        self.assertEqual(bob.expect("GAME_START"), ("WAIT",))
+
+        alice.send("SHOOT", (9, 9), None)
+        self.assertEqual(alice.expect("RESULT"), ("MISS", (9, 9)))
+        self.assertEqual(bob.expect("OPPONENT_SHOOT"), ("MISS", (9, 9)))
+        bob.expect("TURN")
+        shots = 1
+        for ship in FLEET:
+            for cell in ship:
+                bob.send("SHOOT", cell, None)
+                self.assertEqual(bob.expect("RESULT"), ("HIT", cell))
+                self.assertEqual(alice.expect("OPPONENT_SHOOT"), ("HIT", cell))
+                shots += 1
+        self.assertEqual(bob.expect("GAME_OVER"), ("WIN",))
+        self.assertEqual(alice.expect("GAME_OVER"), ("LOSE",))
+
+        # Mỗi phát bắn đi đúng một lần, thẳng từ node người bắn sang node đối thủ
+        shot_hops = [hop for hop in self.relayed if hop[2] == 'shot']
+        self.assertEqual(len(shot_hops), shots)
+        self.assertEqual(shot_hops.count(("a", "b", "shot")), 1)
+        self.assertEqual(shot_hops.count(("b", "a", "shot")), shots - 1)
+
+    def test_remote_disconnect(self):
+        alice, bob = self.match()
+        alice.close()
+        self.assertEqual(bob.expect("OPPONENT_DISCONNECTED"), ("Đối thủ đã ngắt kết nối",))
+        self.assertIn(("a", "b", "leave"), self.relayed)
+        for node in self.nodes:
+            self.assertEqual(node.rooms.stats()['by_state']['finished'], 1)
+
+
+class InProcessClusterTest(ClusterTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.backend = InProcessBackend()
+        super().setUp()
+
+    def make_backend(self):
+        # Mọi node dùng chung một backend; mỗi node bọc relay của riêng nó
+        backend = InProcessBackend()
+        backend.directory = self.backend.directory
+        backend.nodes = self.backend.nodes
+        return backend
+
+
+class SocketClusterTest(ClusterTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.coordinator = CoordinatorServer(('127.0.0.1', 0))
+        self.ops = []
+        dispatch = self.coordinator.dispatch
+
+        def recorded_dispatch(handler, message):
+            self.ops.append(message['op'])
+            dispatch(handler, message)
+
+        self.coordinator.dispatch = recorded_dispatch
+        threading.Thread(target=self.coordinator.serve_forever, daemon=True).start()
+        self.addCleanup(self.coordinator.server_close)
+        self.addCleanup(self.coordinator.shutdown)
+        super().setUp()
+
+    def make_backend(self):
+        return SocketBackend(self.coordinator.server_address)
+
+    def test_game_events_bypass_coordinator(self):
+        self.test_one_relay_hop_per_shot()
+        self.assertEqual(set(self.ops), {'hello', 'enqueue'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Kiểm tra SETUP gửi từng tàu: các tàu đặt sát nhau vẫn chìm đúng tàu"""
+import unittest
+
+from bitboard import bitboard_to_cells
+from fleet import SHIP_NAMES, fleet_from_ships
+from game_room import GameRoom
+from journal import EVENT_SHIPS, decode_event, encode_event
+from protocol import BINARY_CODEC, TEXT_CODEC, ProtocolError
+
+# Tàu 3 ô ở x0-2 nằm sát tàu sân bay ở x3-7 (cùng hàng y0): chỉ nhìn bitboard
+# thì không biết 8 ô này chia thành 3 + 5 hay 5 + 3
+TOUCHING = [
+    [(0, 0), (1, 0), (2, 0)],
+    [(3, 0), (4, 0), (5, 0), (6, 0), (7, 0)],
+    [(0, 2), (1, 2), (2, 2), (3, 2)],
+    [(9, 4), (9, 5), (9, 6)],
+    [(5, 9), (6, 9)],
+]
+
+
+class TouchingShipsTest(unittest.TestCase):
+    def new_room(self, ships):
+        room = GameRoom(1, None, "p1", None, "p2")
+        room.set_player_map(1, fleet_from_ships(TOUCHING))
+        room.set_player_map(2, fleet_from_ships(ships))
+        room.start_game()
+        return room
+
+    def test_fleet_keeps_client_layout(self):
+        ships = fleet_from_ships(TOUCHING)
+        self.assertEqual(len(ships), len(TOUCHING))
+        self.assertEqual(sorted(bitboard_to_cells(ships[0])), TOUCHING[1])
+        self.assertEqual(sorted(bitboard_to_cells(ships[2])), TOUCHING[0])
+
+    def test_short_ship_sinks_without_carrier(self):
+        room = self.new_room(TOUCHING)
+        # Trúng x3, x4 không được làm chìm tàu nào
+        for x in (3, 4):
+            self.assertEqual(room.process_shoot(1, x, 0)[3], None)
+        sunk = [room.process_shoot(1, x, 0)[3] for x in (0, 1, 2)]
+        self.assertEqual(sunk[:2], [None, None])
+        self.assertEqual(SHIP_NAMES[sunk[2]], "Tàu khu trục 1")
+        self.assertEqual(sorted(bitboard_to_cells(room.get_ship(2, sunk[2]))), TOUCHING[0])
+
+    def test_invalid_fleets(self):
+        bent = [list(ship) for ship in TOUCHING]
+        bent[0] = [(0, 0), (1, 0), (1, 1)]
+        overlapping = [list(ship) for ship in TOUCHING]
+        overlapping[4] = [(2, 0), (2, 1)]
+        gap = [list(ship) for ship in TOUCHING]
+        gap[4] = [(5, 9), (7, 9)]
+        for ships in (TOUCHING[:4], TOUCHING + [[(9, 0), (9, 1)]], bent, overlapping, gap,
+                      [TOUCHING[1], TOUCHING[1], *TOUCHING[2:]]):
+            self.assertIsNone(fleet_from_ships(ships))
+
+
+class SetupCodecTest(unittest.TestCase):
+    def test_round_trip(self):
+        for codec in (TEXT_CODEC, BINARY_CODEC):
+            with self.subTest(codec=codec.name):
+                command, fields = codec.decode(codec.encode(("SETUP", TOUCHING)))
+                self.assertEqual(command, "SETUP")
+                self.assertEqual(fields[0], TOUCHING)
+
+    def test_binary_rejects_bent_ship(self):
+        with self.assertRaises(ProtocolError):
+            BINARY_CODEC.encode(("SETUP", [[(0, 0), (1, 1)]]))
+
+    def test_journal_keeps_ships(self):
+        ships = fleet_from_ships(TOUCHING)
+        event = decode_event(encode_event((EVENT_SHIPS, 7, 2, ships)))
+        self.assertEqual(event, (EVENT_SHIPS, 7, 2, ships))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+"""Kiểm tra ExactFrameReader không đọc trước byte của gói sau"""
+import socket
+import unittest
+
+from framing import ExactFrameReader, FrameReader, encode_frames
+
+
+class ExactFrameReaderTest(unittest.TestCase):
+    def test_leaves_next_frames_in_socket(self):
+        left, right = socket.socketpair()
+        with left, right:
+            left.sendall(encode_frames([b"CONNECT|alice", b"PING", b"SETUP|[]"]) + b"\x00\x00")
+            self.assertEqual(ExactFrameReader().read_from(right), [b"CONNECT|alice"])
+
+            # Phần còn lại vẫn nằm trong socket cho người đọc khác
+            reader = FrameReader()
+            self.assertEqual(reader.read_from(right), [b"PING", b"SETUP|[]"])
+            self.assertEqual(bytes(reader.buffer), b"\x00\x00")
+
+    def test_eof_inside_frame(self):
+        left, right = socket.socketpair()
+        with right:
+            left.sendall(encode_frames([b"PING"])[:-1])
+            left.close()
+            self.assertIsNone(ExactFrameReader().read_from(right))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""Kiểm tra phòng khôi phục từ journal không được giữ mãi khi không ai RESUME được"""
+import tempfile
+import time
+import unittest
+
+from fleet import fleet_from_ships
+from game_room import GameRoom
+from journal import RoomJournal
+from server import BattleshipServer
+
+FLEET = [
+    [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)],
+    [(0, 2), (1, 2), (2, 2), (3, 2)],
+    [(0, 4), (1, 4), (2, 4)],
+    [(0, 6), (1, 6), (2, 6)],
+    [(0, 8), (1, 8)],
+]
+
+
+class RestoredRoomTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_journal(self):
+        # Phòng không có token (như phòng của worker), player 1 đã xếp tàu
+        journal = RoomJournal(self.directory.name)
+        journal.open()
+        journal.room_created(GameRoom(1, None, "alice", None, "bob"))
+        journal.setup(1, 1, fleet_from_ships(FLEET))
+        journal.commit()
+        journal.stop()
+
+    def test_abandoned_after_grace(self):
+        self.write_journal()
+        server = BattleshipServer(port=0, journal_dir=self.directory.name,
+                                  resume_grace=0.1, turn_timeout=0)
+        server.start_journal()
+        room = server.rooms.get(1)
+        self.assertIsNotNone(room)
+        self.assertFalse(room.game_over)
+
+        server.timers.advance(time.monotonic() + 1)
+        self.assertTrue(room.game_over)
+        server.stop_journal()
+
+        # Đã ghi FINISH: lần khởi động sau không khôi phục phòng này nữa
+        journal = RoomJournal(self.directory.name)
+        self.assertEqual(journal.open(), {})
+        journal.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
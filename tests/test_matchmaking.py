@@ -0,0 +1,133 @@
+"""Kiểm tra MatchQueue (hủy, bỏ qua session cũ, dọn tombstone) và Matchmaker (số liệu, khu vực / độ trễ)"""
+import unittest
+
+from matchmaking import (
+    COMPACT_SLACK, MatchQueue, Matchmaker, RatingBucketStrategy, RegionLatencyStrategy,
+)
+from session import PlayerSession, mark_ping, record_pong
+
+
+def player(name):
+    session = PlayerSession(None, None)
+    session.username = name
+    return session
+
+
+class MatchQueueTest(unittest.TestCase):
+    def test_fifo_pairing(self):
+        queue = MatchQueue()
+        alice, bob, carol = player("alice"), player("bob"), player("carol")
+        self.assertIsNone(queue.pair_or_push(alice))
+        self.assertIs(queue.pair_or_push(bob), alice)
+        self.assertEqual(len(queue), 0)
+        self.assertIsNone(queue.pair_or_push(carol))
+        self.assertIn(carol, queue)
+
+    def test_cancel_then_pair(self):
+        queue = MatchQueue()
+        alice, bob, carol = player("alice"), player("bob"), player("carol")
+        queue.push(alice)
+        queue.push(bob)
+        self.assertTrue(queue.cancel(alice))
+        self.assertFalse(queue.cancel(alice))
+        self.assertNotIn(alice, queue)
+        # Người bị hủy không được ghép; người chờ kế tiếp được ghép
+        self.assertIs(queue.pair_or_push(carol), bob)
+        self.assertEqual(len(queue), 0)
+        self.assertIsNone(queue.pop())
+
+    def test_push_twice_is_ignored(self):
+        queue = MatchQueue()
+        alice = player("alice")
+        queue.push(alice)
+        queue.push(alice)
+        self.assertEqual(len(queue), 1)
+        self.assertIs(queue.pop(), alice)
+        self.assertIsNone(queue.pop())
+
+    def test_skips_closed_and_matched_sessions(self):
+        queue = MatchQueue()
+        gone, busy, waiting = player("gone"), player("busy"), player("waiting")
+        for session in (gone, busy, waiting):
+            queue.push(session)
+        gone.closed = True
+        busy.room = object()
+        self.assertIs(queue.pop(), waiting)
+        self.assertEqual(len(queue), 0)
+
+    def test_tombstones_are_compacted(self):
+        queue = MatchQueue()
+        sessions = [player(f"p{i}") for i in range(COMPACT_SLACK * 3)]
+        for session in sessions:
+            queue.push(session)
+        for session in sessions[:-1]:
+            queue.cancel(session)
+        # deque không giữ mãi các entry đã hủy
+        self.assertLessEqual(len(queue.queue), COMPACT_SLACK + 2)
+        self.assertIs(queue.pop(), sessions[-1])
+        self.assertEqual(queue.tombstones, 0)
+
+
+
+class MatchmakerTest(unittest.TestCase):
+    def setUp(self):
+        self.pairs = []
+        self.matchmaker = Matchmaker(RegionLatencyStrategy(),
+                                     on_match=lambda a, b: self.pairs.append({a.username, b.username}))
+
+    def enqueue(self, name, region="", latency=None, now=0.0):
+        session = player(name)
+        session.region = region
+        session.latency = latency
+        self.matchmaker.enqueue(session, now=now)
+        return session
+
+    def test_stats(self):
+        self.enqueue("a", now=0.0)
+        self.enqueue("b", now=1.0)
+        self.enqueue("c", now=2.0)
+        self.assertEqual(self.matchmaker.tick(now=4.0), 1)
+
+        stats = self.matchmaker.stats(now=5.0)
+        self.assertEqual(stats['strategy'], 'region')
+        self.assertEqual(stats['waiting'], 1)
+        self.assertEqual(stats['pairs_total'], 1)
+        self.assertGreater(stats['pairs_per_sec'], 0)
+        self.assertEqual((stats['wait_p50'], stats['wait_p99']), (4.0, 4.0))
+
+    def test_pairs_by_region(self):
+        self.enqueue("eu1", "eu")
+        self.enqueue("us1", "us")
+        self.enqueue("eu2", "eu")
+        self.enqueue("us2", "us")
+        self.matchmaker.tick(now=0.1)
+        self.assertEqual(self.pairs, [{"eu1", "eu2"}, {"us1", "us2"}])
+
+    def test_latency_measured_after_enqueue(self):
+        near, far = self.enqueue("near"), self.enqueue("far")
+        later = self.enqueue("later")
+        # PONG về sau khi đã vào hàng đợi: ticket được xếp lại bucket theo độ trễ
+        for session, rtt in ((near, 0.01), (far, 0.3), (later, 0.02)):
+            mark_ping(session, now=10.0)
+            record_pong(session, now=10.0 + rtt)
+        self.assertAlmostEqual(far.latency, 300.0)
+        self.matchmaker.tick(now=0.1)
+        self.assertEqual(self.pairs, [{"near", "later"}])
+        self.assertIn(far, self.matchmaker)
+
+    def test_rating_loaded_after_enqueue(self):
+        self.matchmaker.strategy = RatingBucketStrategy()
+        sessions = [self.enqueue(name) for name in ("a", "b", "c")]
+        # Kho người chơi tra xong rating của "a" sau khi đã vào hàng đợi
+        sessions[0].rating = 1500
+        self.matchmaker.tick(now=0.1)
+        self.assertEqual(self.pairs, [{"b", "c"}])
+
+    def test_pong_without_ping_is_ignored(self):
+        session = player("a")
+        record_pong(session, now=5.0)
+        self.assertIsNone(session.latency)
+
+
+if __name__ == '__main__':
+    unittest.main()
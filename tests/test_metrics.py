@@ -0,0 +1,83 @@
+"""Kiểm tra /metrics xuất tổng số phòng đã tạo / đã dọn và số liệu của Matchmaker"""
+import time
+import unittest
+import urllib.request
+
+from matchmaking import RATE_WINDOW
+from metrics import MetricsHTTPServer
+from server import BattleshipServer
+from session import PlayerSession
+
+
+class MetricsTestCase(unittest.TestCase):
+    server_options = {}
+
+    def setUp(self):
+        self.server = BattleshipServer(port=0, room_retention=0, **self.server_options)
+        self.http = MetricsHTTPServer(self.server.metrics.registry, '127.0.0.1', 0)
+        self.http.start()
+
+    def tearDown(self):
+        self.http.stop()
+
+    def scrape_text(self):
+        host, port = self.http.httpd.server_address
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            return response.read().decode('utf-8')
+
+    def scrape(self):
+        return {
+            line.split(' ')[0]: float(line.split(' ')[1])
+            for line in self.scrape_text().splitlines() if line and not line.startswith('#')
+        }
+
+
+
+class RoomCountersTest(MetricsTestCase):
+    def test_created_and_reaped_totals(self):
+        rooms = self.server.rooms
+        finished = rooms.create_room(None, "a", None, "b")
+        rooms.create_room(None, "c", None, "d")
+        finished.finish()
+        rooms.reap(now=time.monotonic() + 1)
+
+        samples = self.scrape()
+        self.assertEqual(samples['battleship_rooms_created_total'], 2)
+        self.assertEqual(samples['battleship_rooms_reaped_total'], 1)
+        # Gauge theo trạng thái chỉ còn phòng chưa bị dọn
+        live = sum(value for name, value in samples.items()
+                   if name.startswith('battleship_rooms{'))
+        self.assertEqual(live, 1)
+
+    def test_counter_type(self):
+        text = self.scrape_text()
+        self.assertIn("# TYPE battleship_rooms_created_total counter", text)
+        self.assertIn("# TYPE battleship_rooms_reaped_total counter", text)
+
+
+
+class MatchmakerGaugesTest(MetricsTestCase):
+    server_options = {'matchmaking': 'fifo'}
+
+    def test_pairs_and_wait_percentiles(self):
+        matchmaker = self.server.matchmaker
+        matchmaker.on_match = lambda player1, player2: None
+        now = time.monotonic()
+        for index in range(4):
+            session = PlayerSession(None, None)
+            session.username = f"p{index}"
+            matchmaker.enqueue(session, now=now - 2.0)
+        matchmaker.tick(now=now)
+
+        samples = self.scrape()
+        self.assertEqual(samples['battleship_match_pairs_per_second'], 2 / RATE_WINDOW)
+        for quantile in ('0.5', '0.9', '0.99'):
+            self.assertEqual(samples[f'battleship_match_wait_seconds{{quantile="{quantile}"}}'], 2.0)
+
+    def test_instant_mode_has_no_matchmaker_gauges(self):
+        server = BattleshipServer(port=0)
+        self.assertNotIn('battleship_match_pairs_per_second', server.metrics.render())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+"""Kiểm tra hàng đợi gửi OutboundQueue (các chính sách khi vượt giới hạn) và OutboundPump"""
+import socket
+import time
+import unittest
+
+from outbound import (
+    POLICY_COALESCE, POLICY_DISCONNECT, POLICY_DROP, SEND_CHUNK,
+    OutboundPump, OutboundQueue, _send_when_writable, send_nonblocking,
+)
+from session import PlayerSession
+
+
+class PolicyTest(unittest.TestCase):
+    def test_drop(self):
+        queue = OutboundQueue(max_pending=10, policy=POLICY_DROP)
+        self.assertTrue(queue.push(b"12345678"))
+        # Tin nhắn mới bị bỏ, kết nối vẫn giữ
+        self.assertTrue(queue.push(b"abc"))
+        self.assertEqual(queue.dropped, 1)
+        self.assertTrue(queue.push(b"ab"))
+        self.assertEqual(queue.take(), b"12345678ab")
+        self.assertEqual(queue.pending_bytes, 0)
+
+    def test_disconnect(self):
+        queue = OutboundQueue(max_pending=10, policy=POLICY_DISCONNECT)
+        self.assertTrue(queue.push(b"12345678"))
+        self.assertFalse(queue.push(b"abc"))
+        self.assertTrue(queue.overflowed)
+        # Đã vượt giới hạn thì mọi lần push sau đều báo ngắt kết nối
+        self.assertFalse(queue.push(b"a"))
+        self.assertEqual(queue.take(), b"12345678")
+
+    def test_coalesce(self):
+        queue = OutboundQueue(max_pending=10, policy=POLICY_COALESCE)
+        self.assertTrue(queue.push(b"old1", key="watch"))
+        self.assertTrue(queue.push(b"x"))
+        self.assertTrue(queue.push(b"new12", key="watch"))
+        self.assertEqual(queue.coalesced, 1)
+        self.assertEqual(queue.pending_bytes, 6)
+        # Thay thế giữ nguyên vị trí trong hàng đợi
+        self.assertEqual(queue.take(), b"new12x")
+
+        self.assertTrue(queue.push(b"123456789", key="a"))
+        self.assertFalse(queue.push(b"12", key="b"))
+        self.assertTrue(queue.overflowed)
+
+    def test_keys_ignored_without_coalesce(self):
+        queue = OutboundQueue(max_pending=100, policy=POLICY_DROP)
+        queue.push(b"a", key="k")
+        queue.push(b"b", key="k")
+        self.assertEqual(queue.take(), b"ab")
+
+    def test_push_front(self):
+        queue = OutboundQueue()
+        queue.push(b"world")
+        queue.push_front(b"hello ")
+        self.assertEqual(queue.pending_bytes, 11)
+        self.assertEqual(queue.take(), b"hello world")
+
+
+def fill(sock):
+    """Gửi tới khi buffer của socket đầy; trả về số byte đã gửi"""
+    total = 0
+    chunk = b"x" * 65536
+    while True:
+        sent = send_nonblocking(sock, chunk)
+        if not sent:
+            return total
+        total += sent
+
+
+class SendTest(unittest.TestCase):
+    def test_send_never_blocks(self):
+        for send in (send_nonblocking, _send_when_writable):
+            with self.subTest(send=send.__name__):
+                left, right = socket.socketpair()
+                with left, right:
+                    fill(left)
+                    started = time.monotonic()
+                    self.assertEqual(send(left, b"y" * 100000), 0)
+                    self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_writable_send_is_bounded(self):
+        left, right = socket.socketpair()
+        with left, right:
+            self.assertEqual(_send_when_writable(left, b"z" * (SEND_CHUNK * 3)), SEND_CHUNK)
+            left.close()
+            with self.assertRaises(OSError):
+                _send_when_writable(left, b"z")
+
+
+class PumpTest(unittest.TestCase):
+    def setUp(self):
+        self.overflowed = []
+        self.pump = OutboundPump(on_overflow=self.overflowed.append)
+        self.pump.start()
+        self.addCleanup(self.pump.stop)
+
+    def session(self, policy, max_pending):
+        left, right = socket.socketpair()
+        self.addCleanup(right.close)
+        session = PlayerSession(left, None, OutboundQueue(max_pending, policy))
+        self.addCleanup(left.close)
+        return session, right
+
+    def test_slow_reader_gets_everything_in_order(self):
+        session, peer = self.session(POLICY_DISCONNECT, 64 * 1024 * 1024)
+        buffered = fill(session.socket)
+        messages = [bytes([i]) * 50000 for i in range(1, 21)]
+        started = time.monotonic()
+        for data in messages:
+            self.pump.send(session, data)
+        # Thread gọi không bị chặn dù peer chưa đọc gì
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertTrue(session.outbound.registered)
+
+        expected = buffered + sum(len(data) for data in messages)
+        received = bytearray()
+        peer.settimeout(5)
+        while len(received) < expected:
+            received += peer.recv(1 << 20)
+        self.assertEqual(bytes(received[buffered:]), b"".join(messages))
+        self.assertEqual(self.overflowed, [])
+
+    def test_overflow_calls_back(self):
+        session, _ = self.session(POLICY_DISCONNECT, 1000)
+        fill(session.socket)
+        self.pump.send(session, b"a" * 800)
+        self.assertEqual(self.overflowed, [])
+        self.pump.send(session, b"b" * 800)
+        self.assertEqual(self.overflowed, [session])
+
+    def test_close_while_registered(self):
+        session, peer = self.session(POLICY_DISCONNECT, 1 << 20)
+        fill(session.socket)
+        self.pump.send(session, b"a" * 1000)
+        self.pump.close(session)
+
+        # Thread I/O hủy đăng ký rồi mới đóng socket
+        deadline = time.monotonic() + 5
+        while session.socket.fileno() != -1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(session.socket.fileno(), -1)
+        self.assertFalse(session.outbound.registered)
+        self.assertEqual(len(session.outbound), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
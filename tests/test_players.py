@@ -0,0 +1,106 @@
+"""Kiểm tra PlayerStore trả rating từ bộ nhớ (LRU có giới hạn), không truy vấn SQLite lúc CONNECT"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from matchmaking import DEFAULT_RATING
+from players import PlayerStore, RatingCache, elo_update
+
+
+class RatingCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'players.db')
+
+    def open_store(self, **options):
+        store = PlayerStore(self.path, **options)
+        store.open()
+        self.addCleanup(store.stop)
+        return store
+
+    def test_rating_without_database(self):
+        store = self.open_store()
+        store.game_over("alice", "bob")
+        store.commit()
+
+        winner, loser = elo_update(DEFAULT_RATING, DEFAULT_RATING)
+        # Đọc rating không được dùng tới kết nối database của thread nền
+        db, store.db = store.db, None
+        try:
+            self.assertEqual(store.rating("alice"), winner)
+            self.assertEqual(store.rating("bob"), loser)
+            self.assertEqual(store.rating("carol"), DEFAULT_RATING)
+        finally:
+            store.db = db
+
+    def test_miss_is_looked_up_by_store_thread(self):
+        other = self.open_store()
+        other.game_over("alice", "bob")
+        other.commit()
+
+        store = self.open_store()
+        loaded = []
+        self.assertEqual(store.rating("alice", loaded.append), DEFAULT_RATING)
+        self.assertEqual(store.rating("carol", loaded.append), DEFAULT_RATING)
+        store.load_lookups()
+        # Chỉ người đã có trong database mới gọi callback; cả 2 đều vào cache
+        self.assertEqual(loaded, [other.rating("alice")])
+        self.assertEqual(store.rating("alice"), other.rating("alice"))
+        self.assertEqual(store.rating("carol"), DEFAULT_RATING)
+        self.assertEqual(len(store.lookups), 0)
+
+    def test_sees_games_from_other_process(self):
+        store = self.open_store()
+        other = self.open_store()
+        store.rating("alice")
+        store.load_lookups()
+        other.game_over("alice", "bob")
+        other.commit()
+        self.assertEqual(store.rating("alice"), DEFAULT_RATING)
+
+        store.refresh_ratings()
+        self.assertEqual(store.rating("alice"), other.rating("alice"))
+        # Chỉ đọc lại người đang trong cache
+        self.assertEqual(len(store.ratings), 1)
+
+    def test_cache_is_bounded(self):
+        cache = RatingCache(capacity=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        # "b" lâu không dùng nhất nên bị bỏ
+        self.assertEqual(cache.names(), ["a", "c"])
+        cache.refresh("b", 5)
+        self.assertIsNone(cache.get("b"))
+
+    def test_failed_commit_keeps_games(self):
+        store = self.open_store()
+        store.game_over("alice", "bob")
+        store.game_over("carol", "dave")
+        # Process khác đang giữ lock ghi: BEGIN IMMEDIATE lỗi ngay (timeout=0)
+        db = store.db
+        store.db = sqlite3.connect(self.path, isolation_level=None, timeout=0)
+        blocker = sqlite3.connect(self.path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                store.commit()
+        finally:
+            blocker.execute("ROLLBACK")
+            blocker.close()
+            store.db.close()
+            store.db = db
+
+        self.assertEqual(list(store.pending), [("alice", "bob"), ("carol", "dave")])
+        store.commit()
+        winner, loser = elo_update(DEFAULT_RATING, DEFAULT_RATING)
+        self.assertEqual([store.rating(name) for name in ("alice", "bob", "carol")],
+                         [winner, loser, winner])
+        self.assertEqual(len(store.pending), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""Kiểm tra codec text / binary: mã hóa rồi giải mã lại mọi loại gói tin, và gói sai định dạng"""
+import unittest
+
+from protocol import (
+    BINARY_CODEC, MAX_REGION_LENGTH, MAX_SETUP_TEXT, SPECS, TEXT_CODEC, ProtocolError,
+    encode_connect, encode_leaderboard, encode_replay, encode_resume, encode_spectate,
+)
+
+FLEET = [
+    [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)],
+    [(9, 1), (9, 2), (9, 3), (9, 4)],
+    [(0, 2), (1, 2), (2, 2)],
+    [(0, 4), (1, 4), (2, 4)],
+    [(5, 9), (6, 9)],
+]
+BOARDS = (0, 1, 1 << 99, 0x2a, (1 << 100) - 1, 12345)
+
+# Mỗi lệnh ít nhất một gói mẫu; gói đầu tiên (CONNECT, RESUME, ...) có tham số codec
+# chỉ đi ở dạng text nên mẫu binary bỏ trống field đó
+SAMPLES = [
+    ("SETUP", FLEET),
+    ("SHOOT", (3, 5), 17),
+    ("SHOOT", (9, 9), None),
+    ("RESUME", "Xy3tok", None),
+    ("PING",),
+    ("PONG",),
+    ("SPECTATE", "12", None),
+    ("REPLAY", "@alice", None),
+    ("LEADERBOARD", 20, None),
+    ("LEADERBOARD", None, None),
+    ("WAITING", "Đang chờ đối thủ..."),
+    ("MATCH_FOUND", "bob"),
+    ("GAME_START", "YOUR_TURN"),
+    ("GAME_START", "WAIT"),
+    ("RESULT", "HIT", (3, 5)),
+    ("RESULT", "MISS", (0, 0)),
+    ("OPPONENT_SHOOT", "MISS", (9, 0)),
+    ("TURN", "YOUR_TURN"),
+    ("GAME_OVER", "LOSE"),
+    ("OPPONENT_DISCONNECTED", "Đối thủ đã ngắt kết nối"),
+    ("ERROR", "Lỗi: a|b"),
+    ("SUNK", [(3, 5), (4, 5)], "Tàu ngầm"),
+    ("OPPONENT_SUNK", [(7, 1), (7, 2), (7, 3)], "Tàu khu trục 1"),
+    ("SESSION", "Xy3tok"),
+    ("RESUMED", "YOUR_TURN") + BOARDS[:5] + ("bob",),
+    ("WATCHING", "2", "bob"),
+    ("WATCH", "WIN1") + BOARDS,
+    ("REPLAY_DATA", b"\x00\x01|\xff"),
+    ("REPLAY_END", "3"),
+    ("RANK", 1, 1016, 3, 0, "alice"),
+    ("LEADERBOARD_END", "1"),
+]
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_every_command_has_a_sample(self):
+        commands = {message[0] for message in SAMPLES} | {"CONNECT"}
+        self.assertEqual(commands, {spec.command for spec in SPECS})
+
+    def test_round_trip(self):
+        for codec in (TEXT_CODEC, BINARY_CODEC):
+            for message in SAMPLES:
+                with self.subTest(codec=codec.name, command=message[0]):
+                    command, fields = codec.decode(codec.encode(message))
+                    self.assertEqual((command,) + fields, message)
+
+    def test_first_packets_carry_codec(self):
+        self.assertEqual(TEXT_CODEC.decode(encode_connect("a|b", "binary")),
+                         ("CONNECT", ("a|b", "binary", None)))
+        self.assertEqual(TEXT_CODEC.decode(encode_connect("alice")),
+                         ("CONNECT", ("alice", "text", None)))
+        self.assertEqual(TEXT_CODEC.decode(encode_connect("a|b", "text", "eu")),
+                         ("CONNECT", ("a|b", "text", "eu")))
+        self.assertEqual(TEXT_CODEC.decode(b"CONNECT|alice|eu"), ("CONNECT", ("alice|eu", "text", None)))
+        self.assertEqual(TEXT_CODEC.decode(encode_resume("tok", "binary")),
+                         ("RESUME", ("tok", "binary")))
+        self.assertEqual(TEXT_CODEC.decode(encode_spectate(7, "binary")),
+                         ("SPECTATE", ("7", "binary")))
+        self.assertEqual(TEXT_CODEC.decode(encode_replay("@bob")), ("REPLAY", ("@bob", None)))
+        self.assertEqual(TEXT_CODEC.decode(encode_leaderboard(5, "binary")),
+                         ("LEADERBOARD", (5, "binary")))
+
+    def test_binary_is_compact(self):
+        self.assertEqual(len(BINARY_CODEC.encode(("SHOOT", (3, 5), 17))), 6)
+        self.assertEqual(len(BINARY_CODEC.encode(("SETUP", FLEET))), 1 + 2 * len(FLEET))
+
+
+class MalformedTest(unittest.TestCase):
+    def assertRejected(self, codec, payload):
+        with self.assertRaises(ProtocolError, msg=payload):
+            codec.decode(payload)
+
+    def test_text(self):
+        for payload in (
+            b"", b"NOPE|1", b"\xff\xfe", b"SHOOT", b"SHOOT|10,0", b"SHOOT|a,b", b"SHOOT|1",
+            b"SHOOT|1,1|-1", b"SHOOT|1,1|4294967296", "SHOOT|1,1|²".encode('utf-8'),
+            b"GAME_START", b"GAME_START|LATER", b"RESULT|BOOM|1,1", b"PING|x",
+            b"SETUP|[[0,0]", b"SETUP|[[[0,0]]]x", b"SETUP|{\"a\": 1}", b"SETUP|[1, 2]",
+            b"SETUP|[[[0,10]]]", b"SETUP|[" + b"[[0,0]]," * MAX_SETUP_TEXT + b"[[0,0]]]",
+            b"SUNK|[[0,0]]", b"RESUMED|SETUP|zz|0|0|0|0|bob",
+            b"RESUMED|SETUP|1" + b"0" * 25 + b"|0|0|0|0|bob", b"REPLAY_DATA|0g",
+            b"CONNECT|alice|text|" + b"r" * (MAX_REGION_LENGTH + 1),
+        ):
+            with self.subTest(payload=payload):
+                self.assertRejected(TEXT_CODEC, payload)
+
+    def test_binary(self):
+        for payload in (
+            b"", b"\xff", b"\x03", b"\x03\x64", b"\x03\x00\x00\x01", b"\x03\x00\x00\x00\x00\x01\x00",
+            b"\x05\x00", b"\x12\x02", b"\x13\x00", b"\x02\x00", b"\x02\x00\x00", b"\x02\x64\x02",
+            b"\x02\x09\x02", b"\x02\x5a\x82", b"\x10\xff", b"\x1c\x00" + b"\x00" * 12,
+            b"\x1c\x00" + b"\xff" * 13 + b"\x00" * 52,
+        ):
+            with self.subTest(payload=payload):
+                self.assertRejected(BINARY_CODEC, payload)
+
+    def test_encode_rejects_unknown_command(self):
+        for codec in (TEXT_CODEC, BINARY_CODEC):
+            with self.assertRaises(ProtocolError):
+                codec.encode(("NOPE",))
+
+
+if __name__ == '__main__':
+    unittest.main()
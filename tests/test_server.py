@@ -0,0 +1,63 @@
+"""Kiểm tra xử lý gói tin đầu tiên của server: CONNECT lặp lại, SPECTATE / REPLAY với id không hợp lệ"""
+import tempfile
+import unittest
+
+from server import BattleshipServer
+from session import PlayerSession
+
+
+class RecordingServer(BattleshipServer):
+    """Ghi lại gói tin gửi đi thay vì đưa vào socket"""
+
+    def __init__(self, **options):
+        super().__init__(port=0, heartbeat_interval=0, **options)
+        self.sent = []
+
+    def send_messages(self, session, messages, key=None):
+        self.sent.extend(messages)
+
+
+class FirstPacketTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.server = RecordingServer(replay_dir=directory.name)
+        self.addCleanup(self.server.close_replays)
+        self.session = PlayerSession(None, ("test", 0))
+
+    def send(self, payload):
+        self.server.process_message(self.session, payload)
+        sent, self.server.sent = self.server.sent, []
+        return sent
+
+    def test_repeat_connect_rejected(self):
+        sent = self.send(b"CONNECT|alice")
+        self.assertEqual([message[0] for message in sent], ["SESSION", "WAITING"])
+        token = self.session.token
+
+        self.assertEqual(self.send(b"CONNECT|mallory|binary"), [("ERROR", "Đã kết nối rồi")])
+        # Token cũ vẫn là token duy nhất, người chơi chỉ nằm trong hàng đợi một lần
+        self.assertEqual(self.session.token, token)
+        self.assertEqual(list(self.server.tokens.sessions), [token])
+        self.assertEqual(self.session.username, "alice")
+        self.assertEqual(len(self.server.waiting_players), 1)
+
+    def test_spectate_non_ascii_digits(self):
+        self.server.rooms.create_room(None, "a", None, "b")
+        for room_id in ("²", "١", "1²", "", "-1"):
+            with self.subTest(room_id=room_id):
+                self.assertEqual(self.send(f"SPECTATE|{room_id}".encode('utf-8')),
+                                 [("ERROR", "Phòng không tồn tại")])
+        self.assertEqual(self.send(b"SPECTATE|1")[0], ("WATCHING", "1", "a"))
+
+    def test_replay_non_ascii_digits(self):
+        # Không phải số ASCII thì tìm theo tên người chơi
+        for query in ("²", "١٢"):
+            with self.subTest(query=query):
+                self.assertEqual(self.send(f"REPLAY|{query}".encode('utf-8')),
+                                 [("REPLAY_END", "0")])
+        self.assertEqual(self.send(b"REPLAY|" + b"9" * 40), [("REPLAY_END", "0")])
+
+
+if __name__ == '__main__':
+    unittest.main()
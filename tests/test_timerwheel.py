@@ -0,0 +1,100 @@
+"""Kiểm tra TimerWheel: chạy đúng tick, hủy timer, timer dài hơn một vòng bánh xe"""
+import unittest
+
+from timerwheel import TimerWheel
+
+TICK = 1.0
+SIZE = 8
+
+
+class TimerWheelTest(unittest.TestCase):
+    def setUp(self):
+        self.wheel = TimerWheel(tick=TICK, size=SIZE, now=0.0)
+        self.fired = []
+
+    def callback(self, timer, name):
+        self.fired.append(name)
+
+    def schedule(self, delay, name):
+        return self.wheel.schedule(delay, self.callback, name, now=0.0)
+
+    def advance_to(self, now):
+        return self.wheel.advance(now=now)
+
+    def test_fires_not_before_delay(self):
+        self.schedule(2.5, "a")
+        self.assertEqual(self.advance_to(2.9), 0)
+        self.assertEqual(self.fired, [])
+        self.assertEqual(self.advance_to(3.0), 1)
+        self.assertEqual(self.fired, ["a"])
+        # Chỉ chạy một lần
+        self.assertEqual(self.advance_to(50.0), 0)
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_callback_receives_timer_and_args(self):
+        calls = []
+        timer = self.wheel.schedule(1.0, lambda t, *args: calls.append((t, args)), 1, "x", now=0.0)
+        self.advance_to(1.0)
+        self.assertEqual(calls, [(timer, (1, "x"))])
+
+    def test_cancel(self):
+        keep = self.schedule(3.0, "keep")
+        drop = self.schedule(3.0, "drop")
+        self.wheel.cancel(drop)
+        self.wheel.cancel(drop)
+        self.assertEqual(len(self.wheel), 1)
+        self.advance_to(10.0)
+        self.assertEqual(self.fired, ["keep"])
+        # Hủy timer đã chạy thì không làm gì
+        self.wheel.cancel(keep)
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_timers_across_rotations(self):
+        # Cùng ô (tick 3, 3 + SIZE, 3 + 2 * SIZE, ...) nhưng khác vòng
+        for rotation in range(4):
+            self.schedule(3.0 + rotation * SIZE * TICK, rotation)
+        dropped = self.wheel.schedule(3.0 + 3 * SIZE * TICK, self.callback, "dropped", now=0.0)
+        self.wheel.cancel(dropped)
+
+        self.advance_to(3.0)
+        self.assertEqual(self.fired, [0])
+        self.advance_to(2.0 + SIZE * TICK)
+        self.assertEqual(self.fired, [0])
+        # Mỗi vòng quay qua ô chỉ chạy timer của đúng vòng đó
+        self.advance_to(3.0 + SIZE * TICK)
+        self.assertEqual(self.fired, [0, 1])
+        self.assertEqual(len(self.wheel), 2)
+        self.advance_to(3.0 + 3 * SIZE * TICK)
+        self.assertEqual(self.fired, [0, 1, 2, 3])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_large_jump_fires_in_order_of_slots(self):
+        for i in range(1, 30):
+            self.schedule(i * TICK, i)
+        self.assertEqual(self.advance_to(100.0), 29)
+        self.assertEqual(self.fired, list(range(1, 30)))
+
+    def test_reschedule_from_callback(self):
+        def again(timer, count):
+            self.fired.append(count)
+            if count < 3:
+                self.wheel.schedule(TICK, again, count + 1, now=(count + 1) * TICK)
+
+        self.wheel.schedule(TICK, again, 1, now=0.0)
+        for step in range(1, 10):
+            self.advance_to(step * TICK)
+        self.assertEqual(self.fired, [1, 2, 3])
+
+    def test_failing_callback_does_not_stop_others(self):
+        def boom(timer):
+            raise RuntimeError("boom")
+
+        self.wheel.schedule(1.0, boom, now=0.0)
+        self.schedule(1.0, "after")
+        with self.assertLogs('battleship', level='ERROR'):
+            self.advance_to(2.0)
+        self.assertEqual(self.fired, ["after"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""Kiểm tra chế độ nhiều worker: id phòng không trùng giữa các worker, SPECTATE chuyển sang worker chủ phòng"""
+import socket
+import threading
+import unittest
+
+from framing import ExactFrameReader, FrameReader, encode_frame
+from outbound import OutboundPump
+from protocol import TEXT_CODEC
+from registry import RoomRegistry
+
+try:
+    from workers import MatchBroker, WorkerServer, recv_handoff
+except ImportError:   # không có socket.send_fds
+    WorkerServer = None
+
+TIMEOUT = 5
+
+
+class RoomIdTest(unittest.TestCase):
+    def test_ids_are_striped(self):
+        rooms = RoomRegistry(first_id=2, id_step=3)
+        ids = [rooms.create_room(None, "a", None, "b").room_id for _ in range(3)]
+        self.assertEqual(ids, [2, 5, 8])
+        # Khôi phục từ journal / kho replay: id kế tiếp vẫn thuộc dãy của worker
+        rooms.advance_ids(20)
+        self.assertEqual(rooms.create_room(None, "a", None, "b").room_id, 23)
+        rooms.advance_ids(4)
+        self.assertEqual(rooms.create_room(None, "a", None, "b").room_id, 26)
+
+    def test_striped_ids_spread_over_shards(self):
+        rooms = RoomRegistry(shard_count=4, first_id=2, id_step=4)
+        shards = {id(rooms.shard_for(rooms.create_room(None, "a", None, "b").room_id))
+                  for _ in range(4)}
+        self.assertEqual(len(shards), 4)
+
+
+@unittest.skipIf(WorkerServer is None or not hasattr(socket, 'AF_UNIX'), "cần socket.send_fds")
+class SpectateRoutingTest(unittest.TestCase):
+    def setUp(self):
+        # Broker thật trong process này; test tự nhận gói từ kênh của worker
+        # (không chạy receive_matches: broker đóng kênh sẽ gửi SIGINT)
+        self.workers = []
+        broker_ends = []
+        for worker_id in range(2):
+            broker_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            self.addCleanup(broker_end.close)
+            self.addCleanup(worker_end.close)
+            broker_ends.append(broker_end)
+            worker = WorkerServer(worker_end, None, worker_id, 2, port=0,
+                                  heartbeat_interval=0, turn_timeout=0)
+            worker.outbound = OutboundPump(on_overflow=worker.drop_slow_client)
+            worker.outbound.start()
+            self.addCleanup(worker.outbound.stop)
+            self.workers.append(worker)
+        self.broker = MatchBroker(broker_ends)
+        self.broker.start()
+        self.addCleanup(self.broker.stop)
+
+    def client(self, worker):
+        sock, server_side = socket.socketpair()
+        sock.settimeout(TIMEOUT)
+        self.addCleanup(sock.close)
+        threading.Thread(target=worker.handle_client, args=(server_side, ("viewer", 0)),
+                         daemon=True).start()
+        return sock
+
+    def send(self, sock, *message):
+        sock.sendall(encode_frame(TEXT_CODEC.encode(message)))
+
+    def receive(self, sock, count):
+        reader = FrameReader()
+        messages = []
+        while len(messages) < count:
+            frames = reader.read_from(sock)
+            self.assertIsNotNone(frames, "kết nối đóng")
+            messages += [TEXT_CODEC.decode(frame) for frame in frames]
+        return messages
+
+    def test_spectate_routed_to_owner(self):
+        owner = self.workers[1]
+        room = owner.rooms.create_room(None, "alice", None, "bob")
+        self.assertEqual(room.room_id, 2)
+
+        viewer = self.client(self.workers[0])
+        self.send(viewer, "SPECTATE", str(room.room_id))
+        owner.channel.settimeout(TIMEOUT)
+        message, sockets = recv_handoff(owner.channel)
+        self.assertEqual((message['op'], message['command']), ('adopt', "SPECTATE"))
+
+        owner.adopt_connection(message, sockets[0])
+        watching = self.receive(viewer, 2)
+        self.assertEqual(watching[0], ("WATCHING", ("1", "alice")))
+        self.assertEqual(watching[1], ("WATCHING", ("2", "bob")))
+        # Kết nối đã ở đúng worker: đọc bình thường, không chuyển tiếp lần nữa
+        session = next(iter(room.spectators))
+        self.assertNotIsInstance(session.reader, ExactFrameReader)
+
+    def test_own_room_stays_local(self):
+        worker = self.workers[0]
+        room = worker.rooms.create_room(None, "alice", None, "bob")
+        self.assertEqual(room.room_id, 1)
+        viewer = self.client(worker)
+        self.send(viewer, "SPECTATE", "1")
+        self.assertEqual(self.receive(viewer, 1)[0], ("WATCHING", ("1", "alice")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Timer Wheel - Bánh xe hẹn giờ (hashed timing wheel) cho heartbeat và timeout
+
+Thời gian được chia thành các tick (vd: 0.1 giây); bánh xe có `size` ô, timer
+hết hạn ở tick t nằm trong ô t % size. Mỗi tick chỉ xét một ô:
+- Đặt / hủy timer: O(1) (thêm / bỏ khỏi một set)
+- Mỗi tick: chỉ chạm tới các timer trong ô hiện tại, không phụ thuộc tổng số
+  timer (miễn là timeout không dài hơn size * tick; timer dài hơn phải chờ
+  thêm vòng và bị xét lại mỗi vòng)
+Callback được gọi ngoài lock của bánh xe, trên thread (hoặc event loop) gọi advance().
+"""
+import math
+import threading
+import time
+
+from serverlog import log
+
+# Độ phân giải (giây) và số ô mặc định: tầm nhìn 0.1 * 1024 ~ 100 giây
+DEFAULT_TICK = 0.1
+DEFAULT_WHEEL_SIZE = 1024
+
+
+class Timer:
+    """Một timer đã đặt; callback(timer, *args) được gọi khi hết hạn"""
+    __slots__ = ('tick', 'callback', 'args', 'cancelled')
+
+    def __init__(self, tick, callback, args):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class TimerWheel:
+    """Bánh xe hẹn giờ; an toàn khi đặt / hủy timer từ nhiều thread"""
+
+    def __init__(self, tick=DEFAULT_TICK, size=DEFAULT_WHEEL_SIZE, now=None):
+        self.tick = tick
+        self.slots = [set() for _ in range(size)]
+        self.started = time.monotonic() if now is None else now
+        # Tick đã xử lý xong gần nhất
+        self.current = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, delay, callback, *args, now=None):
+        """Gọi callback(timer, *args) sau ít nhất delay giây; trả về Timer (để hủy)"""
+        if now is None:
+            now = time.monotonic()
+        # Làm tròn lên: timer không bao giờ chạy sớm hơn delay
+        tick = math.ceil((now - self.started + delay) / self.tick)
+        with self.lock:
+            tick = max(tick, self.current + 1)
+            timer = Timer(tick, callback, args)
+            self.slots[tick % len(self.slots)].add(timer)
+            self.count += 1
+        return timer
+
+    def cancel(self, timer):
+        """Hủy timer (không làm gì nếu timer đã chạy hoặc đã hủy)"""
+        with self.lock:
+            if timer.cancelled:
+                return
+            timer.cancelled = True
+            slot = self.slots[timer.tick % len(self.slots)]
+            if timer in slot:
+                slot.remove(timer)
+                self.count -= 1
+
+    def advance(self, now=None):
+        """
+        Xử lý mọi tick đã qua tính tới now, gọi callback của các timer hết hạn
+        Trả về: số timer đã chạy
+        """
+        if now is None:
+            now = time.monotonic()
+        target = int((now - self.started) / self.tick)
+
+        expired = []
+        with self.lock:
+            slots = self.slots
+            size = len(slots)
+            while self.current < target:
+                self.current += 1
+                tick = self.current
+                slot = slots[tick % size]
+                if not slot:
+                    continue
+                due = [timer for timer in slot if timer.tick <= tick]
+                for timer in due:
+                    slot.remove(timer)
+                    # Đánh dấu để cancel() sau này không làm gì
+                    timer.cancelled = True
+                self.count -= len(due)
+                expired.extend(due)
+
+        for timer in expired:
+            try:
+                timer.callback(timer, *timer.args)
+            except Exception as e:
+                log.exception("Lỗi trong timer %s: %s", timer.callback.__name__, e)
+        return len(expired)
+
+
+class TimerTicker(threading.Thread):
+    """Thread nền quay bánh xe mỗi tick (chế độ thread)"""
+
+    def __init__(self, wheel):
+        super().__init__(name="TimerTicker", daemon=True)
+        self.wheel = wheel
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.wheel.tick):
+            self.wheel.advance()
+
+    def stop(self):
+        self.stopped.set()
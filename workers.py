@@ -0,0 +1,482 @@
+"""
+Workers - Chế độ nhiều process (server.py --workers N)
+
+Một process Python chỉ chạy logic game trên một core (GIL), nên chế độ này
+chạy N process worker cùng nhận kết nối trên một cổng:
+- Mỗi worker là một BattleshipServer (thread) với socket lắng nghe riêng mở
+  bằng SO_REUSEPORT; kernel chia đều kết nối mới cho các worker. Nếu hệ điều
+  hành không có SO_REUSEPORT, process chính mở sẵn một socket lắng nghe trước
+  khi fork và mọi worker cùng accept trên socket đó.
+- Sau CONNECT, worker chuyển socket của người chơi (kèm tên, codec) sang
+  MatchBroker trong process chính qua kênh Unix (SCM_RIGHTS). Worker đọc kết
+  nối mới đúng từng gói một, nên gói client gửi ngay sau CONNECT vẫn nằm
+  nguyên trong socket.
+- Trong lúc chờ, broker trả lời PING, đo độ trễ qua PONG (ghép theo lô) và bỏ
+  qua các gói khác; phần gói đọc dở được gửi kèm cặp sang worker.
+- MatchBroker ghép cặp bằng MatchQueue / Matchmaker như server một process,
+  rồi chuyển cả 2 socket cho một worker (xoay vòng); worker đó tạo phòng và
+  phục vụ cả ván, không cần trao đổi gì thêm giữa các process.
+- Worker i (trong N worker) cấp id phòng i + 1, i + 1 + N, ... nên id không
+  trùng giữa các worker và suy ra được worker chủ phòng. SPECTATE / REPLAY
+  theo id của phòng worker khác: socket đi qua broker sang worker chủ.
+- Kết nối đã tới worker cuối cùng (nhận cặp / SPECTATE / REPLAY từ broker)
+  đọc bằng FrameReader thường, không còn đọc từng gói một.
+Chỉ chạy trên Linux / Unix (fork, socket.send_fds).
+"""
+import json
+import multiprocessing
+import os
+import selectors
+import signal
+import socket
+import threading
+import time
+
+from framing import ExactFrameReader, FrameError, encode_frame, encode_frames
+from matchmaking import MatchQueue, Matchmaker, STRATEGIES, DEFAULT_TICK_INTERVAL
+from protocol import ProtocolError, TEXT_CODEC, get_codec, parse_number
+from server import BattleshipServer
+from session import PlayerSession, describe_player, mark_ping, record_pong, restore_player
+from serverlog import log, fields as log_fields, setup_logging
+
+# Kênh broker <-> worker là SOCK_SEQPACKET: mỗi gói JSON đi kèm fd của nó
+MAX_HANDOFF_SIZE = 64 * 1024
+HAS_REUSEPORT = hasattr(socket, 'SO_REUSEPORT')
+
+
+def send_handoff(channel, message, sockets):
+    """Gửi một gói JSON kèm fd của các socket qua kênh Unix"""
+    payload = json.dumps(message).encode('utf-8')
+    socket.send_fds(channel, [payload], [sock.fileno() for sock in sockets])
+
+
+def recv_handoff(channel, max_sockets=2):
+    """
+    Nhận một gói từ kênh Unix
+    Trả về: (message, [socket, ...]), hoặc None nếu đầu bên kia đã đóng
+    """
+    payload, fds, _, _ = socket.recv_fds(channel, MAX_HANDOFF_SIZE, max_sockets)
+    if not payload:
+        for fd in fds:
+            os.close(fd)
+        return None
+    return json.loads(payload), [socket.socket(fileno=fd) for fd in fds]
+
+
+# ==================== Broker (process chính) ====================
+
+class MatchBroker(threading.Thread):
+    """
+    Thread ghép cặp chung cho mọi worker (chạy trong process chính)
+    Giữ socket của người chơi đang chờ; một thread duy nhất đọc các kênh
+    worker, theo dõi người chờ ngắt kết nối và chạy Matchmaker.tick()
+    """
+
+    def __init__(self, channels, matchmaking='instant', match_tick=DEFAULT_TICK_INTERVAL):
+        super().__init__(name="MatchBroker", daemon=True)
+        self.channels = list(channels)   # đầu phía broker của kênh tới từng worker
+        self.live = set(range(len(self.channels)))
+        self.next_worker = 0
+
+        if matchmaking == 'instant':
+            self.waiting = MatchQueue()
+            self.matchmaker = None
+        else:
+            self.waiting = None
+            self.matchmaker = Matchmaker(STRATEGIES[matchmaking](), on_match=self.hand_over)
+        self.match_tick = match_tick
+
+        self.selector = selectors.DefaultSelector()
+        self.stopped = threading.Event()
+
+    def run(self):
+        for index, channel in enumerate(self.channels):
+            self.selector.register(channel, selectors.EVENT_READ, index)
+
+        timeout = self.match_tick if self.matchmaker is not None else 1.0
+        next_tick = time.monotonic() + self.match_tick
+        while not self.stopped.is_set() and self.live:
+            for key, _ in self.selector.select(timeout):
+                try:
+                    if isinstance(key.data, int):
+                        self._receive(key.data)
+                    else:
+                        self._check_waiting(key.data)
+                except Exception as e:
+                    log.exception("Lỗi trong broker: %s", e)
+
+            if self.matchmaker is not None and time.monotonic() >= next_tick:
+                next_tick = time.monotonic() + self.match_tick
+                try:
+                    self.matchmaker.tick()
+                except Exception as e:
+                    log.exception("Lỗi khi ghép cặp: %s", e)
+
+    def _receive(self, index):
+        """Gói tin từ worker: một người chơi mới cần ghép cặp, hoặc kết nối chuyển sang worker khác"""
+        channel = self.channels[index]
+        try:
+            received = recv_handoff(channel, 1)
+        except OSError:
+            received = None
+        if received is None:
+            log.warning("Worker %d đã dừng", index)
+            self.live.discard(index)
+            self.selector.unregister(channel)
+            return
+
+        message, sockets = received
+        if message.get('op') == 'route' and len(sockets) == 1:
+            self.route(message, sockets[0])
+            return
+        if message.get('op') != 'enqueue' or len(sockets) != 1:
+            for sock in sockets:
+                sock.close()
+            return
+
+        info = message['player']
+        address = tuple(info['address']) if info['address'] else None
+        session = PlayerSession(sockets[0], address)
+        restore_player(session, info)
+        # Theo dõi socket để trả lời PING và biết người chờ ngắt kết nối
+        session.socket.setblocking(False)
+        self.selector.register(session.socket, selectors.EVENT_READ, session)
+
+        if self.matchmaker is not None:
+            # Đo độ trễ cho chiến lược region: PONG về trong lúc chờ
+            mark_ping(session)
+            self._send_waiting(session, ("PING",))
+            self.matchmaker.enqueue(session)
+            return
+        opponent = self.waiting.pair_or_push(session)
+        if opponent is not None:
+            self.hand_over(opponent, session)
+
+    def route(self, message, sock):
+        """Chuyển một kết nối (SPECTATE / REPLAY) sang worker chủ phòng"""
+        target = message['worker']
+        try:
+            if target in self.live:
+                send_handoff(self.channels[target], dict(message, op='adopt'), [sock])
+        except OSError as e:
+            log.warning("Không gửi được cho worker %d: %s", target, e)
+        finally:
+            sock.close()
+
+    def _check_waiting(self, session):
+        """Socket của người đang chờ đọc được: đọc hết gói tin; EOF / lỗi = ngắt kết nối"""
+        try:
+            frames = session.reader.read_from(session.socket)
+        except BlockingIOError:
+            return
+        except (OSError, FrameError):
+            frames = None
+        if frames is not None:
+            for frame in frames:
+                self._answer_waiting(session, frame)
+            return
+
+        self._unregister(session.socket)
+        session.closed = True
+        if self.matchmaker is not None:
+            self.matchmaker.cancel(session)
+        else:
+            self.waiting.cancel(session)
+        session.socket.close()
+        log.info("Player %s ngắt kết nối khi đang chờ", session.username)
+
+    def _answer_waiting(self, session, frame):
+        """
+        Gói tin của người đang chờ: trả lời PING (heartbeat của client), PONG
+        cập nhật độ trễ, bỏ qua gói khác
+        """
+        try:
+            command, _ = session.codec.decode(frame)
+        except ProtocolError:
+            return
+        if command == "PING":
+            self._send_waiting(session, ("PONG",))
+        elif command == "PONG":
+            record_pong(session)
+
+    def _send_waiting(self, session, message):
+        """Gửi một gói nhỏ cho người đang chờ (socket không chặn; buffer đầy thì bỏ)"""
+        try:
+            session.socket.send(encode_frame(session.codec.encode(message)))
+        except OSError:
+            pass
+
+    def hand_over(self, player1, player2):
+        """Chuyển cả 2 socket cho một worker; worker đó tạo phòng và phục vụ cả ván"""
+        sockets = [player1.socket, player2.socket]
+        for sock in sockets:
+            self._unregister(sock)
+        players = []
+        for session in (player1, player2):
+            info = describe_player(session)
+            # Phần gói tin broker đã đọc dở: worker đọc tiếp từ đó
+            info['pending'] = session.reader.buffer.hex()
+            players.append(info)
+        message = {'op': 'match', 'players': players}
+
+        try:
+            while self.live:
+                index = self.next_worker % len(self.channels)
+                self.next_worker += 1
+                if index not in self.live:
+                    continue
+                try:
+                    send_handoff(self.channels[index], message, sockets)
+                except OSError as e:
+                    log.warning("Không gửi được cho worker %d: %s", index, e)
+                    self.live.discard(index)
+                    continue
+                log.info("Ghép cặp: %s vs %s -> worker %d",
+                         player1.username, player2.username, index)
+                return
+            log.error("Không còn worker nào, hủy cặp %s vs %s",
+                      player1.username, player2.username)
+        finally:
+            # Worker đã có bản sao của fd
+            for sock in sockets:
+                sock.close()
+
+    def _unregister(self, sock):
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def stop(self):
+        self.stopped.set()
+
+
+# ==================== Worker ====================
+
+class WorkerServer(BattleshipServer):
+    """
+    BattleshipServer chạy trong một process worker
+    CONNECT: chuyển socket sang broker thay vì ghép cặp tại chỗ
+    SPECTATE / REPLAY phòng của worker khác: chuyển socket qua broker sang worker đó
+    Nhận cặp từ broker: tạo session cho 2 socket và mở phòng như start_match
+    """
+
+    def __init__(self, channel, listener=None, worker_id=0, worker_count=1, **options):
+        # Ghép cặp do broker làm; worker chỉ dùng chế độ instant (không có ticker)
+        options['matchmaking'] = 'instant'
+        # Id phòng của worker i: i + 1, i + 1 + worker_count, ... (không trùng giữa các worker)
+        options['room_id_first'] = worker_id + 1
+        options['room_id_step'] = worker_count
+        # Mỗi worker một journal và kho replay riêng; kho người chơi (players_db)
+        # thì dùng chung một file cho mọi worker
+        if options.get('journal_dir'):
+            options['journal_dir'] = os.path.join(options['journal_dir'], f"worker-{worker_id}")
+        if options.get('replay_dir'):
+            options['replay_dir'] = os.path.join(options['replay_dir'], f"worker-{worker_id}")
+        super().__init__(**options)
+        self.channel = channel
+        self.listener = listener
+        self.worker_id = worker_id
+        self.worker_count = worker_count
+
+    def open_listener(self):
+        if self.listener is not None:
+            # Socket chung đã mở sẵn trước khi fork
+            return self.listener
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen(128)
+        return server_socket
+
+    def start(self):
+        # Khôi phục phòng trước khi nhận cặp mới từ broker (id phòng không trùng)
+        self.start_journal()
+        threading.Thread(target=self.receive_matches, name="BrokerLink", daemon=True).start()
+        log.info("Worker %d (pid %d) sẵn sàng", self.worker_id, os.getpid())
+        super().start()
+
+    def handle_client(self, client_socket, address, session=None):
+        if session is None:
+            # Kết nối mới: đọc đúng từng gói, để sau CONNECT mọi byte client
+            # gửi tiếp vẫn nằm trong socket khi chuyển sang broker
+            session = self.new_session(client_socket, address)
+            session.reader = ExactFrameReader()
+        super().handle_client(client_socket, address, session)
+
+    def handle_spectate(self, session, room_id, codec_name=None):
+        if not self.route_to_owner(session, "SPECTATE", room_id, codec_name):
+            super().handle_spectate(session, room_id, codec_name)
+
+    def handle_replay(self, session, query, codec_name=None):
+        # REPLAY theo tên người chơi chỉ tìm trong kho replay của worker này
+        if not self.route_to_owner(session, "REPLAY", query, codec_name):
+            super().handle_replay(session, query, codec_name)
+
+    def route_to_owner(self, session, command, room_id, codec_name):
+        """
+        Phòng room_id thuộc worker khác: chuyển socket qua broker sang worker đó
+        Kết nối broker đã chuyển sang (FrameReader thường) thì không chuyển tiếp
+        Trả về: True nếu đã chuyển
+        """
+        number = parse_number(room_id)
+        if number is None or session.username or not isinstance(session.reader, ExactFrameReader):
+            return False
+        owner = (number - 1) % self.worker_count
+        if owner == self.worker_id:
+            return False
+        message = {'op': 'route', 'worker': owner, 'address': session.address,
+                   'command': command, 'fields': [room_id, codec_name]}
+        send_handoff(self.channel, message, [session.socket])
+        # handle_client dừng đọc, disconnect_client đóng bản sao socket của worker
+        session.closed = True
+        return True
+
+    def handle_connect(self, session, username, codec_name=TEXT_CODEC.name, region=None):
+        """Gửi WAITING rồi chuyển socket sang broker; thread đọc của worker dừng lại"""
+        if session.username:
+            # CONNECT lặp lại: không cấp token mới, không xếp hàng lần hai
+            self.send_message(session, "ERROR", "Đã kết nối rồi")
+            return
+        session.username = username
+        session.codec = get_codec(codec_name)
+        session.region = region or ""
+        # Rating đi kèm describe_player để broker ghép cặp theo rating
+        self.load_rating(session)
+        log.info("Player %s đang chờ ghép cặp...", username)
+
+        # Gửi thẳng xuống socket (không qua hàng đợi) để WAITING đi trước khi chuyển socket
+        waiting = self.encode_messages(session, [("WAITING", "Đang chờ đối thủ...")])
+        session.socket.sendall(encode_frames(waiting))
+        send_handoff(self.channel, {'op': 'enqueue', 'player': describe_player(session)},
+                     [session.socket])
+        # handle_client dừng đọc, disconnect_client đóng bản sao socket của worker
+        session.closed = True
+
+    def receive_matches(self):
+        """
+        Thread nhận các cặp (và kết nối SPECTATE / REPLAY) broker gửi sang;
+        broker đóng kênh thì dừng worker
+        """
+        while True:
+            try:
+                received = recv_handoff(self.channel)
+            except OSError:
+                received = None
+            if received is None:
+                log.info("Broker đã đóng kênh, dừng worker %d", self.worker_id)
+                # Dừng như Ctrl+C: start() nhận KeyboardInterrupt và dọn dẹp
+                signal.raise_signal(signal.SIGINT)
+                return
+            message, sockets = received
+            try:
+                if message.get('op') == 'adopt':
+                    self.adopt_connection(message, sockets[0])
+                else:
+                    self.adopt_match(message['players'], sockets)
+            except Exception as e:
+                log.exception("Lỗi khi nhận kết nối từ broker: %s", e)
+                for sock in sockets:
+                    sock.close()
+
+    def adopt_match(self, players, sockets):
+        """Tạo session cho 2 socket nhận từ broker và bắt đầu ván"""
+        sessions = []
+        for info, sock in zip(players, sockets):
+            sock.setblocking(True)
+            address = tuple(info['address']) if info['address'] else None
+            session = self.new_session(sock, address)
+            restore_player(session, info)
+            session.reader.feed(bytes.fromhex(info.get('pending', '')))
+            sessions.append(session)
+
+        # Gắn phòng trước khi mở thread đọc: gói SETUP luôn thấy session.room
+        room = self.start_match(*sessions)
+        if room is not None:
+            log.info("Worker %d nhận phòng", self.worker_id, extra=log_fields(room_id=room.room_id))
+        for session in sessions:
+            threading.Thread(
+                target=self.handle_client, args=(session.socket, session.address, session),
+                daemon=True,
+            ).start()
+
+
+    def adopt_connection(self, message, sock):
+        """Kết nối SPECTATE / REPLAY worker khác chuyển sang: xử lý gói đầu tiên rồi đọc tiếp"""
+        sock.setblocking(True)
+        address = tuple(message['address']) if message['address'] else None
+        # FrameReader thường: kết nối đã ở đúng worker
+        session = self.new_session(sock, address)
+        self.dispatch(session, message['command'], tuple(message['fields']))
+        threading.Thread(
+            target=self.handle_client, args=(sock, address, session), daemon=True,
+        ).start()
+
+
+def worker_main(worker_id, channel, listener, options, log_options, inherited=(), worker_count=1):
+    """Hàm chạy trong process worker"""
+    # Đóng các fd thừa hưởng từ process chính (kênh của các worker khác)
+    for sock in inherited:
+        sock.close()
+    log_listener = setup_logging(**log_options)
+    server = WorkerServer(channel, listener, worker_id, worker_count, **options)
+    try:
+        server.start()
+    finally:
+        log_listener.stop()
+
+
+def run_workers(count, options, log_options):
+    """
+    Chạy broker (thread trong process này) và count process worker
+    options: tham số của BattleshipServer; matchmaking / match_tick dùng cho broker
+    """
+    context = multiprocessing.get_context('fork')
+    worker_options = dict(options)
+    matchmaking = worker_options.pop('matchmaking', 'instant')
+    match_tick = worker_options.pop('match_tick', DEFAULT_TICK_INTERVAL)
+    metrics_port = worker_options.pop('metrics_port', 0)
+
+    listener = None
+    if not HAS_REUSEPORT:
+        listener = BattleshipServer(options['host'], options['port']).open_listener()
+
+    channels = []
+    processes = []
+    for worker_id in range(count):
+        broker_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        # Mỗi worker một cổng /metrics riêng: metrics_port, metrics_port + 1, ...
+        process = context.Process(
+            target=worker_main, name=f"worker-{worker_id}",
+            args=(worker_id, worker_end, listener,
+                  dict(worker_options, metrics_port=metrics_port + worker_id if metrics_port else 0),
+                  log_options, channels + [broker_end], count),
+        )
+        process.start()
+        worker_end.close()
+        channels.append(broker_end)
+        processes.append(process)
+
+    # kill / systemd stop: tắt như Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    log.info("Đã khởi động %d worker trên %s:%s (%s)", count, options['host'], options['port'],
+             "SO_REUSEPORT" if listener is None else "socket chung")
+    broker = MatchBroker(channels, matchmaking, match_tick)
+    broker.start()
+    try:
+        # Chạy đến khi mọi worker dừng (hoặc Ctrl+C)
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        log.info("Đang tắt server...")
+    finally:
+        # Đóng kênh: worker nhận EOF và tự dừng
+        broker.stop()
+        for channel in channels:
+            channel.close()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join()